@@ -0,0 +1,147 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+from src.preprocessing import to_model_input
+
+BACKENDS = ("auto", "keras", "tflite")
+
+
+def metadata_path(model_path):
+    # models/BEST_FISH_MODEL.keras -> models/BEST_FISH_MODEL.json
+    return os.path.splitext(model_path)[0] + ".json"
+
+
+def read_metadata(model_path):
+    # Optional sidecar written next to the model by training/export; {} when absent
+    path = metadata_path(model_path)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_metadata(model_path, metadata):
+    with open(metadata_path(model_path), "w", encoding="utf-8") as f:
+        json.dump(metadata, f, indent=2)
+
+
+def _tflite_interpreter_class():
+    # Prefer the standalone runtimes so CPU inference doesn't need full TensorFlow
+    try:
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    import tensorflow as tf
+    return tf.lite.Interpreter
+
+
+class KerasBackend:
+    name = "keras"
+
+    def __init__(self, model_path):
+        import tensorflow as tf
+
+        from src.preprocessing import takes_raw_pixels
+        self.model_path = model_path
+        self.model = tf.keras.models.load_model(model_path)
+        self.input_size = tuple(self.model.input_shape[1:3])
+        self.metadata = read_metadata(model_path)
+        # uint8 pixels for models with the rescaling layer, [0, 1] floats for older ones
+        self.raw_pixels = takes_raw_pixels(self.model) or self.metadata.get("pixels") == "uint8"
+
+    def predict_on_batch(self, batch):
+        return np.asarray(self.model.predict_on_batch(to_model_input(batch, self.raw_pixels)))
+
+    predict = predict_on_batch
+
+
+# Batch sizes the TFLite interpreter is allocated for; a batch is zero-padded up to the next one
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32)
+
+
+class TFLiteBackend:
+    """Runs a .tflite model through the TFLite interpreter.
+
+    Handles quantized inputs/outputs. Each batch is zero-padded up to one of
+    BATCH_BUCKETS, so the single interpreter only reallocates its tensors
+    when the bucket changes, not for every new batch size. Keeping one
+    interpreter keeps memory close to what the registry budgets for the
+    file. Larger batches run in chunks of the largest bucket. The
+    interpreter is not thread-safe, so calls are serialized with a lock.
+    """
+
+    name = "tflite"
+
+    def __init__(self, model_path, num_threads=None):
+        self.model_path = model_path
+        self.num_threads = num_threads or os.cpu_count()
+        self.interpreter = _tflite_interpreter_class()(model_path=model_path, num_threads=self.num_threads)
+        self.interpreter.allocate_tensors()
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self.batch_size = int(self.input["shape"][0])
+        self.input_size = tuple(int(d) for d in self.input["shape"][1:3])
+        self.metadata = read_metadata(model_path)
+        # A plain (unquantized) uint8 input comes from a model with the rescaling layer
+        self.raw_pixels = self.input["dtype"] == np.uint8 and not self.input["quantization"][0]
+        self.lock = threading.Lock()
+
+    def _resize(self, batch_size):
+        # Called with the lock held
+        if batch_size != self.batch_size:
+            self.interpreter.resize_tensor_input(self.input["index"], [batch_size, *self.input["shape"][1:]])
+            self.interpreter.allocate_tensors()
+            self.batch_size = batch_size
+
+    def predict_on_batch(self, batch):
+        batch = to_model_input(batch, self.raw_pixels)
+        scale, zero_point = self.input["quantization"]
+        if scale:
+            batch = np.round(batch / scale + zero_point)
+        batch = batch.astype(self.input["dtype"])
+
+        outputs = []
+        for start in range(0, len(batch), BATCH_BUCKETS[-1]):
+            chunk = batch[start:start + BATCH_BUCKETS[-1]]
+            size = next(b for b in BATCH_BUCKETS if b >= len(chunk))
+            padded = np.zeros((size, *chunk.shape[1:]), dtype=chunk.dtype)
+            padded[:len(chunk)] = chunk
+            with self.lock:
+                self._resize(size)
+                self.interpreter.set_tensor(self.input["index"], padded)
+                self.interpreter.invoke()
+                outputs.append(self.interpreter.get_tensor(self.output["index"])[:len(chunk)])
+        out = np.concatenate(outputs)
+
+        scale, zero_point = self.output["quantization"]
+        if scale:
+            out = (out.astype(np.float32) - zero_point) * scale
+        return out
+
+    predict = predict_on_batch
+
+
+def load_backend(model_path, backend="auto", num_threads=None):
+    """Load a model for inference; "auto" picks the backend from the file extension."""
+    if backend == "auto":
+        backend = "tflite" if model_path.lower().endswith(".tflite") else "keras"
+    if backend == "tflite":
+        return TFLiteBackend(model_path, num_threads)
+    if backend == "keras":
+        return KerasBackend(model_path)
+    raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+
+
+def tflite_variants(model_path):
+    # models/BEST_FISH_MODEL.keras -> {"float16": models/BEST_FISH_MODEL_float16.tflite, ...}
+    stem = os.path.splitext(model_path)[0]
+    return {q: f"{stem}_{q}.tflite" for q in ("float16", "int8")}
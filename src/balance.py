@@ -0,0 +1,160 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from src.inference import IMAGE_EXTENSIONS
+
+# Generated files live next to the originals so every loader picks them up
+AUG_PREFIX = "aug_"
+MANIFEST_NAME = "balance_manifest.json"
+# 2: per-class randomness keyed by the class name instead of the folder's position
+MANIFEST_VERSION = 2
+
+# Same ranges as the notebook's ImageDataGenerator
+ROTATION_RANGE = 20
+ZOOM_RANGE = 0.2
+
+
+def list_classes(train_dir):
+    """{class: (originals, generated)} with sorted file names per class folder."""
+    classes = {}
+    for name in sorted(os.listdir(train_dir)):
+        class_dir = os.path.join(train_dir, name)
+        if not os.path.isdir(class_dir):
+            continue
+        files = sorted(f for f in os.listdir(class_dir) if f.lower().endswith(IMAGE_EXTENSIONS))
+        classes[name] = ([f for f in files if not f.startswith(AUG_PREFIX)],
+                         [f for f in files if f.startswith(AUG_PREFIX)])
+    return classes
+
+
+def augment(image, rng):
+    # Random rotation, zoom-in and horizontal flip; rotated corners are cropped away, not filled
+    width, height = image.size
+    angle = rng.uniform(-ROTATION_RANGE, ROTATION_RANGE)
+    zoom = rng.uniform(1.0, 1.0 + ZOOM_RANGE)
+    flip = rng.random() < 0.5
+
+    image = image.rotate(angle, resample=Image.BILINEAR)
+    theta = math.radians(abs(angle))
+    scale = zoom * (math.cos(theta) + math.sin(theta))
+    crop_w, crop_h = width / scale, height / scale
+    left, top = (width - crop_w) / 2, (height - crop_h) / 2
+    image = image.resize((width, height), Image.BILINEAR, box=(left, top, left + crop_w, top + crop_h))
+    if flip:
+        image = ImageOps.mirror(image)
+    return image, {"angle": round(angle, 3), "zoom": round(zoom, 4), "flip": bool(flip)}
+
+
+def class_seed(name):
+    # Stable per class name, so adding or renaming another class folder doesn't change this one's images
+    return int.from_bytes(hashlib.sha256(name.encode("utf-8")).digest()[:8], "little")
+
+
+def _generate(task):
+    # One output image; its randomness depends only on (seed, class name, index), not on the worker
+    class_dir, index, source, seed, name = task
+    rng = np.random.default_rng([seed, class_seed(name), index])
+    with Image.open(os.path.join(class_dir, source)) as image:
+        image, params = augment(image.convert("RGB"), rng)
+    name = f"{AUG_PREFIX}{index:05d}.jpg"
+    tmp_path = os.path.join(class_dir, f".{name}.tmp")
+    image.save(tmp_path, format="JPEG", quality=95)
+    os.replace(tmp_path, os.path.join(class_dir, name))
+    return {"file": name, "source": source, **params}
+
+
+def read_manifest(train_dir):
+    path = os.path.join(train_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def clean(train_dir):
+    # Remove every generated image and the manifest, restoring the original dataset
+    removed = 0
+    for name, (_, generated) in list_classes(train_dir).items():
+        for fname in generated:
+            os.remove(os.path.join(train_dir, name, fname))
+            removed += 1
+    manifest = os.path.join(train_dir, MANIFEST_NAME)
+    if os.path.exists(manifest):
+        os.remove(manifest)
+    return removed
+
+
+def balance(train_dir, target=None, seed=42, workers=None, dry_run=False):
+    """Top up every class to target images with augmented copies of its originals.
+
+    target defaults to the largest class. Image i of a class is always made
+    from originals[i % len(originals)] with the same random parameters, so
+    runs are reproducible and a rerun only generates the files that are
+    missing. Returns the manifest.
+    """
+    manifest = read_manifest(train_dir)
+    if manifest is not None and manifest["seed"] != seed:
+        raise ValueError(f"{train_dir} was balanced with seed {manifest['seed']}; run with --clean first")
+    if manifest is not None and manifest.get("version", 1) != MANIFEST_VERSION:
+        raise ValueError(f"{train_dir} was balanced by an older version of this tool; run with --clean first")
+    classes = list_classes(train_dir)
+    target = target or max(len(originals) for originals, _ in classes.values())
+
+    previous = manifest["classes"] if manifest else {}
+    tasks, plan = [], {}
+    for name, (originals, generated) in classes.items():
+        needed = max(0, target - len(originals)) if originals else 0
+        existing = set(generated)
+        # Lowering the target drops the surplus from an earlier run
+        for fname in existing - {f"{AUG_PREFIX}{i:05d}.jpg" for i in range(needed)}:
+            if not dry_run:
+                os.remove(os.path.join(train_dir, name, fname))
+        todo = [i for i in range(needed) if f"{AUG_PREFIX}{i:05d}.jpg" not in existing]
+        plan[name] = {"originals": len(originals), "generated": needed, "new": len(todo)}
+        tasks += [(os.path.join(train_dir, name), i, originals[i % len(originals)], seed, name) for i in todo]
+        print(f"{name}: {len(originals)} originals, {needed} augmented ({len(todo)} to generate)")
+    if dry_run:
+        return plan
+
+    start = time.perf_counter()
+    records = {name: {r["file"]: r for r in previous.get(name, {}).get("files", [])} for name in classes}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for task, record in zip(tasks, pool.map(_generate, tasks, chunksize=16)):
+            records[task[4]][record["file"]] = record
+
+    manifest = {"version": MANIFEST_VERSION, "seed": seed, "target": target, "classes": {}}
+    for name, info in plan.items():
+        keep = [f"{AUG_PREFIX}{i:05d}.jpg" for i in range(info["generated"])]
+        manifest["classes"][name] = {"originals": info["originals"],
+                                     "files": [records[name].get(f, {"file": f}) for f in keep]}
+    with open(os.path.join(train_dir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    print(f"Generated {len(tasks)} images in {time.perf_counter() - start:.1f}s")
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Balance the training split with offline augmentation")
+    parser.add_argument("--train-dir", default=os.path.join("data", "train"))
+    parser.add_argument("--target", type=int, default=None, help="images per class (default: largest class)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--dry-run", action="store_true", help="only print what would be generated")
+    parser.add_argument("--clean", action="store_true", help="delete all generated images first")
+    args = parser.parse_args()
+
+    if args.clean:
+        print(f"Removed {clean(args.train_dir)} generated images")
+    balance(args.train_dir, args.target, args.seed, args.workers, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
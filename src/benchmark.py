@@ -0,0 +1,169 @@
+import argparse
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+REPORT_JSON = os.path.join("reports", "benchmark.json")
+REPORT_CSV = os.path.join("reports", "benchmark.csv")
+
+# Saved models from the notebook; anything else in models/ is picked up too
+MODEL_NAMES = {
+    "cnn_fish_model": "CNN",
+    "vgg16_fish_model": "VGG16",
+    "resnet50_fish_model": "ResNet50",
+    "mobilenetv2_fish_model": "MobileNetV2",
+    "efficientnetb0_fish_model": "EfficientNetB0",
+    "BEST_FISH_MODEL": "Best model",
+}
+
+
+def discover_models(models_dir="models"):
+    paths = glob.glob(os.path.join(models_dir, "*.keras")) + glob.glob(os.path.join(models_dir, "*.tflite"))
+    return sorted(paths)
+
+
+def display_name(model_path):
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    for key, name in MODEL_NAMES.items():
+        if stem.startswith(key):
+            return name + stem[len(key):].replace("_", " ")
+    return stem
+
+
+def percentiles(samples_ms):
+    p50, p95, p99 = np.percentile(samples_ms, [50, 95, 99])
+    return {"p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99)}
+
+
+def run_case(model_path, threads, batch_sizes, latency_runs, throughput_seconds):
+    """Benchmark one model at one thread count.
+
+    Meant to run in a fresh process: TensorFlow's thread pools can only be
+    sized before the runtime starts, and cold-load numbers need a cold process.
+    """
+    start = time.perf_counter()
+    backend_name = "tflite" if model_path.lower().endswith(".tflite") else "keras"
+    if backend_name == "keras":
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+    else:
+        from src.backends import _tflite_interpreter_class
+        _tflite_interpreter_class()
+    import_s = time.perf_counter() - start
+
+    from src.backends import load_backend
+
+    start = time.perf_counter()
+    backend = load_backend(model_path, backend_name, num_threads=threads)
+    load_s = time.perf_counter() - start
+
+    h, w = backend.input_size
+    rng = np.random.default_rng(0)
+    max_batch = max(batch_sizes)
+    # Decoded uint8 pixels, the same input the app and the server hand over
+    images = rng.integers(0, 256, (max_batch, h, w, 3), dtype=np.uint8)
+
+    start = time.perf_counter()
+    backend.predict_on_batch(images[:1])
+    first_predict_ms = (time.perf_counter() - start) * 1000
+
+    # Warm single-image latency
+    samples = []
+    for _ in range(latency_runs):
+        start = time.perf_counter()
+        backend.predict_on_batch(images[:1])
+        samples.append((time.perf_counter() - start) * 1000)
+
+    # Batched throughput, each size warmed up once before timing
+    throughput = {}
+    for batch_size in batch_sizes:
+        batch = images[:batch_size]
+        backend.predict_on_batch(batch)
+        count, start = 0, time.perf_counter()
+        while time.perf_counter() - start < throughput_seconds:
+            backend.predict_on_batch(batch)
+            count += batch_size
+        throughput[str(batch_size)] = count / (time.perf_counter() - start)
+
+    return {
+        "model": display_name(model_path),
+        "path": model_path,
+        "backend": backend_name,
+        "threads": threads,
+        "size_mb": os.path.getsize(model_path) / 1e6,
+        "import_s": import_s,
+        "load_s": load_s,
+        "first_predict_ms": first_predict_ms,
+        **percentiles(samples),
+        "throughput_img_s": throughput,
+    }
+
+
+def run_isolated(*args):
+    # One spawn-started worker per case so every run starts cold
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        return pool.submit(run_case, *args).result()
+
+
+def write_reports(results, json_path=REPORT_JSON, csv_path=REPORT_CSV):
+    os.makedirs(os.path.dirname(json_path) or ".", exist_ok=True)
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump({"created": time.strftime("%Y-%m-%d %H:%M:%S"), "cpu_count": os.cpu_count(),
+                   "results": results}, f, indent=2)
+
+    batch_sizes = sorted({int(b) for r in results for b in r["throughput_img_s"]})
+    fields = ["model", "path", "backend", "threads", "size_mb", "import_s", "load_s",
+              "first_predict_ms", "p50_ms", "p95_ms", "p99_ms"] + [f"img_s_batch{b}" for b in batch_sizes]
+    with open(csv_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+        for r in results:
+            row = dict(r)
+            for b, value in r["throughput_img_s"].items():
+                row[f"img_s_batch{b}"] = round(value, 2)
+            writer.writerow(row)
+
+
+def load_report(json_path=REPORT_JSON):
+    if not os.path.exists(json_path):
+        return None
+    with open(json_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark saved models on CPU")
+    parser.add_argument("--models", nargs="+", default=None, help="model files (default: everything in models/)")
+    parser.add_argument("--threads", nargs="+", type=int, default=[1, os.cpu_count()])
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--latency-runs", type=int, default=100)
+    parser.add_argument("--throughput-seconds", type=float, default=3.0)
+    parser.add_argument("--output", default=REPORT_JSON)
+    args = parser.parse_args()
+
+    models = args.models or discover_models()
+    if not models:
+        parser.error("no model files found, pass --models")
+
+    results = []
+    for model_path in models:
+        for threads in sorted(set(args.threads)):
+            r = run_isolated(model_path, threads, args.batch_sizes, args.latency_runs, args.throughput_seconds)
+            results.append(r)
+            best = max(r["throughput_img_s"].values())
+            print(f"{r['model']:<28}{r['backend']:<8}{threads:>3} thr  load {r['load_s']:.2f}s  "
+                  f"p50 {r['p50_ms']:.1f}ms  p99 {r['p99_ms']:.1f}ms  max {best:.1f} img/s")
+
+    write_reports(results, args.output, os.path.splitext(args.output)[0] + ".csv")
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
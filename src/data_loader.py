@@ -0,0 +1,203 @@
+import os
+from collections import namedtuple
+
+import numpy as np
+import tensorflow as tf
+
+from src.manifest import DEFAULT_INDEX_PATH, scan_split, split_files
+from src.preprocessing import IMAGE_SIZE, PIXEL_SCALE, load_image
+from src.tensor_cache import build_cache
+
+BATCH_SIZE = 32
+
+# Augmentation used for the training split in the notebook
+# (ImageDataGenerator rotation_range=20, zoom_range=0.2, horizontal_flip=True)
+ROTATION_RANGE = 20
+ZOOM_RANGE = 0.2
+
+# Decoded images a cached split keeps in its shuffle buffer (~150 MB at 224x224)
+SHUFFLE_BUFFER = 1024
+
+AUTOTUNE = tf.data.AUTOTUNE
+
+# Mirrors the attributes of the old DirectoryIterator so notebook code like
+# train_data.num_classes / test_data.classes keeps working
+SplitData = namedtuple("SplitData", ["dataset", "class_indices", "classes", "num_classes", "samples", "filepaths"])
+
+
+def list_image_files(directory, index_path=DEFAULT_INDEX_PATH):
+    """Return (filepaths, labels, class_indices) for a split folder.
+
+    Class folders are sorted alphanumerically, exactly like
+    flow_from_directory, so label i matches CLASS_NAMES[i] in the app.
+    When the manifest index (src/manifest.py) covers the folder it is read
+    from there instead of walking the tree, which also leaves out unreadable
+    images and training images leaked into val/test.
+    """
+    if index_path and os.path.exists(index_path):
+        listed = split_files(index_path, directory)
+        if listed is not None:
+            return listed
+    return scan_split(directory)
+
+
+def decode_image(path, image_size=IMAGE_SIZE):
+    # Returns a uint8 (H, W, 3) tensor resized to image_size, decoded by the
+    # same PIL code the app and the CLI use so training sees identical pixels
+    image = tf.numpy_function(lambda p: load_image(p.decode(), image_size), [path], tf.uint8)
+    image.set_shape([*image_size, 3])
+    return image
+
+
+def build_augmenter(seed=None):
+    # Works on whole batches, so every augmentation is a single vectorized op.
+    # Each layer gets its own seed so their random draws are not correlated.
+    def layer_seed(i):
+        return None if seed is None else seed + i
+
+    return tf.keras.Sequential([
+        tf.keras.layers.RandomRotation(ROTATION_RANGE / 360.0, fill_mode="nearest", seed=layer_seed(0)),
+        tf.keras.layers.RandomZoom(ZOOM_RANGE, fill_mode="nearest", seed=layer_seed(1)),
+        tf.keras.layers.RandomFlip("horizontal", seed=layer_seed(2)),
+    ], name="augmentation")
+
+
+def epoch_order(num_rows, batch_size, seed, first_epoch=0):
+    """Endless batches of shuffled row indices, one epoch after another.
+
+    Epoch e's order depends only on (seed, e), so training resumed at
+    epoch e sees the same batches as a run that was never interrupted.
+    Consumers pass steps_per_epoch = ceil(num_rows / batch_size) to fit().
+    """
+    def one_epoch(epoch):
+        order = tf.random.experimental.stateless_shuffle(
+            tf.range(num_rows, dtype=tf.int64), seed=tf.stack([tf.constant(seed, tf.int64), epoch]))
+        return tf.data.Dataset.from_tensor_slices(order).batch(batch_size)
+
+    return tf.data.Dataset.counter(first_epoch).flat_map(one_epoch)
+
+
+def array_batches(array, labels, num_classes, batch_size=BATCH_SIZE, shuffle=False, seed=None, targets=None,
+                  first_epoch=None):
+    """Batch rows of a (memory-mapped) array together with one-hot labels.
+
+    Row indices are shuffled and batched first, then each batch is gathered
+    from the array. Sorting the indices inside a batch keeps memmap reads
+    mostly sequential. targets, an optional (N, K) float array aligned with
+    the rows (e.g. teacher outputs), is appended after the one-hot label.
+    With first_epoch set, shuffled batches come from epoch_order instead
+    (an endless, resumable stream starting at that epoch).
+    """
+    labels = np.asarray(labels, dtype=np.int32)
+    dtype = tf.as_dtype(array.dtype)
+    if targets is None:
+        targets = np.zeros((len(labels), 0), dtype=np.float32)
+    targets = np.asarray(targets, dtype=np.float32)
+
+    def gather(idx):
+        idx = np.sort(idx)
+        return array[idx], labels[idx], targets[idx]
+
+    def load_batch(idx):
+        batch, y, extra = tf.numpy_function(gather, [idx], [dtype, tf.int32, tf.float32])
+        batch.set_shape([None, *array.shape[1:]])
+        y.set_shape([None])
+        extra.set_shape([None, targets.shape[1]])
+        return batch, tf.concat([tf.one_hot(y, num_classes), extra], axis=1)
+
+    if shuffle and first_epoch is not None:
+        return epoch_order(len(labels), batch_size, seed, first_epoch).map(load_batch, num_parallel_calls=AUTOTUNE)
+    ds = tf.data.Dataset.range(len(labels))
+    if shuffle:
+        ds = ds.shuffle(len(labels), seed=seed, reshuffle_each_iteration=True)
+    ds = ds.batch(batch_size)
+    return ds.map(load_batch, num_parallel_calls=AUTOTUNE)
+
+
+def make_dataset(directory, image_size=IMAGE_SIZE, batch_size=BATCH_SIZE, augment=False,
+                 shuffle=False, cache=None, seed=None, tensor_cache=None, targets=None, rescale=True,
+                 first_epoch=None):
+    """Build a batched tf.data pipeline for one split folder.
+
+    File paths are shuffled before decoding, so the shuffle buffer never
+    holds decoded images. Images are decoded in parallel, optionally cached
+    (cache="" keeps them in memory, any other string is used as a cache file
+    prefix; a cached split is shuffled after the cache with a bounded
+    buffer), batched, augmented batch-wise, rescaled to [0, 1] and
+    prefetched.
+    Labels are one-hot, like class_mode="categorical".
+
+    Passing tensor_cache (a folder, see src/tensor_cache.py) reads resized
+    images from the on-disk uint8 cache instead, so JPEGs are decoded only
+    the first time they are seen. Per-image targets (see array_batches)
+    need the tensor cache, since they are matched to its rows.
+
+    rescale=False keeps uint8 pixels, for saved models and backends, which
+    do the rescaling inside the graph.
+
+    first_epoch makes a shuffled split an endless stream whose epoch order
+    only depends on (seed, epoch), for resumable training (see
+    array_batches); it needs the tensor cache too.
+    """
+    if targets is not None and tensor_cache is None:
+        raise ValueError("targets are aligned with tensor cache rows; pass tensor_cache as well")
+    if first_epoch is not None and tensor_cache is None:
+        raise ValueError("resumable epoch order needs tensor_cache")
+    if tensor_cache is not None:
+        cached = build_cache(directory, image_size, tensor_cache)
+        filepaths, labels, class_indices = cached.filepaths, list(cached.labels), cached.class_indices
+        num_classes = len(class_indices)
+        ds = array_batches(cached.images, cached.labels, num_classes, batch_size, shuffle, seed, targets,
+                           first_epoch)
+    else:
+        filepaths, labels, class_indices = list_image_files(directory)
+        num_classes = len(class_indices)
+
+        ds = tf.data.Dataset.from_tensor_slices((filepaths, labels))
+        if shuffle and cache is None:
+            ds = ds.shuffle(len(filepaths), seed=seed, reshuffle_each_iteration=True)
+        ds = ds.map(
+            lambda path, label: (decode_image(path, image_size), tf.one_hot(label, num_classes)),
+            num_parallel_calls=AUTOTUNE,
+        )
+        if cache is not None:
+            ds = ds.cache(cache)
+            if shuffle:
+                ds = ds.shuffle(min(len(filepaths), SHUFFLE_BUFFER), seed=seed, reshuffle_each_iteration=True)
+        ds = ds.batch(batch_size)
+
+    if augment:
+        augmenter = build_augmenter(seed)
+        ds = ds.map(
+            lambda images, y: (augmenter(tf.cast(images, tf.float32), training=True), y),
+            num_parallel_calls=AUTOTUNE,
+        )
+    if rescale:
+        ds = ds.map(lambda images, y: (tf.cast(images, tf.float32) * PIXEL_SCALE, y), num_parallel_calls=AUTOTUNE)
+    elif augment:
+        ds = ds.map(lambda images, y: (tf.cast(tf.clip_by_value(tf.round(images), 0, 255), tf.uint8), y),
+                    num_parallel_calls=AUTOTUNE)
+    ds = ds.prefetch(AUTOTUNE)
+
+    return SplitData(ds, class_indices, labels, num_classes, len(filepaths), filepaths)
+
+
+def load_splits(data_dir="data", image_size=IMAGE_SIZE, batch_size=BATCH_SIZE, cache=None, seed=None,
+                tensor_cache=None):
+    """Return (train, val, test) with the same settings the notebook used."""
+    def cache_for(split):
+        if cache:
+            return os.path.join(cache, split)
+        return cache
+
+    if cache:
+        os.makedirs(cache, exist_ok=True)
+
+    train = make_dataset(os.path.join(data_dir, "train"), image_size, batch_size,
+                         augment=True, shuffle=True, cache=cache_for("train"), seed=seed,
+                         tensor_cache=tensor_cache)
+    val = make_dataset(os.path.join(data_dir, "val"), image_size, batch_size, cache=cache_for("val"),
+                       tensor_cache=tensor_cache)
+    test = make_dataset(os.path.join(data_dir, "test"), image_size, batch_size, cache=cache_for("test"),
+                        tensor_cache=tensor_cache)
+    return train, val, test
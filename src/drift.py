@@ -0,0 +1,295 @@
+import argparse
+import json
+import os
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+from src.backends import load_backend
+from src.registry import DEFAULT_MODEL, DEFAULT_MODELS_DIR, describe, resolve
+from src.tensor_cache import DEFAULT_CACHE_DIR, build_cache, file_key
+
+DEFAULT_BASELINE_DIR = os.path.join("cache", "drift")
+BASELINE_VERSION = 1
+
+# Upper bounds, like src.metrics.BUCKETS; values above the last one land in an implicit last bucket.
+# entropy is normalised by log(num_classes), brightness is the mean 0-255 pixel of the model input.
+BUCKETS = {
+    "confidence": (0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99),
+    "entropy": (0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9),
+    "brightness": (32, 64, 96, 128, 160, 192, 224),
+    "megapixels": (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16),
+}
+STATS = ("class", *BUCKETS)
+
+# Population stability index above which a statistic counts as drifted (0.1-0.2 is the usual
+# "moderate shift" band). A window is WINDOW predictions; no verdict before MIN_SAMPLES of them.
+DRIFT_THRESHOLD = 0.2
+WINDOW = 500
+MIN_SAMPLES = 50
+
+METRIC_NAME = "fish_prediction_drift_psi"
+
+
+def psi(expected, actual, eps=1e-4):
+    """Population stability index between two histograms (counts), 0 when identical."""
+    expected = np.asarray(expected, dtype=np.float64)
+    actual = np.asarray(actual, dtype=np.float64)
+    p = np.maximum(expected / max(expected.sum(), 1), eps)
+    q = np.maximum(actual / max(actual.sum(), 1), eps)
+    return float(np.sum((q - p) * np.log(q / p)))
+
+
+def _bucket_counts(values, bounds):
+    return np.bincount(np.searchsorted(bounds, values, side="left"), minlength=len(bounds) + 1)
+
+
+def prediction_stats(probs):
+    # (N, K) probabilities -> predicted class, top-1 confidence and normalised entropy per row
+    probs = np.asarray(probs, dtype=np.float32)
+    clipped = np.clip(probs, 1e-12, 1.0)
+    entropy = -np.sum(probs * np.log(clipped), axis=1) / np.log(max(probs.shape[1], 2))
+    return np.argmax(probs, axis=1), np.max(probs, axis=1), entropy
+
+
+def image_stats(images):
+    # Mean brightness of (N, H, W, 3) uint8 model inputs; every 8th row and column is plenty for a mean
+    return np.asarray(images)[:, ::8, ::8].mean(axis=(1, 2, 3))
+
+
+class DriftMonitor:
+    """Streaming histograms of served predictions, compared with a val-split baseline.
+
+    Each observe() call handles a whole batch with a few vectorised numpy
+    ops and keeps only fixed-size bucket counts: the running window, the
+    previous full window and the baseline. report() compares the recent
+    predictions (previous + running window) with the baseline by PSI per
+    statistic. on_drift(report) is called when a full window turns the
+    drift flag on. Safe to use from several threads.
+    """
+
+    def __init__(self, num_classes, baseline=None, threshold=DRIFT_THRESHOLD, window=WINDOW,
+                 min_samples=MIN_SAMPLES, on_drift=None):
+        self.num_classes = num_classes
+        self.baseline = baseline
+        self.threshold = threshold
+        self.window = window
+        # A full window is always enough for a verdict
+        self.min_samples = min(min_samples, window) if window else min_samples
+        self.on_drift = on_drift
+        self.current = self._empty()
+        self.previous = self._empty()
+        self.total = 0
+        self.windows = 0
+        self.drifted = False
+        self.lock = threading.Lock()
+
+    def _empty(self):
+        counts = {name: np.zeros(len(bounds) + 1, dtype=np.int64) for name, bounds in BUCKETS.items()}
+        counts["class"] = np.zeros(self.num_classes, dtype=np.int64)
+        return counts
+
+    def observe(self, probs, images=None, sizes=None):
+        """Add a batch: (N, K) probabilities, optional (N, H, W, 3) uint8 inputs and original (width, height)s."""
+        classes, confidence, entropy = prediction_stats(probs)
+        update = {
+            "class": np.bincount(classes, minlength=self.num_classes)[:self.num_classes],
+            "confidence": _bucket_counts(confidence, BUCKETS["confidence"]),
+            "entropy": _bucket_counts(entropy, BUCKETS["entropy"]),
+        }
+        if images is not None and len(images):
+            update["brightness"] = _bucket_counts(image_stats(images), BUCKETS["brightness"])
+        if sizes:
+            megapixels = np.prod(np.asarray(sizes, dtype=np.float64), axis=1) / 1e6
+            update["megapixels"] = _bucket_counts(megapixels, BUCKETS["megapixels"])
+
+        report = None
+        with self.lock:
+            for name, counts in update.items():
+                self.current[name] += counts
+            self.total += len(classes)
+            if self.window and self.current["class"].sum() >= self.window:
+                self.previous, self.current = self.current, self._empty()
+                self.windows += 1
+                report = self._report()
+                newly_drifted = report["drift"] and not self.drifted
+                self.drifted = report["drift"]
+        if report is not None and newly_drifted and self.on_drift is not None:
+            self.on_drift(report)
+
+    def counts(self):
+        # All observations when window=None; how build_baseline gets its histograms
+        with self.lock:
+            return {name: (self.previous[name] + self.current[name]).tolist() for name in STATS}
+
+    def _report(self):
+        recent = {name: self.previous[name] + self.current[name] for name in STATS}
+        samples = int(recent["class"].sum())
+        values = {}
+        if self.baseline is not None:
+            for name in STATS:
+                expected = self.baseline["counts"].get(name)
+                if expected is not None and sum(expected) and recent[name].sum() >= self.min_samples:
+                    values[name] = psi(expected, recent[name])
+        drifted = sorted(name for name, value in values.items() if value > self.threshold)
+        return {
+            "samples": samples,
+            "total": self.total,
+            "windows": self.windows,
+            "threshold": self.threshold,
+            "baseline": self.baseline is not None,
+            "psi": values,
+            "drifted": drifted,
+            "drift": bool(drifted),
+            "class_share": (recent["class"] / max(samples, 1)).round(4).tolist(),
+            "mean_confidence": _bucket_mean(recent["confidence"], BUCKETS["confidence"]),
+        }
+
+    def report(self):
+        """PSI per statistic for the recent predictions, and whether any exceeds the threshold."""
+        with self.lock:
+            return self._report()
+
+
+
+def _bucket_mean(counts, bounds):
+    # Approximate mean from bucket midpoints
+    edges = np.array([0.0, *bounds, 1.0])
+    mids = (edges[:-1] + edges[1:]) / 2
+    return float(np.dot(counts, mids) / counts.sum()) if counts.sum() else None
+
+
+def to_prometheus(monitors):
+    # {model name: DriftMonitor} -> one PSI gauge per (model, statistic), appended to GET /metrics
+    lines = [f"# HELP {METRIC_NAME} Population stability index of recent predictions vs the val split.",
+             f"# TYPE {METRIC_NAME} gauge"]
+    for model, monitor in sorted(monitors.items()):
+        label = str(model).replace("\\", "\\\\").replace('"', '\\"')
+        lines += [f'{METRIC_NAME}{{model="{label}",stat="{stat}"}} {value}'
+                  for stat, value in monitor.report()["psi"].items()]
+    return "\n".join(lines) + "\n"
+
+
+def baseline_path(model_path, baseline_dir=DEFAULT_BASELINE_DIR):
+    # cache/drift/models_efficientnetb0_fish_model.json
+    return os.path.join(baseline_dir, os.path.splitext(os.path.normpath(model_path))[0].replace(os.sep, "_") + ".json")
+
+
+def load_baseline(model_path, baseline_dir=DEFAULT_BASELINE_DIR):
+    """The baseline built for this exact model file; None if missing or the model changed since."""
+    path = baseline_path(model_path, baseline_dir)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("version") != BASELINE_VERSION or baseline.get("model_key") != file_key(model_path):
+        return None
+    return baseline
+
+
+def monitor_key(model_path, baseline_dir=DEFAULT_BASELINE_DIR):
+    # Changes when the model file or its baseline does; a monitor opened under another key is stale
+    path = baseline_path(model_path, baseline_dir)
+    return tuple(file_key(model_path)), os.path.getmtime(path) if os.path.exists(path) else None
+
+
+def open_monitor(model_path, num_classes, threshold=DRIFT_THRESHOLD, window=WINDOW, baseline_dir=DEFAULT_BASELINE_DIR,
+                 on_drift=None):
+    # Without a baseline the monitor still collects statistics, it just can't flag drift
+    return DriftMonitor(num_classes, load_baseline(model_path, baseline_dir), threshold, window, on_drift=on_drift)
+
+
+def image_sizes(filepaths):
+    # (width, height) from the image headers, without decoding the pixels
+    sizes = []
+    for path in filepaths:
+        with Image.open(path) as image:
+            sizes.append(image.size)
+    return sizes
+
+
+def build_baseline(model_path, data_dir="data", split="val", baseline_dir=DEFAULT_BASELINE_DIR,
+                   tensor_cache=DEFAULT_CACHE_DIR, batch_size=64, backend=None, verbose=False):
+    """Run the model once over a split and store the histograms the monitor compares against.
+
+    Pixels come from the resized tensor cache; resolutions are read from the
+    image headers only.
+    """
+    start = time.perf_counter()
+    backend = backend or load_backend(model_path)
+    cached = build_cache(os.path.join(data_dir, split), backend.input_size, tensor_cache)
+    class_names = describe(model_path).class_names
+    monitor = DriftMonitor(len(class_names), window=None)
+    sizes = image_sizes(cached.filepaths)
+    for i in range(0, len(cached.labels), batch_size):
+        images = cached.images[i:i + batch_size]
+        monitor.observe(backend.predict_on_batch(images), images, sizes[i:i + batch_size])
+
+    baseline = {
+        "version": BASELINE_VERSION,
+        "model": model_path,
+        "model_key": file_key(model_path),
+        "split": split,
+        "samples": len(cached.labels),
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "class_names": class_names,
+        "counts": monitor.counts(),
+    }
+    path = baseline_path(model_path, baseline_dir)
+    os.makedirs(baseline_dir, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f)
+    os.replace(tmp_path, path)
+    if verbose:
+        print(f"{path}: {len(cached.labels)} {split} images in {time.perf_counter() - start:.1f}s")
+    return baseline
+
+
+def print_report(report, name=""):
+    if not report["baseline"]:
+        print(f"{name or 'Drift'}: no baseline, run python -m src.drift --model ...")
+        return
+    values = ", ".join(f"{stat} {value:.3f}" for stat, value in report["psi"].items()) or "too few samples"
+    verdict = f"DRIFT in {', '.join(report['drifted'])}" if report["drift"] else "no drift"
+    print(f"{name or 'Drift'}: PSI {values} over {report['samples']} predictions "
+          f"(threshold {report['threshold']}) -> {verdict}", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the val-split baseline the prediction drift monitor uses")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="model file or name (python -m src.registry)")
+    parser.add_argument("--models-dir", default=DEFAULT_MODELS_DIR)
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--split", default="val")
+    parser.add_argument("--baseline-dir", default=DEFAULT_BASELINE_DIR)
+    parser.add_argument("--tensor-cache", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--check", default=None, metavar="SPLIT",
+                        help="also stream another split (e.g. test) through the monitor and print its report")
+    parser.add_argument("--threshold", type=float, default=DRIFT_THRESHOLD)
+    args = parser.parse_args()
+
+    try:
+        model_path = resolve(args.model, args.models_dir)
+    except ValueError as e:
+        parser.error(str(e))
+    backend = load_backend(model_path)
+    baseline = build_baseline(model_path, args.data_dir, args.split, args.baseline_dir, args.tensor_cache,
+                              args.batch_size, backend, verbose=True)
+
+    if args.check:
+        cached = build_cache(os.path.join(args.data_dir, args.check), backend.input_size, args.tensor_cache)
+        # An offline split is one population, judged however small it is
+        monitor = DriftMonitor(len(baseline["class_names"]), baseline, args.threshold, window=None, min_samples=1)
+        sizes = image_sizes(cached.filepaths)
+        for i in range(0, len(cached.labels), args.batch_size):
+            images = cached.images[i:i + args.batch_size]
+            monitor.observe(backend.predict_on_batch(images), images, sizes[i:i + args.batch_size])
+        print_report(monitor.report(), args.check)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+import argparse
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from src.backends import load_backend
+from src.preprocessing import load_image, to_model_input
+from src.registry import DEFAULT_MODEL, DEFAULT_MODELS_DIR, describe, resolve, source_model
+from src.tensor_cache import DEFAULT_CACHE_DIR, build_cache, file_key
+
+DEFAULT_INDEX_DIR = os.path.join("cache", "embeddings")
+INDEX_VERSION = 2
+
+# Labelled images a query is compared against; test stays unseen
+SPLITS = ("train", "val")
+
+Neighbour = namedtuple("Neighbour", ["path", "split", "label", "class_name", "similarity"])
+
+
+def embedding_model(model):
+    """The Keras model up to its output layer: image -> penultimate activations.
+
+    Layers (and weights) are shared with model; the final Dense layer, also
+    inside a nested head, is swapped for an identity.
+    """
+    import tensorflow as tf
+
+    last = model.layers[-1]
+
+    def clone(layer):
+        if layer is not last:
+            return layer
+        if isinstance(layer, tf.keras.Model):
+            return embedding_model(layer)
+        return tf.keras.layers.Identity(name=f"{layer.name}_input")
+
+    return tf.keras.models.clone_model(model, clone_function=clone)
+
+
+class Embedder:
+    """L2-normalised embeddings from a KerasBackend's penultimate layer."""
+
+    def __init__(self, backend):
+        self.input_size = backend.input_size
+        self.raw_pixels = backend.raw_pixels
+        self.model = embedding_model(backend.model)
+        self.dim = self.model.output_shape[-1]
+        # Trace the graph now so the first lookup doesn't pay for it
+        self.embed(np.zeros((1, *self.input_size, 3), dtype=np.uint8))
+
+    def embed(self, batch):
+        # (N, H, W, 3) uint8 -> (N, dim) float32 unit vectors
+        vectors = np.asarray(self.model.predict_on_batch(to_model_input(batch, self.raw_pixels)), dtype=np.float32)
+        vectors = vectors.reshape(len(vectors), -1)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def get_embedder(backend):
+    # Kept on the backend, so the registry unloads it together with the model
+    if getattr(backend, "embedder", None) is None:
+        backend.embedder = Embedder(backend)
+    return backend.embedder
+
+
+def index_path(model_path, index_dir=DEFAULT_INDEX_DIR):
+    # cache/embeddings/models_efficientnetb0_fish_model
+    return os.path.join(index_dir, os.path.splitext(os.path.normpath(model_path))[0].replace(os.sep, "_"))
+
+
+class EmbeddingIndex:
+    """Unit-norm embeddings of labelled images with brute-force cosine kNN.
+
+    vectors is a read-only float16 memmap; the first search converts it to
+    a float32 matrix once, after which a query is a single matrix-vector
+    product plus argpartition (a few ms for tens of thousands of images).
+    """
+
+    def __init__(self, vectors, entries, class_names, model_path):
+        self.vectors = vectors
+        self.paths = [e["path"] for e in entries]
+        self.splits = [e["split"] for e in entries]
+        self.labels = np.array([e["label"] for e in entries], dtype=np.int32)
+        self.class_names = class_names
+        self.model_path = model_path
+        self.matrix = None
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.paths)
+
+    def _matrix(self):
+        with self.lock:
+            if self.matrix is None:
+                self.matrix = np.asarray(self.vectors, dtype=np.float32)
+            return self.matrix
+
+    def search(self, queries, k=5):
+        """Top-k neighbours for each (N, dim) query embedding, most similar first."""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if not len(self):
+            return [[] for _ in queries]
+        k = min(k, len(self))
+        sims = queries @ self._matrix().T
+        idx = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(sims, idx, axis=1), axis=1)
+        idx = np.take_along_axis(idx, order, axis=1)
+        return [[Neighbour(self.paths[j], self.splits[j], int(self.labels[j]),
+                           self.class_names[self.labels[j]], float(sims[q, j])) for j in row]
+                for q, row in enumerate(idx)]
+
+
+def _read_index(folder):
+    index_file = os.path.join(folder, "index.json")
+    if not os.path.exists(index_file):
+        return None
+    with open(index_file, "r", encoding="utf-8") as f:
+        index = json.load(f)
+    if index.get("version") != INDEX_VERSION:
+        return None
+    return index
+
+
+def _open_vectors(folder, index):
+    # Like the tensor cache: the index names its embeddings file; None if that is gone or the wrong shape
+    try:
+        vectors = np.load(os.path.join(folder, index["embeddings"]), mmap_mode="r")
+    except FileNotFoundError:
+        return None
+    if vectors.shape != (len(index["entries"]), index["dim"]):
+        return None
+    return vectors
+
+
+def open_index(model_path, index_dir=DEFAULT_INDEX_DIR):
+    """Open the index built for model_path (a TFLite variant uses its Keras model's).
+
+    None if it is missing or was built from a different version of the model file.
+    """
+    keras_path = source_model(model_path)
+    if keras_path is None:
+        return None
+    folder = index_path(keras_path, index_dir)
+    index = _read_index(folder)
+    if index is None or index["model_key"] != file_key(keras_path):
+        return None
+    vectors = _open_vectors(folder, index)
+    if vectors is None:
+        return None
+    return EmbeddingIndex(vectors, index["entries"], index["class_names"], keras_path)
+
+
+def build_index(model_path, data_dir="data", splits=SPLITS, index_dir=DEFAULT_INDEX_DIR,
+                tensor_cache=DEFAULT_CACHE_DIR, batch_size=64, backend=None, verbose=False):
+    """Create or incrementally refresh the embedding index of one Keras model.
+
+    Images come from the resized tensor cache (built or refreshed as
+    needed). Rows whose (path, mtime, size) still match are copied from the
+    previous index, so only new or modified images go through the model;
+    retraining the model (a new file) re-embeds everything. As with the
+    tensor cache, a new embeddings file is written before the index that
+    names it is swapped in.
+    """
+    folder = index_path(model_path, index_dir)
+    os.makedirs(folder, exist_ok=True)
+    backend = backend or load_backend(model_path, "keras")
+    embedder = get_embedder(backend)
+    model_key = file_key(model_path)
+
+    splits_cached = [(split, build_cache(os.path.join(data_dir, split), backend.input_size, tensor_cache))
+                     for split in splits]
+    folder_names = sorted(splits_cached[0][1].class_indices, key=splits_cached[0][1].class_indices.get)
+    # Model output order; the folder names when the model's class list doesn't fit
+    class_names = describe(model_path).class_names
+    if len(class_names) != len(folder_names):
+        class_names = folder_names
+
+    entries, sources = [], []
+    for split, cached in splits_cached:
+        for row, (path, label) in enumerate(zip(cached.filepaths, cached.labels)):
+            entries.append({"path": path, "split": split, "key": file_key(path), "label": int(label)})
+            sources.append((cached, row))
+
+    old_index = _read_index(folder)
+    old_rows, old_vectors = {}, None
+    if old_index is not None and old_index["model_key"] == model_key and old_index["dim"] == embedder.dim:
+        old_vectors = _open_vectors(folder, old_index)
+    if old_vectors is not None:
+        old_rows = {e["path"]: (row, e["key"]) for row, e in enumerate(old_index["entries"])}
+
+    reuse, todo = {}, []
+    for i, e in enumerate(entries):
+        hit = old_rows.get(e["path"])
+        if hit is not None and hit[1] == e["key"]:
+            reuse[i] = hit[0]
+        else:
+            todo.append(i)
+    if old_vectors is not None and not todo and len(reuse) == len(old_rows):
+        return open_index(model_path, index_dir)
+
+    start = time.perf_counter()
+    vectors_name = f"embeddings-{time.time_ns()}-{os.getpid()}.npy"
+    tmp_path = os.path.join(folder, f"{vectors_name}.tmp")
+    vectors = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float16, shape=(len(entries), embedder.dim))
+    for i, row in reuse.items():
+        vectors[i] = old_vectors[row]
+    for chunk_start in range(0, len(todo), batch_size):
+        chunk = todo[chunk_start:chunk_start + batch_size]
+        batch = np.stack([sources[i][0].images[sources[i][1]] for i in chunk])
+        vectors[chunk] = embedder.embed(batch)
+    vectors.flush()
+    del vectors, old_vectors
+
+    os.replace(tmp_path, os.path.join(folder, vectors_name))
+    index = {
+        "version": INDEX_VERSION,
+        "model": model_path,
+        "model_key": model_key,
+        "embeddings": vectors_name,
+        "dim": embedder.dim,
+        "class_names": class_names,
+        "entries": entries,
+    }
+    index_file = os.path.join(folder, "index.json")
+    tmp_index = f"{index_file}.{os.getpid()}.tmp"
+    with open(tmp_index, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(tmp_index, index_file)
+    # Readers that already mapped the old file keep it until they close it
+    if old_index is not None and old_index.get("embeddings") not in (None, vectors_name):
+        try:
+            os.remove(os.path.join(folder, old_index["embeddings"]))
+        except FileNotFoundError:
+            pass
+
+    if verbose:
+        dropped = len(set(old_rows) - {e["path"] for e in entries})
+        print(f"{folder}: {len(reuse)} reused, {len(todo)} embedded, {dropped} dropped "
+              f"in {time.perf_counter() - start:.1f}s")
+    return open_index(model_path, index_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the embedding index behind the app's similar-image lookup")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="Keras model file or name (python -m src.registry)")
+    parser.add_argument("--models-dir", default=DEFAULT_MODELS_DIR)
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--splits", nargs="+", default=list(SPLITS))
+    parser.add_argument("--index-dir", default=DEFAULT_INDEX_DIR)
+    parser.add_argument("--tensor-cache", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--query", nargs="+", default=[], metavar="IMAGE", help="print the nearest images for these")
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    try:
+        model_path = source_model(resolve(args.model, args.models_dir))
+    except ValueError as e:
+        parser.error(str(e))
+    if model_path is None:
+        parser.error(f"{args.model} is not a Keras model or an export of one")
+
+    backend = load_backend(model_path, "keras")
+    index = build_index(model_path, args.data_dir, args.splits, args.index_dir, args.tensor_cache,
+                        args.batch_size, backend, verbose=True)
+    print(f"{len(index)} images indexed for {model_path}")
+
+    embedder = get_embedder(backend)
+    for query in args.query:
+        vector = embedder.embed(load_image(query, embedder.input_size)[None])
+        start = time.perf_counter()
+        neighbours = index.search(vector, args.top_k)[0]
+        print(f"{query} ({(time.perf_counter() - start) * 1000:.1f} ms):")
+        for n in neighbours:
+            print(f"  {n.similarity:.3f}  {n.class_name:<20}  {n.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+import argparse
+import csv
+import os
+import threading
+import time
+
+import numpy as np
+
+from src.backends import BACKENDS, load_backend
+from src.prediction_cache import model_identity
+from src.preprocessing import resize_batch
+
+# identity, horizontal flip, central crop (zoomed back to full size) and both
+TTA_VIEWS = ("identity", "flip", "crop", "flip_crop")
+CROP_FRACTION = 0.875
+DEFAULT_THRESHOLD = 0.8
+
+
+def make_views(batch, views=TTA_VIEWS):
+    """Stack the TTA views of a batch into one (len(views) * N, H, W, 3) array, view-major."""
+    out = []
+    for view in views:
+        if view not in TTA_VIEWS:
+            raise ValueError(f"Unknown TTA view {view!r}, expected one of {TTA_VIEWS}")
+        x = batch
+        if "crop" in view:
+            h, w = batch.shape[1:3]
+            top, left = int(h * (1 - CROP_FRACTION) / 2), int(w * (1 - CROP_FRACTION) / 2)
+            x = resize_batch(x[:, top:h - top, left:w - left], (h, w))
+        if "flip" in view:
+            x = x[:, :, ::-1]
+        out.append(x)
+    return np.concatenate(out, axis=0)
+
+
+class Ensemble:
+    """Average of several models over several TTA views.
+
+    Every view of every image goes to a member in a single predict call, so
+    a batch costs one call per member however many views are used. Members
+    are backends (src.backends) and may use different input sizes.
+    """
+
+    def __init__(self, members, views=("identity",), weights=None):
+        self.members = list(members)
+        self.views = tuple(views)
+        self.weights = np.asarray(weights or [1.0] * len(self.members), dtype=np.float32)
+        self.input_size = self.members[0].input_size
+        self.identity = ensemble_identity([m.model_path for m in self.members], self.views)
+
+    def predict_on_batch(self, batch):
+        batch = np.asarray(batch)
+        n = len(batch)
+        total = 0
+        for member, weight in zip(self.members, self.weights):
+            views = make_views(resize_batch(batch, member.input_size), self.views)
+            probs = np.asarray(member.predict_on_batch(views), dtype=np.float32)
+            total = total + weight * probs.reshape(len(self.views), n, -1).mean(axis=0)
+        return total / self.weights.sum()
+
+    predict = predict_on_batch
+
+
+class Cascade:
+    """Confidence-based early exit: the fast model answers first and only
+    images whose top-1 probability is below threshold are re-scored by the
+    expensive model (usually an Ensemble)."""
+
+    def __init__(self, fast, slow, threshold=DEFAULT_THRESHOLD):
+        self.fast = fast
+        self.slow = slow
+        self.threshold = threshold
+        self.input_size = fast.input_size
+        self.identity = f"{engine_identity(fast)}>{engine_identity(slow)}@{threshold}"
+        self.lock = threading.Lock()
+        self.images = 0
+        self.escalated = 0
+        self.last_escalated = np.zeros(0, dtype=bool)
+
+    def predict_on_batch(self, batch):
+        batch = np.asarray(batch)
+        probs = np.array(self.fast.predict_on_batch(batch), dtype=np.float32)
+        uncertain = probs.max(axis=1) < self.threshold
+        if uncertain.any():
+            probs[uncertain] = self.slow.predict_on_batch(batch[uncertain])
+        with self.lock:
+            self.images += len(batch)
+            self.escalated += int(uncertain.sum())
+            self.last_escalated = uncertain
+        return probs
+
+    predict = predict_on_batch
+
+    def stats(self):
+        return {"images": self.images, "escalated": self.escalated,
+                "escalation_rate": self.escalated / self.images if self.images else 0.0}
+
+
+def build_engine(model_path, ensemble_paths=(), views=("identity",), threshold=None, backend="auto",
+                 num_threads=None):
+    """Plain backend, Ensemble or Cascade depending on the options.
+
+    With ensemble_paths and/or extra TTA views, the expensive path averages
+    model_path and every ensemble model over all views. With a threshold it
+    only runs when model_path alone is less confident than that.
+    """
+    base = load_backend(model_path, backend, num_threads)
+    if not ensemble_paths and tuple(views) == ("identity",):
+        return base
+    members = [base] + [load_backend(path, backend, num_threads) for path in ensemble_paths]
+    heavy = Ensemble(members, views)
+    if threshold is None:
+        return heavy
+    return Cascade(base, heavy, threshold)
+
+
+def ensemble_identity(model_paths, views):
+    return "+".join(model_identity(p) for p in model_paths) + "@" + ",".join(views)
+
+
+def engine_identity(engine):
+    # Key for the prediction cache; changes with any model file, view or threshold
+    return getattr(engine, "identity", None) or model_identity(engine.model_path)
+
+
+def engine_key(model_path, ensemble_paths=(), views=("identity",), threshold=None):
+    # engine_identity of what build_engine would return, without loading any model
+    if not ensemble_paths and tuple(views) == ("identity",):
+        return model_identity(model_path)
+    heavy = ensemble_identity([model_path, *ensemble_paths], views)
+    if threshold is None:
+        return heavy
+    return f"{model_identity(model_path)}>{heavy}@{threshold}"
+
+
+def sweep_thresholds(fast_probs, slow_probs, y_true, fast_ms, slow_ms, thresholds):
+    """Accuracy and cost of the cascade at each threshold, from one pass of both models."""
+    fast_pred, slow_pred = fast_probs.argmax(axis=1), slow_probs.argmax(axis=1)
+    confidence = fast_probs.max(axis=1)
+    rows = []
+    for threshold in thresholds:
+        escalate = confidence < threshold
+        pred = np.where(escalate, slow_pred, fast_pred)
+        rows.append({
+            "threshold": threshold,
+            "accuracy": float(np.mean(pred == y_true)),
+            "escalation_rate": float(escalate.mean()),
+            "ms_per_image": fast_ms + float(escalate.mean()) * slow_ms,
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pick a cascade threshold: accuracy vs cost of fast model + ensemble")
+    parser.add_argument("--model", default="Best model", help="fast model, file or name (python -m src.registry)")
+    parser.add_argument("--ensemble", nargs="+", required=True, metavar="MODEL", help="models averaged with it")
+    parser.add_argument("--models-dir", default="models", help="where model names are looked up")
+    parser.add_argument("--tta", nargs="+", choices=TTA_VIEWS, default=["identity", "flip"])
+    parser.add_argument("--thresholds", nargs="+", type=float, default=[0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99])
+    parser.add_argument("--max-ms", type=float, default=None, help="per-image budget for the recommendation")
+    parser.add_argument("--backend", choices=BACKENDS, default="auto")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--split", default="val")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--tensor-cache", default=None, help="read images from the uint8 tensor cache folder")
+    parser.add_argument("--output", default=os.path.join("reports", "cascade.csv"))
+    args = parser.parse_args()
+
+    from src.data_loader import make_dataset
+    from src.registry import resolve
+
+    fast = load_backend(resolve(args.model, args.models_dir), args.backend)
+    heavy = Ensemble([fast] + [load_backend(resolve(p, args.models_dir), args.backend) for p in args.ensemble],
+                     args.tta)
+    split = make_dataset(os.path.join(args.data_dir, args.split), fast.input_size, args.batch_size,
+                         tensor_cache=args.tensor_cache, rescale=False)
+
+    fast_probs, slow_probs, labels = [], [], []
+    fast_s = slow_s = 0.0
+    for images, y in split.dataset:
+        images = np.asarray(images)
+        start = time.perf_counter()
+        fast_probs.append(fast.predict_on_batch(images))
+        fast_s += time.perf_counter() - start
+        start = time.perf_counter()
+        slow_probs.append(heavy.predict_on_batch(images))
+        slow_s += time.perf_counter() - start
+        labels.append(np.argmax(np.asarray(y), axis=1))
+    fast_probs, slow_probs, labels = np.concatenate(fast_probs), np.concatenate(slow_probs), np.concatenate(labels)
+    fast_ms, slow_ms = fast_s * 1000 / len(labels), slow_s * 1000 / len(labels)
+
+    rows = sweep_thresholds(fast_probs, slow_probs, labels, fast_ms, slow_ms, args.thresholds)
+    print(f"fast model: accuracy {np.mean(fast_probs.argmax(1) == labels):.4f}, {fast_ms:.2f} ms/image")
+    print(f"ensemble:   accuracy {np.mean(slow_probs.argmax(1) == labels):.4f}, {slow_ms:.2f} ms/image")
+    for r in rows:
+        print(f"threshold {r['threshold']:.2f}: accuracy {r['accuracy']:.4f}, "
+              f"{r['escalation_rate'] * 100:5.1f}% escalated, {r['ms_per_image']:.2f} ms/image")
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    affordable = [r for r in rows if args.max_ms is None or r["ms_per_image"] <= args.max_ms]
+    if affordable:
+        best = max(affordable, key=lambda r: (r["accuracy"], -r["ms_per_image"]))
+        print(f"Recommended: --cascade-threshold {best['threshold']}")
+    else:
+        print(f"No threshold fits {args.max_ms} ms/image")
+
+
+if __name__ == "__main__":
+    main()
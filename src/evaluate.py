@@ -0,0 +1,217 @@
+import argparse
+import csv
+import json
+import os
+import time
+
+import numpy as np
+
+from src.benchmark import discover_models, display_name
+from src.inference import CLASS_NAMES
+from src.tensor_cache import DEFAULT_CACHE_DIR
+
+REPORTS_DIR = "reports"
+
+
+class StreamingMetrics:
+    """Confusion matrix, per-class precision/recall/F1 and top-k accuracy,
+    updated one batch at a time so no probabilities are kept around."""
+
+    def __init__(self, num_classes, top_k=(1, 3)):
+        self.num_classes = num_classes
+        self.top_k = tuple(top_k)
+        self.confusion = np.zeros((num_classes, num_classes), dtype=np.int64)
+        self.top_k_correct = {k: 0 for k in self.top_k}
+        self.count = 0
+        self.predict_seconds = 0.0
+
+    def update(self, y_true, probs):
+        y_true = np.asarray(y_true, dtype=np.int64)
+        probs = np.asarray(probs)
+        y_pred = np.argmax(probs, axis=1)
+        n = self.num_classes
+        self.confusion += np.bincount(y_true * n + y_pred, minlength=n * n).reshape(n, n)
+
+        # Rank of the true class = number of classes scored strictly higher
+        true_scores = probs[np.arange(len(y_true)), y_true]
+        rank = np.sum(probs > true_scores[:, None], axis=1)
+        for k in self.top_k:
+            self.top_k_correct[k] += int(np.sum(rank < k))
+        self.count += len(y_true)
+
+    @property
+    def ms_per_image(self):
+        return self.predict_seconds * 1000 / max(self.count, 1)
+
+    @property
+    def accuracy(self):
+        return np.trace(self.confusion) / max(self.count, 1)
+
+    def per_class(self):
+        tp = np.diag(self.confusion).astype(np.float64)
+        predicted = self.confusion.sum(axis=0)
+        support = self.confusion.sum(axis=1)
+        precision = np.divide(tp, predicted, out=np.zeros_like(tp), where=predicted > 0)
+        recall = np.divide(tp, support, out=np.zeros_like(tp), where=support > 0)
+        denom = precision + recall
+        f1 = np.divide(2 * precision * recall, denom, out=np.zeros_like(tp), where=denom > 0)
+        return precision, recall, f1, support
+
+    def summary(self, class_names):
+        precision, recall, f1, support = self.per_class()
+        return {
+            "images": int(self.count),
+            "accuracy": float(self.accuracy),
+            "top_k_accuracy": {str(k): v / max(self.count, 1) for k, v in self.top_k_correct.items()},
+            "macro_precision": float(precision.mean()),
+            "macro_recall": float(recall.mean()),
+            "macro_f1": float(f1.mean()),
+            "per_class": {
+                name: {"precision": float(p), "recall": float(r), "f1": float(f), "support": int(s)}
+                for name, p, r, f, s in zip(class_names, precision, recall, f1, support)
+            },
+            "confusion_matrix": self.confusion.tolist(),
+        }
+
+    def classification_report(self, class_names):
+        # Same layout as sklearn's classification_report
+        precision, recall, f1, support = self.per_class()
+        width = max(len(name) for name in class_names)
+        lines = [f"{'':>{width}}  precision    recall  f1-score   support", ""]
+        for name, p, r, f, s in zip(class_names, precision, recall, f1, support):
+            lines.append(f"{name:>{width}}  {p:9.2f} {r:9.2f} {f:9.2f} {s:9d}")
+        lines.append("")
+        lines.append(f"{'accuracy':>{width}}  {'':9} {'':9} {self.accuracy:9.2f} {self.count:9d}")
+        lines.append(f"{'macro avg':>{width}}  {precision.mean():9.2f} {recall.mean():9.2f} "
+                     f"{f1.mean():9.2f} {self.count:9d}")
+        return "\n".join(lines)
+
+
+def evaluate_models(model_paths, split_at, top_k=(1, 3), load=None):
+    """Score models one at a time, streaming the split through each.
+
+    Only one model is in memory at once. split_at(image_size) returns the
+    split (see src.data_loader.make_dataset) resized to a model's input
+    size, so no image is resized twice; with the tensor cache and a split
+    kept per size, images are decoded once per input size no matter how
+    many models there are. load(path) returns a backend with
+    predict_on_batch and input_size (default src.backends.load_backend).
+    Returns {path: StreamingMetrics}.
+    """
+    if load is None:
+        from src.backends import load_backend as load
+    metrics = {}
+    for path in model_paths:
+        model = load(path)
+        split = split_at(tuple(model.input_size))
+        metrics[path] = StreamingMetrics(split.num_classes, top_k)
+        for images, labels in split.dataset:
+            images = np.asarray(images)
+            y_true = np.argmax(np.asarray(labels), axis=1)
+            start = time.perf_counter()
+            probs = model.predict_on_batch(images)
+            metrics[path].predict_seconds += time.perf_counter() - start
+            metrics[path].update(y_true, probs)
+        del model
+    return metrics
+
+
+def report_names(model_paths):
+    # Display names, falling back to the path for files whose names collide
+    names = [display_name(path) for path in model_paths]
+    return {path: name if names.count(name) == 1 else path for path, name in zip(model_paths, names)}
+
+
+def write_comparison_table(metrics, path):
+    # metrics maps a display name to its StreamingMetrics
+    rows = sorted(metrics.items(), key=lambda item: item[1].accuracy, reverse=True)
+    top_ks = [k for k in next(iter(metrics.values())).top_k if k != 1]
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Model Name", "Test Accuracy"] + [f"Top-{k} Accuracy" for k in top_ks]
+                        + ["Macro Precision", "Macro Recall", "Macro F1", "ms per Image", "Images"])
+        for name, m in rows:
+            precision, recall, f1, _ = m.per_class()
+            writer.writerow([name, f"{m.accuracy:.4f}"]
+                            + [f"{m.top_k_correct[k] / max(m.count, 1):.4f}" for k in top_ks]
+                            + [f"{precision.mean():.4f}", f"{recall.mean():.4f}", f"{f1.mean():.4f}",
+                               f"{m.ms_per_image:.2f}", m.count])
+
+
+def plot_confusion_matrix(confusion, class_names, title, path):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(10, 8))
+    image = ax.imshow(confusion, cmap="Blues")
+    fig.colorbar(image, ax=ax)
+    ax.set_xticks(range(len(class_names)), class_names, rotation=45, ha="right")
+    ax.set_yticks(range(len(class_names)), class_names)
+    threshold = confusion.max() / 2 if confusion.size else 0
+    for i in range(confusion.shape[0]):
+        for j in range(confusion.shape[1]):
+            ax.text(j, i, int(confusion[i, j]), ha="center", va="center",
+                    color="white" if confusion[i, j] > threshold else "black")
+    ax.set_xlabel("Predicted")
+    ax.set_ylabel("True")
+    ax.set_title(title)
+    fig.tight_layout()
+    fig.savefig(path, dpi=120)
+    plt.close(fig)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate one or more models on a split, one model at a time")
+    parser.add_argument("--models", nargs="+", default=None, help="model files (default: everything in models/)")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--split", default="test")
+    parser.add_argument("--image-size", type=int, default=224, help="input size for models without a fixed one")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--top-k", nargs="+", type=int, default=[1, 3])
+    parser.add_argument("--tensor-cache", default=DEFAULT_CACHE_DIR,
+                        help="uint8 tensor cache folder the split is decoded into once per input size "
+                             "('' decodes per model)")
+    parser.add_argument("--reports-dir", default=REPORTS_DIR)
+    args = parser.parse_args()
+
+    from src.data_loader import make_dataset
+
+    model_paths = list(dict.fromkeys(args.models or discover_models()))
+    if not model_paths:
+        parser.error("no model files found, pass --models")
+
+    # One split per model input size, so models of the same size share it
+    splits = {}
+
+    def split_at(image_size):
+        if None in image_size:
+            image_size = (args.image_size, args.image_size)
+        if image_size not in splits:
+            splits[image_size] = make_dataset(os.path.join(args.data_dir, args.split), image_size, args.batch_size,
+                                              tensor_cache=args.tensor_cache or None, rescale=False)
+        return splits[image_size]
+
+    names = report_names(model_paths)
+    scored = evaluate_models(model_paths, split_at, args.top_k)
+    split = next(iter(splits.values()))
+    class_names = CLASS_NAMES if split.num_classes == len(CLASS_NAMES) else list(split.class_indices)
+    metrics = {names[path]: m for path, m in scored.items()}
+
+    os.makedirs(args.reports_dir, exist_ok=True)
+    write_comparison_table(metrics, os.path.join(args.reports_dir, "model_comparison_table.csv"))
+    with open(os.path.join(args.reports_dir, "evaluation.json"), "w", encoding="utf-8") as f:
+        json.dump({name: m.summary(class_names) for name, m in metrics.items()}, f, indent=2)
+
+    best_name, best = max(metrics.items(), key=lambda item: item[1].accuracy)
+    plot_confusion_matrix(best.confusion, class_names, f"Confusion Matrix - {best_name}",
+                          os.path.join(args.reports_dir, "confusion_matrix.png"))
+
+    for name, m in metrics.items():
+        print(f"\n{name}: accuracy {m.accuracy:.4f}")
+        print(m.classification_report(class_names))
+    print(f"\nBest model: {best_name} ({best.accuracy:.4f}); reports written to {args.reports_dir}/")
+
+
+if __name__ == "__main__":
+    main()
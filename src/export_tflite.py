@@ -0,0 +1,109 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from src.backends import load_backend, tflite_variants
+from src.data_loader import make_dataset
+from src.preprocessing import to_model_input
+
+DEFAULT_MODEL_PATH = os.path.join("models", "BEST_FISH_MODEL.keras")
+
+
+def representative_images(val_dir, num_images, image_size, tensor_cache=None, raw_pixels=True, dtype=None):
+    # Calibration samples for int8 quantization, taken from the val split, in the model's input format.
+    # dtype is the input tensor's: a model can rescale 0-255 pixels itself and still take float32.
+    val = make_dataset(val_dir, image_size, batch_size=1, shuffle=True, seed=0, tensor_cache=tensor_cache,
+                       rescale=False)
+
+    def generator():
+        for images, _ in val.dataset.take(num_images):
+            yield [np.asarray(to_model_input(images.numpy(), raw_pixels), dtype=dtype)]
+
+    return generator
+
+
+def convert(model, quantization, representative_dataset=None):
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if quantization == "float16":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == "int8":
+        # Full-integer kernels; input/output stay float so callers don't change
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    return converter.convert()
+
+
+def accuracy(predict_fn, dataset):
+    correct, total = 0, 0
+    start = time.perf_counter()
+    for images, labels in dataset:
+        probs = predict_fn(images.numpy())
+        correct += int(np.sum(np.argmax(probs, axis=1) == np.argmax(labels.numpy(), axis=1)))
+        total += len(probs)
+    return correct / max(total, 1), (time.perf_counter() - start) / max(total, 1) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export float16 / int8 TFLite versions of a Keras model")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--image-size", type=int, default=None,
+                        help="input size for models without a fixed one")
+    parser.add_argument("--num-calibration", type=int, default=200)
+    parser.add_argument("--tensor-cache", default=None, help="read images from the uint8 tensor cache folder")
+    parser.add_argument("--report", default=os.path.join("reports", "tflite_export.json"))
+    args = parser.parse_args()
+
+    keras_backend = load_backend(args.model, "keras")
+    model = keras_backend.model
+    # Calibration and the test comparison must match the model's input, not a fixed 224
+    image_size = keras_backend.input_size
+    if None in image_size:
+        if not args.image_size:
+            parser.error(f"{args.model} has no fixed input size, pass --image-size")
+        image_size = (args.image_size, args.image_size)
+    representative = representative_images(
+        os.path.join(args.data_dir, "val"), args.num_calibration, image_size, args.tensor_cache,
+        keras_backend.raw_pixels, model.inputs[0].dtype,
+    )
+
+    outputs = tflite_variants(args.model)
+    for quantization, path in outputs.items():
+        with open(path, "wb") as f:
+            f.write(convert(model, quantization, representative))
+        print(f"Wrote {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+
+    # Compare every variant against the Keras model on the test split
+    test = make_dataset(os.path.join(args.data_dir, "test"), image_size, tensor_cache=args.tensor_cache,
+                        rescale=False)
+    keras_acc, keras_ms = accuracy(keras_backend.predict_on_batch, test.dataset)
+    results = [{
+        "variant": "keras", "path": args.model, "size_mb": os.path.getsize(args.model) / 1e6,
+        "test_accuracy": keras_acc, "accuracy_delta": 0.0, "ms_per_image": keras_ms,
+    }]
+    for quantization, path in outputs.items():
+        backend = load_backend(path)
+        acc, ms = accuracy(backend.predict_on_batch, test.dataset)
+        results.append({
+            "variant": f"tflite-{quantization}", "path": path, "size_mb": os.path.getsize(path) / 1e6,
+            "test_accuracy": acc, "accuracy_delta": acc - keras_acc, "ms_per_image": ms,
+        })
+
+    print(f"\n{'Variant':<16}{'Size MB':>10}{'Accuracy':>11}{'Delta':>9}{'ms/img':>9}")
+    for r in results:
+        print(f"{r['variant']:<16}{r['size_mb']:>10.1f}{r['test_accuracy']:>11.4f}"
+              f"{r['accuracy_delta']:>+9.4f}{r['ms_per_image']:>9.2f}")
+
+    os.makedirs(os.path.dirname(args.report) or ".", exist_ok=True)
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
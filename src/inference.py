@@ -0,0 +1,72 @@
+import io
+import os
+import time
+import zipfile
+
+import numpy as np
+
+PREDICT_BATCH_SIZE = 32
+
+# Model output order (sorted class folder names, see src/data_loader.py)
+CLASS_NAMES = [
+    'Black Sea Sprat',
+    'Gilt Head Bream',
+    'Hourse Mackerel',
+    'Red Mullet',
+    'Red Sea Bream',
+    'Sea Bass',
+    'Shrimp',
+    'Striped Red Mullet',
+    'Trout'
+]
+
+# File types every tool picks up: scans, zip uploads, batch scoring, the manifest and balancing
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def iter_zip_images(file_obj):
+    # Yields (name, bytes) for every image inside a zip archive
+    with zipfile.ZipFile(file_obj) as archive:
+        for info in archive.infolist():
+            name = info.filename
+            if info.is_dir() or os.path.basename(name).startswith("."):
+                continue
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                yield name, archive.read(info)
+
+
+def predict_in_chunks(model, batch, chunk_size=PREDICT_BATCH_SIZE):
+    """Predict a whole batch in fixed-size chunks.
+
+    Returns the (N, num_classes) probabilities and the model time in ms
+    for each image (its chunk's time split evenly over the chunk).
+    """
+    probs, times = [], []
+    for start in range(0, len(batch), chunk_size):
+        chunk = batch[start:start + chunk_size]
+        t0 = time.perf_counter()
+        probs.append(np.asarray(model.predict_on_batch(chunk)))
+        elapsed = (time.perf_counter() - t0) * 1000
+        times.extend([elapsed / len(chunk)] * len(chunk))
+    return np.concatenate(probs, axis=0), times
+
+
+def top_k(probs, k=3):
+    # (N, k) class indices and probabilities, highest first
+    k = min(k, probs.shape[-1])
+    idx = np.argpartition(-probs, k - 1, axis=-1)[:, :k]
+    values = np.take_along_axis(probs, idx, axis=-1)
+    order = np.argsort(-values, axis=-1)
+    return np.take_along_axis(idx, order, axis=-1), np.take_along_axis(values, order, axis=-1)
+
+
+def open_uploads(uploaded_files):
+    # Flattens uploaded files and zip archives into (name, file-like) pairs
+    items = []
+    for uploaded in uploaded_files:
+        if uploaded.name.lower().endswith(".zip"):
+            for name, data in iter_zip_images(uploaded):
+                items.append((f"{uploaded.name}/{name}", io.BytesIO(data)))
+        else:
+            items.append((uploaded.name, uploaded))
+    return items
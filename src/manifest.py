@@ -0,0 +1,310 @@
+import argparse
+import hashlib
+import io
+import os
+import pathlib
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from src.inference import IMAGE_EXTENSIONS
+
+DEFAULT_INDEX_PATH = os.path.join("cache", "manifest.sqlite")
+SPLITS = ("train", "val", "test")
+
+# dHash bits that may differ for two images to count as near-duplicates (out of 64)
+NEAR_THRESHOLD = 6
+
+# Bumped when stored values change meaning; an older index is rebuilt from scratch.
+# 2: absolute paths, folder mtimes for the freshness check
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    path TEXT PRIMARY KEY, split_dir TEXT, split TEXT, class TEXT, size INTEGER, mtime_ns INTEGER,
+    width INTEGER, height INTEGER, sha256 TEXT, dhash INTEGER, error TEXT
+);
+CREATE INDEX IF NOT EXISTS images_split_dir ON images (split_dir, class, path);
+CREATE TABLE IF NOT EXISTS classes (split_dir TEXT, name TEXT, PRIMARY KEY (split_dir, name));
+CREATE TABLE IF NOT EXISTS duplicates (
+    path_a TEXT, path_b TEXT, kind TEXT, distance INTEGER, cross_split INTEGER
+);
+CREATE TABLE IF NOT EXISTS folders (split_dir TEXT, path TEXT, mtime_ns INTEGER, PRIMARY KEY (split_dir, path));
+"""
+
+
+def scan_split(directory):
+    """Walk a split folder and return (filepaths, labels, class_indices).
+
+    Class folders are sorted alphanumerically, exactly like
+    flow_from_directory, so label i matches CLASS_NAMES[i] in the app.
+    """
+    class_names = sorted(
+        d for d in os.listdir(directory) if os.path.isdir(os.path.join(directory, d))
+    )
+    class_indices = {name: i for i, name in enumerate(class_names)}
+
+    filepaths, labels = [], []
+    for name in class_names:
+        class_dir = os.path.join(directory, name)
+        for root, _, files in sorted(os.walk(class_dir)):
+            for fname in sorted(files):
+                if fname.lower().endswith(IMAGE_EXTENSIONS):
+                    filepaths.append(os.path.join(root, fname))
+                    labels.append(class_indices[name])
+    return filepaths, labels, class_indices
+
+
+def _split_key(directory):
+    return os.path.abspath(os.path.normpath(directory))
+
+
+def folder_mtimes(directory):
+    # Adding, removing or renaming a file changes its folder's mtime, so these show a stale index
+    mtimes = {}
+    for root, dirs, _ in os.walk(_split_key(directory)):
+        dirs.sort()
+        mtimes[root] = os.stat(root).st_mtime_ns
+    return mtimes
+
+
+def _is_fresh(db, key):
+    # Only stats the folders recorded at indexing time, no directory listing
+    for path, mtime in db.execute("SELECT path, mtime_ns FROM folders WHERE split_dir = ?", (key,)):
+        try:
+            if os.stat(path).st_mtime_ns != mtime:
+                return False
+        except FileNotFoundError:
+            return False
+    return True
+
+
+def _open_current(index_path):
+    # Read-only connection, None when the index is missing or was written by an older version
+    if not os.path.exists(index_path):
+        return None
+    db = sqlite3.connect(f"{pathlib.Path(index_path).resolve().as_uri()}?mode=ro", uri=True)
+    (version,), = db.execute("PRAGMA user_version")
+    if version != SCHEMA_VERSION:
+        db.close()
+        return None
+    return db
+
+
+def dhash(image):
+    # 64-bit difference hash: is each pixel of a 9x8 grayscale thumbnail brighter than its left neighbour
+    small = np.asarray(image.convert("L").resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    value = int(np.packbits(small[:, 1:] > small[:, :-1]).view(">u8")[0])
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def describe(path):
+    """(size, mtime_ns, width, height, sha256, dhash, error) for one file."""
+    stat = os.stat(path)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        sha = hashlib.sha256(data).hexdigest()
+        with Image.open(io.BytesIO(data)) as image:
+            width, height = image.size
+            # JPEG draft mode decodes at 1/2..1/8 scale, plenty for a 9x8 hash
+            image.draft("RGB", (64, 64))
+            return stat.st_size, stat.st_mtime_ns, width, height, sha, dhash(image), None
+    except Exception as e:
+        return stat.st_size, stat.st_mtime_ns, None, None, None, None, f"{type(e).__name__}: {e}"
+
+
+def connect(index_path=DEFAULT_INDEX_PATH):
+    os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+    db = sqlite3.connect(index_path, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    (version,), = db.execute("PRAGMA user_version")
+    if version != SCHEMA_VERSION:
+        db.executescript("DROP TABLE IF EXISTS images; DROP TABLE IF EXISTS classes;"
+                         " DROP TABLE IF EXISTS duplicates; DROP TABLE IF EXISTS folders;")
+        db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    db.executescript(SCHEMA)
+    return db
+
+
+def _hash_bits(hashes):
+    return np.unpackbits(np.asarray(hashes, dtype=np.int64).astype(">i8").view(np.uint8).reshape(-1, 8), axis=1)
+
+
+def find_duplicates(rows, near_threshold=NEAR_THRESHOLD, chunk=1024):
+    """Exact (same sha256) and near (dHash within near_threshold bits) pairs.
+
+    rows are (path, split, sha256, dhash). Hamming distances are computed
+    chunk by chunk as two small matrix products over the unpacked bits.
+    Returns [(path_a, path_b, kind, distance, cross_split)].
+    """
+    pairs = []
+    by_sha = {}
+    for path, split, sha, _ in rows:
+        by_sha.setdefault(sha, []).append((path, split))
+    for group in by_sha.values():
+        for i, (path_a, split_a) in enumerate(group):
+            for path_b, split_b in group[i + 1:]:
+                pairs.append((path_a, path_b, "exact", 0, int(split_a != split_b)))
+
+    if near_threshold <= 0 or len(rows) < 2:
+        return pairs
+    bits = _hash_bits([r[3] for r in rows]).astype(np.float32)
+    for start in range(0, len(rows), chunk):
+        block = bits[start:start + chunk]
+        distance = block @ (1 - bits).T + (1 - block) @ bits.T
+        for i, j in zip(*np.nonzero(distance <= near_threshold)):
+            i += start
+            if j <= i or rows[i][2] == rows[j][2]:
+                continue
+            cross_split = int(rows[i][1] != rows[j][1])
+            pairs.append((rows[i][0], rows[j][0], "near", int(distance[i - start, j]), cross_split))
+    return pairs
+
+
+def build_index(data_dir="data", splits=SPLITS, index_path=DEFAULT_INDEX_PATH, workers=None,
+                near_threshold=NEAR_THRESHOLD, verbose=False):
+    """Create or refresh the index for data_dir/<split>/<class>/*.
+
+    Files whose (size, mtime) are unchanged keep their row; new or modified
+    files are hashed on a thread pool; removed files drop out. Duplicate
+    pairs are recomputed over the whole index afterwards. Paths are stored
+    absolute, together with the mtime of every folder of the split, which
+    readers check before trusting the index.
+    """
+    start = time.perf_counter()
+    db = connect(index_path)
+    known = {path: (split_dir, size, mtime)
+             for path, split_dir, size, mtime in db.execute("SELECT path, split_dir, size, mtime_ns FROM images")}
+
+    seen, scanned, todo = set(), set(), []
+    for split in splits:
+        split_dir = os.path.join(data_dir, split)
+        if not os.path.isdir(split_dir):
+            continue
+        key = _split_key(split_dir)
+        scanned.add(key)
+        filepaths, labels, class_indices = scan_split(split_dir)
+        db.execute("DELETE FROM classes WHERE split_dir = ?", (key,))
+        db.executemany("INSERT INTO classes VALUES (?, ?)", [(key, name) for name in class_indices])
+        db.execute("DELETE FROM folders WHERE split_dir = ?", (key,))
+        db.executemany("INSERT INTO folders VALUES (?, ?, ?)",
+                       [(key, path, mtime) for path, mtime in folder_mtimes(split_dir).items()])
+        names = list(class_indices)
+        for path, label in zip(filepaths, labels):
+            path = os.path.abspath(path)
+            seen.add(path)
+            stat = os.stat(path)
+            if known.get(path) != (key, stat.st_size, stat.st_mtime_ns):
+                todo.append((path, key, split, names[label]))
+
+    with ThreadPoolExecutor(max_workers=workers or min(32, (os.cpu_count() or 1) + 4)) as pool:
+        described = pool.map(lambda item: describe(item[0]), todo)
+        db.executemany(
+            "INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(*item, *info) for item, info in zip(todo, described)],
+        )
+    removed = [(path,) for path, (split_dir, _, _) in known.items() if split_dir in scanned and path not in seen]
+    db.executemany("DELETE FROM images WHERE path = ?", removed)
+
+    rows = db.execute("SELECT path, split, sha256, dhash FROM images WHERE error IS NULL").fetchall()
+    db.execute("DELETE FROM duplicates")
+    db.executemany("INSERT INTO duplicates VALUES (?, ?, ?, ?, ?)", find_duplicates(rows, near_threshold))
+    db.commit()
+    if verbose:
+        print(f"{index_path}: {len(seen)} images, {len(todo)} hashed, {len(removed)} removed "
+              f"in {time.perf_counter() - start:.1f}s")
+    return db
+
+
+def split_files(index_path, directory, drop_leaks=True):
+    """(filepaths, labels, class_indices) for a split folder, like scan_split,
+    read from the index. Unreadable images are left out, and so are training
+    images that duplicate a val/test image when drop_leaks is set. Paths are
+    joined onto directory, so they look exactly like scan_split's.
+
+    Returns None when the index doesn't cover the folder, or when files
+    were added or removed since it was built (rerun python -m src.manifest).
+    """
+    key = _split_key(directory)
+    db = _open_current(index_path)
+    if db is None:
+        return None
+    try:
+        class_names = [r[0] for r in db.execute(
+            "SELECT name FROM classes WHERE split_dir = ? ORDER BY name", (key,))]
+        if not class_names or not _is_fresh(db, key):
+            return None
+        query = "SELECT path, class, split FROM images WHERE split_dir = ? AND error IS NULL"
+        if drop_leaks:
+            query += (" AND NOT (split = 'train' AND path IN"
+                      " (SELECT path_a FROM duplicates WHERE cross_split UNION"
+                      "  SELECT path_b FROM duplicates WHERE cross_split))")
+        rows = db.execute(query + " ORDER BY class, path", (key,)).fetchall()
+    finally:
+        db.close()
+    class_indices = {name: i for i, name in enumerate(class_names)}
+    paths = [os.path.join(directory, os.path.relpath(r[0], key)) for r in rows]
+    return paths, [class_indices[r[1]] for r in rows], class_indices
+
+
+def class_samples(index_path, directory, per_class=1):
+    # {class: [paths]} with the first per_class readable images of every class; {} if the index is stale
+    key = _split_key(directory)
+    db = _open_current(index_path)
+    if db is None:
+        return {}
+    try:
+        if not _is_fresh(db, key):
+            return {}
+        rows = db.execute(
+            "SELECT class, path FROM (SELECT class, path,"
+            " ROW_NUMBER() OVER (PARTITION BY class ORDER BY path) AS n"
+            " FROM images WHERE split_dir = ? AND error IS NULL) WHERE n <= ? ORDER BY class, path",
+            (key, per_class),
+        ).fetchall()
+    finally:
+        db.close()
+    samples = {}
+    for name, path in rows:
+        samples.setdefault(name, []).append(os.path.join(directory, os.path.relpath(path, key)))
+    return samples
+
+
+def report(db):
+    counts = db.execute("SELECT split, class, COUNT(*) FROM images GROUP BY split, class ORDER BY split, class")
+    for split, name, count in counts:
+        print(f"{split:>6} {name}: {count}")
+    for path, error in db.execute("SELECT path, error FROM images WHERE error IS NOT NULL ORDER BY path"):
+        print(f"unreadable: {path} ({error})")
+    for path_a, path_b, kind, distance in db.execute(
+            "SELECT path_a, path_b, kind, distance FROM duplicates WHERE cross_split ORDER BY kind, path_a"):
+        print(f"leak ({kind}, {distance} bits): {path_a} <-> {path_b}")
+    (errors,), = db.execute("SELECT COUNT(*) FROM images WHERE error IS NOT NULL")
+    summary = dict(db.execute(
+        "SELECT kind || CASE WHEN cross_split THEN ' across splits' ELSE ' within a split' END, COUNT(*)"
+        " FROM duplicates GROUP BY 1"))
+    print(f"{errors} unreadable images; duplicate pairs: {summary or 'none'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index the dataset: hashes, sizes, duplicates and leakage")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--splits", nargs="+", default=list(SPLITS))
+    parser.add_argument("--index", default=DEFAULT_INDEX_PATH)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--near-threshold", type=int, default=NEAR_THRESHOLD,
+                        help="max differing dHash bits for a near-duplicate, 0 to skip")
+    args = parser.parse_args()
+
+    db = build_index(args.data_dir, args.splits, args.index, args.workers, args.near_threshold, verbose=True)
+    report(db)
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Where a classification spends its time, in order. Every stage is recorded
+# once per image; "model" and "postprocess" are the batch's time divided by
+# its size, queue_wait is how long that image's request waited.
+STAGES = ("decode", "preprocess", "queue_wait", "model", "postprocess")
+
+# Upper bounds in seconds, Prometheus style; the last bucket (+Inf) is implicit
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRIC_NAME = "fish_inference_stage_seconds"
+
+
+class Histogram:
+    """Fixed-bucket latency histogram: O(1) memory, one bisect per observation."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def copy(self):
+        h = Histogram(self.buckets)
+        h.counts, h.count, h.sum = self.counts[:], self.count, self.sum
+        return h
+
+    def quantile(self, q):
+        # Linear interpolation inside the bucket holding the q-th observation
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                low = self.buckets[i - 1] if i else 0.0
+                high = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return low + (high - low) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": self.sum / self.count * 1000 if self.count else 0.0,
+            **{f"p{int(q * 100)}_ms": self.quantile(q) * 1000 for q in (0.5, 0.95, 0.99)},
+        }
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class StageMetrics:
+    """Per-stage latency histograms, one per (model, stage). Safe to use from several threads."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def observe(self, stage, seconds, model=""):
+        with self.lock:
+            key = (model, stage)
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(self.buckets)
+            self.histograms[key].observe(seconds)
+
+    def observe_many(self, timings, model=""):
+        # timings: {stage: seconds}, e.g. what load_image fills in
+        for stage, seconds in timings.items():
+            self.observe(stage, seconds, model)
+
+    @contextmanager
+    def timer(self, stage, model=""):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, model)
+
+    def _sorted(self):
+        order = {stage: i for i, stage in enumerate(STAGES)}
+        with self.lock:
+            # One consistent snapshot, so counts, count and sum always agree
+            items = [(key, h.copy()) for key, h in self.histograms.items()]
+        return sorted(items, key=lambda item: (item[0][0], order.get(item[0][1], len(order)), item[0][1]))
+
+    def to_prometheus(self):
+        lines = [f"# HELP {METRIC_NAME} Time spent in each inference stage.", f"# TYPE {METRIC_NAME} histogram"]
+        for (model, stage), h in self._sorted():
+            labels = f'model="{_label(model)}",stage="{_label(stage)}"'
+            cumulative = 0
+            for bound, n in zip((*self.buckets, "+Inf"), h.counts):
+                cumulative += n
+                lines.append(f'{METRIC_NAME}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{METRIC_NAME}_sum{{{labels}}} {h.sum}")
+            lines.append(f"{METRIC_NAME}_count{{{labels}}} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def to_json(self):
+        # {model: {stage: {"count", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "buckets"}}}
+        report = {}
+        for (model, stage), h in self._sorted():
+            report.setdefault(model, {})[stage] = dict(
+                h.summary(), buckets=dict(zip([*map(str, self.buckets), "+Inf"], h.counts)))
+        return report
+
+    def write(self, path):
+        # .prom/.txt gets the Prometheus text format (node_exporter textfile collector), anything else JSON
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            if path.endswith((".prom", ".txt")):
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.to_json(), f, indent=2)
+        os.replace(tmp_path, path)
+
+    def print_summary(self):
+        for model, stages in self.to_json().items():
+            parts = [f"{stage} p50 {s['p50_ms']:.1f} / p95 {s['p95_ms']:.1f} ms" for stage, s in stages.items()]
+            print(f"{model or 'all'}: " + ", ".join(parts))
+
+
+class TraceCapture:
+    """TensorFlow profiler trace of the next num_requests requests, viewable in TensorBoard.
+
+    Wrap each request in step(); the trace starts with the first one and
+    stops after the last. A no-op once done or when num_requests is 0.
+    """
+
+    def __init__(self, logdir, num_requests):
+        self.logdir = logdir
+        self.remaining = num_requests
+        self.active = 0
+        self.running = False
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def step(self):
+        with self.lock:
+            traced = self.remaining > 0
+            if traced:
+                self.remaining -= 1
+                self.active += 1
+                if not self.running:
+                    import tensorflow as tf
+                    tf.profiler.experimental.start(self.logdir)
+                    self.running = True
+        try:
+            yield
+        finally:
+            if traced:
+                with self.lock:
+                    self.active -= 1
+                    if self.running and not self.remaining and not self.active:
+                        import tensorflow as tf
+                        tf.profiler.experimental.stop()
+                        self.running = False
+                        print(f"Profiler trace written to {self.logdir}")
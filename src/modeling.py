@@ -0,0 +1,231 @@
+import argparse
+import csv
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import layers
+
+NUM_CLASSES = 9
+IMAGE_SIZE = (224, 224)
+
+BACKBONES = {
+    "vgg16": tf.keras.applications.VGG16,
+    "resnet50": tf.keras.applications.ResNet50,
+    "mobilenetv2": tf.keras.applications.MobileNetV2,
+    "efficientnetb0": tf.keras.applications.EfficientNetB0,
+}
+
+# flatten:     Flatten -> Dense(units) -> Dropout, the notebook's VGG16/MobileNetV2 head
+# gap_mlp:     GlobalAveragePooling -> Dense(units) -> Dropout, the notebook's ResNet50/EfficientNet head
+# gap:         GlobalAveragePooling -> softmax
+# gap_dropout: GlobalAveragePooling -> Dropout -> softmax
+# attention:   softmax-weighted spatial pooling (one 1x1 conv score map) -> Dropout -> softmax
+HEADS = ("flatten", "gap_mlp", "gap", "gap_dropout", "attention")
+
+# Learning rates and fine-tuning as in the notebook. VGG16 and MobileNetV2 used
+# Flatten -> Dense(128), which on a 7x7x1280 map is ~8M parameters for one layer;
+# they now default to gap_dropout (pass head="flatten" to reproduce the notebook).
+# fine_tune_layers > 0 adds an unfrozen stage over the last N backbone layers.
+ARCHITECTURES = {
+    "cnn": {"backbone": None, "lr": 1e-3, "fine_tune_layers": 0, "fine_tune_lr": None},
+    "vgg16": {"backbone": "vgg16", "head": "gap_dropout", "units": 128, "dropout": 0.5,
+              "lr": 1e-3, "fine_tune_layers": 0, "fine_tune_lr": None},
+    "resnet50": {"backbone": "resnet50", "head": "gap_mlp", "units": 256, "dropout": 0.3,
+                 "lr": 1e-4, "fine_tune_layers": 30, "fine_tune_lr": 1e-5},
+    "mobilenetv2": {"backbone": "mobilenetv2", "head": "gap_dropout", "units": 128, "dropout": 0.5,
+                    "lr": 1e-3, "fine_tune_layers": 0, "fine_tune_lr": None},
+    "efficientnetb0": {"backbone": "efficientnetb0", "head": "gap_mlp", "units": 256, "dropout": 0.3,
+                       "lr": 1e-4, "fine_tune_layers": 20, "fine_tune_lr": 1e-5},
+}
+
+
+def build_backbone(name, image_size=IMAGE_SIZE, weights="imagenet"):
+    # ImageNet feature extractor without its classifier, frozen
+    base = BACKBONES[name](weights=weights, include_top=False, input_shape=(*image_size, 3))
+    base.trainable = False
+    return base
+
+
+def attention_pool(inputs):
+    # One score per spatial position, softmax over positions, weighted sum of the channels
+    height, width, channels = inputs.shape[1:]
+    scores = layers.Conv2D(1, 1, name="attention_scores")(inputs)
+    # float32 even under mixed precision: bfloat16 is too coarse for a softmax over all positions
+    weights = layers.Softmax(name="attention_weights", dtype="float32")(layers.Reshape((height * width,))(scores))
+    features = layers.Reshape((height * width, channels))(inputs)
+    return layers.Dot(axes=1, name="attention_pool")([weights, features])
+
+
+def build_head(feature_shape, num_classes=NUM_CLASSES, head="gap_mlp", units=256, dropout=0.3):
+    """Classifier that runs on backbone feature maps.
+
+    Kept as its own model so it can be trained on cached features and
+    then stacked on the backbone unchanged. See HEADS for the options.
+    """
+    if head not in HEADS:
+        raise ValueError(f"Unknown head {head!r}, expected one of {HEADS}")
+    inputs = tf.keras.Input(shape=feature_shape)
+    if head == "flatten":
+        x = layers.Flatten()(inputs)
+    elif head == "attention":
+        x = attention_pool(inputs)
+    else:
+        x = layers.GlobalAveragePooling2D()(inputs)
+    if head in ("flatten", "gap_mlp"):
+        x = layers.Dense(units, activation="relu")(x)
+    if head != "gap":
+        x = layers.Dropout(dropout)(x)
+    # The output layer stays float32 under mixed precision so the softmax and the loss are exact
+    outputs = layers.Dense(num_classes, activation="softmax", dtype="float32")(x)
+    return tf.keras.Model(inputs, outputs, name="head")
+
+
+def assemble(backbone, head, name=None):
+    # backbone + head as one image -> probabilities model
+    return tf.keras.Model(backbone.input, head(backbone.output), name=name)
+
+
+def build_model(arch, image_size=IMAGE_SIZE, num_classes=NUM_CLASSES, weights="imagenet", **overrides):
+    """Build any architecture at any input resolution, e.g. build_model("mobilenetv2", (160, 160), head="attention").
+
+    overrides replace entries of ARCHITECTURES[arch] (head, units, dropout, ...).
+    """
+    cfg = dict(ARCHITECTURES[arch], **overrides)
+    if cfg["backbone"] is None:
+        return build_cnn(image_size, num_classes)
+    backbone = build_backbone(cfg["backbone"], image_size, weights)
+    head = build_head(backbone.output_shape[1:], num_classes, cfg["head"], cfg["units"], cfg["dropout"])
+    return assemble(backbone, head, name=f"{arch}_{cfg['head']}_{image_size[0]}")
+
+
+def build_cnn(image_size=IMAGE_SIZE, num_classes=NUM_CLASSES):
+    # The notebook's from-scratch CNN
+    model = tf.keras.Sequential([
+        tf.keras.Input(shape=(*image_size, 3)),
+        layers.Conv2D(32, (3, 3), activation="relu"),
+        layers.MaxPooling2D(2, 2),
+        layers.Conv2D(64, (3, 3), activation="relu"),
+        layers.MaxPooling2D(2, 2),
+        layers.Conv2D(128, (3, 3), activation="relu"),
+        layers.MaxPooling2D(2, 2),
+        layers.Flatten(),
+        layers.Dense(128, activation="relu"),
+        layers.Dropout(0.5),
+        layers.Dense(num_classes, activation="softmax", dtype="float32"),
+    ], name="cnn")
+    return model
+
+
+def unfreeze_top(backbone, num_layers):
+    # Same scheme as the notebook's fine-tuning cells
+    backbone.trainable = True
+    for layer in backbone.layers[:-num_layers]:
+        layer.trainable = False
+
+
+def compile_model(model, lr, jit_compile="auto"):
+    # jit_compile=True runs each train step as one XLA cluster; Keras' "auto" leaves it off on CPU
+    model.compile(
+        optimizer=tf.keras.optimizers.Adam(learning_rate=lr),
+        loss="categorical_crossentropy",
+        metrics=["accuracy"],
+        jit_compile=jit_compile,
+    )
+    return model
+
+
+def count_flops(model):
+    """Multiply-accumulates of one forward pass at batch size 1, times two.
+
+    Counted analytically from the conv and dense layers (nested models
+    included), which is where nearly all of the work is.
+    """
+    flops = 0
+    for layer in model.layers:
+        if isinstance(layer, tf.keras.Model):
+            flops += count_flops(layer)
+            continue
+        output_shape = layer.output.shape
+        if isinstance(layer, layers.DepthwiseConv2D):
+            kh, kw = layer.kernel_size
+            flops += 2 * kh * kw * int(np.prod(output_shape[1:]))
+        elif isinstance(layer, layers.SeparableConv2D):
+            kh, kw = layer.kernel_size
+            in_channels = layer.input.shape[-1]
+            flops += 2 * int(np.prod(output_shape[1:3])) * in_channels * (kh * kw + layer.filters)
+        elif isinstance(layer, layers.Conv2D):
+            kh, kw = layer.kernel_size
+            in_channels = layer.input.shape[-1] // layer.groups
+            flops += 2 * kh * kw * in_channels * int(np.prod(output_shape[1:]))
+        elif isinstance(layer, layers.Dense):
+            flops += 2 * layer.input.shape[-1] * output_shape[-1]
+        elif isinstance(layer, layers.Dot):
+            flops += 2 * int(np.prod(layer.input[1].shape[1:]))
+    return flops
+
+
+def measure_latency(model, image_size, runs=30):
+    # Warm batch-1 latency of an in-memory model or a backend, in ms
+    from src.benchmark import percentiles
+    from src.preprocessing import takes_raw_pixels, to_model_input
+
+    image = np.random.default_rng(0).integers(0, 256, (1, *image_size, 3), dtype=np.uint8)
+    if isinstance(model, tf.keras.Model):
+        # Backends convert on their own; a bare model gets exactly what it expects
+        image = to_model_input(image, takes_raw_pixels(model))
+    model.predict_on_batch(image)
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        model.predict_on_batch(image)
+        samples.append((time.perf_counter() - start) * 1000)
+    return percentiles(samples)
+
+
+def profile_variants(archs, heads, sizes, runs=30):
+    """Parameters, FLOPs and CPU latency for every (arch, head, size) combination.
+
+    Weights are random: none of the three depend on the trained values.
+    """
+    rows = []
+    for arch in archs:
+        # The scratch CNN has no head to swap
+        for head in heads if ARCHITECTURES[arch]["backbone"] else [None]:
+            for size in sizes:
+                overrides = {"head": head} if head else {}
+                model = build_model(arch, (size, size), weights=None, **overrides)
+                latency = measure_latency(model, (size, size), runs)
+                rows.append({
+                    "arch": arch, "head": head or "-", "image_size": size,
+                    "params": int(model.count_params()),
+                    "head_params": int(model.get_layer("head").count_params()) if head else None,
+                    "mflops": count_flops(model) / 1e6, **latency,
+                })
+                print(f"{arch:>15} {head or '-':>12} {size:>4}: {rows[-1]['params'] / 1e6:6.2f}M params, "
+                      f"{rows[-1]['mflops']:8.1f} MFLOPs, p50 {latency['p50_ms']:.1f}ms")
+                tf.keras.backend.clear_session()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare parameter count, FLOPs and CPU latency of model variants")
+    parser.add_argument("--archs", nargs="+", default=list(ARCHITECTURES), choices=list(ARCHITECTURES))
+    parser.add_argument("--heads", nargs="+", default=list(HEADS), choices=list(HEADS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[160, 192, 224])
+    parser.add_argument("--runs", type=int, default=30, help="timed batch-1 predictions per variant")
+    parser.add_argument("--output", default=os.path.join("reports", "model_variants.csv"))
+    args = parser.parse_args()
+
+    rows = profile_variants(args.archs, args.heads, args.sizes, args.runs)
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"Wrote {len(rows)} variants to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
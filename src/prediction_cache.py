@@ -0,0 +1,105 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def model_identity(model_path):
+    # Changes whenever the model file is replaced, so stale predictions are never served
+    try:
+        stat = os.stat(model_path)
+    except OSError:
+        return os.path.basename(model_path)
+    return f"{os.path.basename(model_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def image_key(data, model_id):
+    return hashlib.sha256(data).hexdigest() + "|" + model_id
+
+
+class PredictionCache:
+    """Bounded LRU of probability vectors keyed by image hash + model identity.
+
+    With db_path set, entries are also written through to a SQLite file so
+    they survive restarts and can be shared between the app and the batch
+    scorer. Safe to use from several threads.
+    """
+
+    def __init__(self, max_entries=4096, db_path=None):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.db = None
+        if db_path:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS predictions (key TEXT PRIMARY KEY, probs BLOB)")
+            self.db.commit()
+
+    def _remember(self, key, probs):
+        self.entries[key] = probs
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def get(self, key):
+        with self.lock:
+            probs = self.entries.get(key)
+            if probs is not None:
+                self.entries.move_to_end(key)
+            elif self.db is not None:
+                row = self.db.execute("SELECT probs FROM predictions WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    probs = np.frombuffer(row[0], dtype=np.float32)
+                    self._remember(key, probs)
+            if probs is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return probs
+
+    def put(self, key, probs):
+        self.put_many([(key, probs)])
+
+    def put_many(self, items):
+        items = [(key, np.asarray(probs, dtype=np.float32)) for key, probs in items]
+        with self.lock:
+            for key, probs in items:
+                self._remember(key, probs)
+            if self.db is not None:
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO predictions (key, probs) VALUES (?, ?)",
+                    [(key, probs.tobytes()) for key, probs in items],
+                )
+                self.db.commit()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0}
+
+
+def split_cached(cache, keys):
+    """Look keys up in the cache.
+
+    Returns (known, todo): known maps key -> probs for every hit, todo lists
+    the index of the first occurrence of each missing key, so duplicates
+    within one request are only predicted once.
+    """
+    known, todo, seen = {}, [], set()
+    for i, key in enumerate(keys):
+        if key in known or key in seen:
+            continue
+        probs = cache.get(key)
+        if probs is None:
+            seen.add(key)
+            todo.append(i)
+        else:
+            known[key] = probs
+    return known, todo
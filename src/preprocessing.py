@@ -0,0 +1,122 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+IMAGE_SIZE = (224, 224)
+
+# uint8 [0, 255] -> float [0, 1]. Used by the tf.data pipelines and by the
+# Rescaling layer at the front of every saved model, so both sides compute
+# exactly the same values.
+PIXEL_SCALE = 1.0 / 255.0
+
+
+def load_image(source, image_size=IMAGE_SIZE, timings=None):
+    """Decode a path, file-like object or PIL image into a uint8 (H, W, 3) array.
+
+    Large JPEGs are decoded at 1/2, 1/4 or 1/8 scale (PIL draft mode) as
+    long as that stays at least image_size, then resized bilinearly. This is
+    the only resize used for training, evaluation and serving. A timings
+    dict gets the seconds spent in "decode" and "preprocess" (convert and
+    resize).
+    """
+    start = time.perf_counter()
+    image = source if isinstance(source, Image.Image) else Image.open(source)
+    height, width = image_size
+    # No-op for other formats and for images that are already loaded
+    image.draft("RGB", (width, height))
+    image.load()
+    decoded = time.perf_counter()
+    image = image.convert("RGB")
+    if image.size != (width, height):
+        image = image.resize((width, height), Image.BILINEAR)
+    array = np.asarray(image, dtype=np.uint8)
+    if timings is not None:
+        timings["decode"] = decoded - start
+        timings["preprocess"] = time.perf_counter() - decoded
+    return array
+
+
+def load_batch(sources, image_size=IMAGE_SIZE, workers=None, metrics=None, model=""):
+    """Decode many images on a thread pool straight into one uint8 batch.
+
+    Returns the (N, H, W, 3) batch, the load time of each image in ms and
+    each image's error message (None when it decoded). An unreadable image
+    leaves its row zeroed instead of failing the whole batch. With metrics
+    (src.metrics.StageMetrics), decode and preprocess times are recorded
+    under model as well.
+    """
+    batch = np.empty((len(sources), *image_size, 3), dtype=np.uint8)
+    times = [0.0] * len(sources)
+    errors = [None] * len(sources)
+
+    def fill(i):
+        start = time.perf_counter()
+        timings = {}
+        try:
+            batch[i] = load_image(sources[i], image_size, timings)
+        except Exception as e:
+            batch[i] = 0
+            errors[i] = str(e)
+            return
+        times[i] = (time.perf_counter() - start) * 1000
+        if metrics is not None:
+            metrics.observe_many(timings, model)
+
+    with ThreadPoolExecutor(max_workers=workers or min(32, (os.cpu_count() or 1) + 4)) as pool:
+        list(pool.map(fill, range(len(sources))))
+    return batch, times, errors
+
+
+def resize_batch(batch, size):
+    """Resize an (N, H, W, 3) batch to size, keeping its dtype; a no-op when it already fits."""
+    if tuple(batch.shape[1:3]) == tuple(size):
+        return batch
+    import tensorflow as tf
+
+    resized = tf.image.resize(batch, size).numpy()
+    if batch.dtype == np.uint8:
+        return np.clip(np.rint(resized), 0, 255).astype(np.uint8)
+    return resized
+
+
+def to_model_input(batch, raw_pixels):
+    """Convert a batch to what a model expects.
+
+    Models that start with the rescaling layer take uint8 pixels; older
+    models take float [0, 1]. uint8 input is always accepted and float
+    input is assumed to already be in [0, 1].
+    """
+    batch = np.asarray(batch)
+    if raw_pixels:
+        if batch.dtype == np.uint8:
+            return batch
+        return np.clip(np.rint(batch * 255.0), 0, 255).astype(np.uint8)
+    if batch.dtype == np.uint8:
+        return batch.astype(np.float32) * np.float32(PIXEL_SCALE)
+    return batch.astype(np.float32, copy=False)
+
+
+def with_rescaling(model):
+    """Wrap a model that expects [0, 1] floats so it takes uint8 pixels.
+
+    The division happens in the graph, so callers only hand over the uint8
+    array they decoded.
+    """
+    import tensorflow as tf
+
+    inputs = tf.keras.Input(shape=model.input_shape[1:], dtype="uint8", name="pixels")
+    x = tf.keras.layers.Rescaling(PIXEL_SCALE, name="rescale")(inputs)
+    return tf.keras.Model(inputs, model(x), name=model.name)
+
+
+def takes_raw_pixels(model):
+    # True for models built by with_rescaling (uint8 input, Rescaling first)
+    import tensorflow as tf
+
+    layers = [layer for layer in model.layers if not isinstance(layer, tf.keras.layers.InputLayer)]
+    if not layers or not isinstance(layers[0], tf.keras.layers.Rescaling):
+        return False
+    return bool(np.isclose(float(layers[0].scale), PIXEL_SCALE))
@@ -0,0 +1,184 @@
+import argparse
+import gc
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from src.backends import load_backend, read_metadata, tflite_variants
+from src.benchmark import discover_models, display_name
+from src.inference import CLASS_NAMES
+
+DEFAULT_MODELS_DIR = "models"
+DEFAULT_MODEL = "Best model"
+
+# Budget for resident models, overridden by FISH_MODEL_MEMORY_MB. All five
+# notebook models together need well over this, mostly because of VGG16.
+DEFAULT_MEMORY_MB = 1024
+
+# size_mb is the file size, used as the estimate of a loaded model's memory
+ModelInfo = namedtuple("ModelInfo", ["name", "path", "size_mb", "class_names", "input_size", "version", "metadata"])
+
+
+def source_model(model_path):
+    # The Keras model an exported TFLite variant came from (itself for a Keras model), or None
+    if not model_path.lower().endswith(".tflite"):
+        return model_path
+    source = os.path.splitext(model_path)[0].rsplit("_", 1)[0] + ".keras"
+    if model_path in tflite_variants(source).values() and os.path.exists(source):
+        return source
+    return None
+
+
+def model_metadata(model_path):
+    # The model's own sidecar; exported TFLite variants fall back to their Keras model's
+    metadata = read_metadata(model_path)
+    source = source_model(model_path)
+    if not metadata and source not in (None, model_path):
+        metadata = read_metadata(source)
+    return metadata
+
+
+def describe(model_path):
+    metadata = model_metadata(model_path)
+    size = metadata.get("image_size")
+    version = metadata.get("version") or time.strftime(
+        "%Y%m%d-%H%M%S", time.localtime(os.path.getmtime(model_path)))
+    return ModelInfo(display_name(model_path), os.path.normpath(model_path), os.path.getsize(model_path) / 1e6,
+                     metadata.get("class_names") or CLASS_NAMES, (size, size) if size else None, version, metadata)
+
+
+def discover(models_dir=DEFAULT_MODELS_DIR):
+    """{name: ModelInfo} for every .keras/.tflite file in models_dir, without loading any."""
+    return OrderedDict((info.name, info) for info in map(describe, discover_models(models_dir)))
+
+
+def resolve(name_or_path, models_dir=DEFAULT_MODELS_DIR):
+    # CLI helper: an existing file is used as is, anything else is looked up by name
+    if os.path.exists(name_or_path):
+        return name_or_path
+    models = discover(models_dir)
+    if name_or_path not in models:
+        raise ValueError(f"No model file or name {name_or_path!r} in {models_dir}/ (known: {', '.join(models)})")
+    return models[name_or_path].path
+
+
+class ModelRegistry:
+    """Models by name, loaded on first use and kept under a memory budget.
+
+    Before a model is loaded, the least recently used ones are dropped until
+    it fits in memory_mb (estimated from file sizes, counting models other
+    threads are still loading); a model larger than the whole budget is
+    still served on its own. Fetch the model with get() for each request
+    instead of keeping it, otherwise eviction can't free it.
+    Safe to use from several threads; concurrent get() calls for the same
+    model load it once.
+    """
+
+    def __init__(self, models_dir=DEFAULT_MODELS_DIR, memory_mb=None, loader=load_backend):
+        self.models_dir = models_dir
+        if memory_mb is None:
+            memory_mb = float(os.environ.get("FISH_MODEL_MEMORY_MB", DEFAULT_MEMORY_MB))
+        self.memory_mb = memory_mb
+        self.loader = loader
+        self.lock = threading.Lock()
+        self.loading = {}
+        # Models being loaded right now count against the budget too
+        self.in_flight = {}
+        self.resident = OrderedDict()
+        self.loads = 0
+        self.evictions = 0
+        self.hits = 0
+        self.refresh()
+
+    def refresh(self):
+        # Pick up models added to or removed from models_dir
+        self.models = discover(self.models_dir)
+
+    def names(self):
+        return list(self.models)
+
+    def info(self, name_or_path):
+        if name_or_path in self.models:
+            return self.models[name_or_path]
+        path = os.path.normpath(name_or_path)
+        for info in self.models.values():
+            if info.path == path:
+                return info
+        if os.path.exists(path):
+            return describe(path)
+        raise KeyError(f"Unknown model {name_or_path!r}, expected one of {self.names()}")
+
+    def get(self, name_or_path):
+        info = self.info(name_or_path)
+        with self.lock:
+            if info.path in self.resident:
+                self.resident.move_to_end(info.path)
+                self.hits += 1
+                return self.resident[info.path][0]
+            loading = self.loading.setdefault(info.path, threading.Lock())
+
+        with loading:
+            with self.lock:
+                # Another thread may have finished loading it while we waited
+                if info.path in self.resident:
+                    self.resident.move_to_end(info.path)
+                    self.hits += 1
+                    return self.resident[info.path][0]
+                evicted = self._make_room(info.size_mb)
+                self.in_flight[info.path] = info.size_mb
+            if evicted:
+                gc.collect()
+            try:
+                model = self.loader(info.path)
+            finally:
+                with self.lock:
+                    del self.in_flight[info.path]
+            with self.lock:
+                self.resident[info.path] = (model, info.size_mb)
+                self.loads += 1
+        return model
+
+    def _make_room(self, size_mb):
+        evicted = 0
+        size_mb += sum(self.in_flight.values())
+        while self.resident and self.resident_mb() + size_mb > self.memory_mb:
+            self.resident.popitem(last=False)
+            evicted += 1
+        self.evictions += evicted
+        return evicted
+
+    def resident_mb(self):
+        return sum(size for _, size in self.resident.values())
+
+    def stats(self):
+        with self.lock:
+            return {
+                "resident": [self.info(path).name for path in self.resident],
+                "resident_mb": self.resident_mb(),
+                "loading_mb": sum(self.in_flight.values()),
+                "memory_mb": self.memory_mb,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "hits": self.hits,
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List the models the app and the server can pick by name")
+    parser.add_argument("--models-dir", default=DEFAULT_MODELS_DIR)
+    args = parser.parse_args()
+
+    models = discover(args.models_dir)
+    if not models:
+        print(f"No models in {args.models_dir}/")
+        return
+    width = max(len(name) for name in models)
+    for name, info in models.items():
+        size = f"{info.input_size[0]}x{info.input_size[1]}" if info.input_size else "?"
+        print(f"{name:<{width}}  {info.size_mb:8.1f} MB  input {size:>7}  {len(info.class_names)} classes  "
+              f"version {info.version}  {info.path}")
+
+
+if __name__ == "__main__":
+    main()
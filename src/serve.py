@@ -0,0 +1,321 @@
+import argparse
+import io
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+from PIL import Image
+
+from src.backends import BACKENDS, load_backend
+from src.drift import DRIFT_THRESHOLD, WINDOW, monitor_key, open_monitor, print_report
+from src.drift import to_prometheus as drift_prometheus
+from src.inference import top_k
+from src.metrics import StageMetrics, TraceCapture
+from src.preprocessing import IMAGE_SIZE, load_image
+from src.registry import DEFAULT_MEMORY_MB, DEFAULT_MODEL, DEFAULT_MODELS_DIR, ModelRegistry
+REQUEST_TIMEOUT = 30
+
+
+class MicroBatcher:
+    """Collects concurrent requests into batches for a single model.
+
+    A worker thread takes the first waiting request, then keeps pulling
+    more until max_batch_size is reached or max_wait_ms has passed, and
+    runs them through one predict call. With metrics, each request's
+    queue_wait and its share of the batch's predict call are recorded. A
+    drift monitor sees each batch after its results have been handed out.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=32, max_wait_ms=5, metrics=None, model="", monitor=None):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.metrics = metrics
+        self.model = model
+        self.monitor = monitor
+        self.requests = queue.Queue()
+        self.batches_run = 0
+        self.images_run = 0
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def submit(self, array, size=None):
+        # array is one (H, W, C) image, size its original (width, height); returns a Future with its probabilities
+        future = Future()
+        self.requests.put((array, future, time.perf_counter(), size))
+        return future
+
+    def _collect(self):
+        batch = [self.requests.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            start = time.perf_counter()
+            try:
+                images = np.stack([array for array, _, _, _ in batch])
+                probs = np.asarray(self.predict_fn(images))
+            except Exception as e:
+                for _, future, _, _ in batch:
+                    future.set_exception(e)
+                continue
+            if self.metrics is not None:
+                elapsed = (time.perf_counter() - start) / len(batch)
+                for _, _, enqueued, _ in batch:
+                    self.metrics.observe("queue_wait", start - enqueued, self.model)
+                    self.metrics.observe("model", elapsed, self.model)
+            for (_, future, _, _), row in zip(batch, probs):
+                future.set_result(row)
+            self.batches_run += 1
+            self.images_run += len(batch)
+            if self.monitor is not None:
+                sizes = [size for _, _, _, size in batch]
+                # The results are already out; a monitor failure must not stop this worker thread
+                try:
+                    self.monitor.observe(probs, images, sizes if None not in sizes else None)
+                except Exception as e:
+                    print(f"Drift monitor for {self.model} skipped a batch: {e!r}")
+
+
+class InferenceServer(ThreadingHTTPServer):
+    # The default listen backlog of 5 resets connections under concurrent load
+    request_queue_size = 128
+
+
+def decode_request(data, image_size=IMAGE_SIZE, timings=None):
+    # uint8 pixels (the model rescales them itself) and the original (width, height)
+    image = Image.open(io.BytesIO(data))
+    return load_image(image, image_size, timings), image.size
+
+
+class ModelBatchers:
+    """One MicroBatcher per model name; the models themselves live in the registry.
+
+    Each batch fetches its model from the registry, so an idle model can be
+    evicted and is reloaded on its next request. Each model also gets a
+    drift monitor against its val-split baseline (python -m src.drift),
+    reopened when the model file or its baseline changes.
+    """
+
+    def __init__(self, registry, max_batch_size=32, max_wait_ms=5, metrics=None, drift_threshold=DRIFT_THRESHOLD,
+                 drift_window=WINDOW):
+        self.registry = registry
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.metrics = metrics if metrics is not None else StageMetrics()
+        self.drift_threshold = drift_threshold
+        self.drift_window = drift_window
+        self.batchers = {}
+        self.monitors = {}
+        self.monitor_keys = {}
+        self.lock = threading.Lock()
+
+    def _monitor(self, model_path, info):
+        # Called with the lock held; None while the current monitor still matches the files
+        key = monitor_key(model_path)
+        if self.monitor_keys.get(model_path) == key:
+            return None
+        self.monitor_keys[model_path] = key
+        monitor = open_monitor(model_path, len(info.class_names), self.drift_threshold, self.drift_window,
+                               on_drift=lambda report: print_report(report, info.name))
+        self.monitors[info.name] = monitor
+        return monitor
+
+    def get(self, model_path):
+        with self.lock:
+            info = self.registry.info(model_path)
+            monitor = self._monitor(model_path, info)
+            if model_path not in self.batchers:
+                def predict(batch):
+                    return self.registry.get(model_path).predict_on_batch(batch)
+                self.batchers[model_path] = MicroBatcher(predict, self.max_batch_size, self.max_wait_ms,
+                                                         self.metrics, info.name, monitor)
+            elif monitor is not None:
+                self.batchers[model_path].monitor = monitor
+            return self.batchers[model_path]
+
+    def drift(self):
+        with self.lock:
+            monitors = dict(self.monitors)
+        return {name: monitor.report() for name, monitor in monitors.items()}
+
+    def stats(self):
+        with self.lock:
+            return {self.registry.info(path).name: {
+                "queue_depth": b.requests.qsize(), "batches_run": b.batches_run, "images_run": b.images_run,
+                "avg_batch_size": b.images_run / max(b.batches_run, 1),
+            } for path, b in self.batchers.items()}
+
+
+def make_handler(batchers, default_model, trace=None):
+    registry = batchers.registry
+    metrics = batchers.metrics
+
+    class PredictHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status, payload):
+            self._send(status, json.dumps(payload).encode("utf-8"), "application/json")
+
+        def _send(self, status, body, content_type):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            path = url.path
+            if path == "/metrics":
+                # Prometheus text by default, ?format=json for p50/p95/p99 summaries
+                if parse_qs(url.query).get("format", [""])[0] == "json":
+                    self._send_json(200, metrics.to_json())
+                else:
+                    with batchers.lock:
+                        monitors = dict(batchers.monitors)
+                    text = metrics.to_prometheus() + drift_prometheus(monitors)
+                    self._send(200, text.encode("utf-8"), "text/plain; version=0.0.4")
+                return
+            if path == "/drift":
+                self._send_json(200, batchers.drift())
+                return
+            if path == "/models":
+                self._send_json(200, {name: {"path": info.path, "size_mb": info.size_mb, "version": info.version,
+                                             "input_size": info.input_size, "classes": len(info.class_names)}
+                                      for name, info in registry.models.items()})
+                return
+            if path != "/health":
+                self._send_json(404, {"error": "not found"})
+                return
+            self._send_json(200, {"status": "ok", "default_model": registry.info(default_model).name, "registry": registry.stats(),
+                                  "models": batchers.stats()})
+
+        def do_POST(self):
+            if trace is None:
+                self._predict()
+                return
+            with trace.step():
+                self._predict()
+
+        def _predict(self):
+            url = urlparse(self.path)
+            if url.path != "/predict":
+                self._send_json(404, {"error": "not found"})
+                return
+            params = parse_qs(url.query)
+            try:
+                k = int(params.get("top_k", ["3"])[0])
+                length = int(self.headers.get("Content-Length", 0))
+            except ValueError:
+                self._send_json(400, {"error": "top_k and Content-Length must be integers"})
+                return
+            if k < 1:
+                self._send_json(400, {"error": "top_k must be at least 1"})
+                return
+            try:
+                info = registry.info(params.get("model", [default_model])[0])
+            except KeyError as e:
+                self._send_json(404, {"error": str(e.args[0])})
+                return
+            if length <= 0:
+                self._send_json(400, {"error": "empty body, send the image bytes"})
+                return
+
+            # Decoding happens on this request's thread, only predict is batched
+            timings = {}
+            data = self.rfile.read(length)
+            try:
+                image_size = info.input_size or registry.get(info.path).input_size
+            except Exception as e:
+                self._send_json(500, {"error": f"could not load model {info.name}: {e}"})
+                return
+            try:
+                array, size = decode_request(data, image_size, timings)
+            except Exception as e:
+                self._send_json(400, {"error": f"could not decode image: {e}"})
+                return
+            metrics.observe_many(timings, info.name)
+            try:
+                probs = batchers.get(info.path).submit(array, size).result(timeout=REQUEST_TIMEOUT)
+            except Exception as e:
+                self._send_json(500, {"error": str(e)})
+                return
+
+            with metrics.timer("postprocess", info.name):
+                names = info.class_names
+                idx, values = top_k(probs[None], k)
+                self._send_json(200, {
+                    "model": info.name,
+                    "class": names[idx[0, 0]],
+                    "confidence": float(values[0, 0]),
+                    "top_k": [{"class": names[c], "probability": float(p)} for c, p in zip(idx[0], values[0])],
+                })
+
+        def log_message(self, format, *args):
+            # Keep per-request access logs out of the way
+            pass
+
+    return PredictHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP inference server with micro-batching")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="default model, by name or path")
+    parser.add_argument("--models-dir", default=DEFAULT_MODELS_DIR, help="models selectable with ?model=NAME")
+    parser.add_argument("--memory-mb", type=float, default=None,
+                        help=f"budget for resident models (default: $FISH_MODEL_MEMORY_MB or {DEFAULT_MEMORY_MB})")
+    parser.add_argument("--backend", choices=BACKENDS, default="auto")
+    parser.add_argument("--threads", type=int, default=None, help="TFLite interpreter threads")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--profile-requests", type=int, default=0,
+                        help="capture a TensorFlow profiler trace of the first N predict requests")
+    parser.add_argument("--profile-dir", default="reports/traces", help="where --profile-requests writes the trace")
+    parser.add_argument("--drift-threshold", type=float, default=DRIFT_THRESHOLD,
+                        help="PSI against the val baseline above which GET /drift flags a statistic")
+    parser.add_argument("--drift-window", type=int, default=WINDOW, help="predictions per drift window")
+    args = parser.parse_args()
+
+    def load(path):
+        model = load_backend(path, args.backend, args.threads)
+        # Trace the graph once so the first request doesn't pay for it
+        model.predict_on_batch(np.zeros((1, *model.input_size, 3), dtype=np.uint8))
+        return model
+
+    registry = ModelRegistry(args.models_dir, args.memory_mb, load)
+    default_model = registry.info(args.model).path
+    registry.get(default_model)
+
+    batchers = ModelBatchers(registry, args.max_batch_size, args.max_wait_ms, drift_threshold=args.drift_threshold,
+                             drift_window=args.drift_window)
+    trace = TraceCapture(args.profile_dir, args.profile_requests) if args.profile_requests else None
+    server = InferenceServer((args.host, args.port), make_handler(batchers, default_model, trace))
+    print(f"Serving {registry.info(default_model).name} and {len(registry.models)} models from {args.models_dir}/ "
+          f"on http://{args.host}:{args.port} "
+          "(POST /predict?model=NAME, GET /models, GET /health, GET /metrics, GET /drift)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from src.preprocessing import load_image
+
+DEFAULT_CACHE_DIR = os.path.join("cache", "tensors")
+INDEX_VERSION = 3
+
+# images is a read-only (N, H, W, 3) uint8 memmap, row i belongs to filepaths[i]
+CachedSplit = namedtuple("CachedSplit", ["images", "labels", "filepaths", "class_indices"])
+
+
+def cache_path(split_dir, image_size, cache_dir=DEFAULT_CACHE_DIR):
+    # One folder per (split folder, target size), e.g. cache/tensors/train_3f2a91c0_224x224;
+    # the hash of the absolute path keeps data/val and other/val apart
+    split_dir = os.path.abspath(os.path.normpath(split_dir))
+    digest = hashlib.sha1(split_dir.encode("utf-8")).hexdigest()[:8]
+    return os.path.join(cache_dir, f"{os.path.basename(split_dir)}_{digest}_{image_size[0]}x{image_size[1]}")
+
+
+def file_key(path):
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def load_resized(path, image_size):
+    # PIL releases the GIL while decoding and resizing, so threads scale
+    with open(path, "rb") as f:
+        return load_image(f, image_size)
+
+
+def _read_index(folder):
+    index_file = os.path.join(folder, "index.json")
+    if not os.path.exists(index_file):
+        return None
+    with open(index_file, "r", encoding="utf-8") as f:
+        index = json.load(f)
+    if index.get("version") != INDEX_VERSION:
+        return None
+    return index
+
+
+def _open_images(folder, index):
+    # The index names the images file it was written with, so rows and labels always pair up;
+    # None if that file is gone or doesn't hold one row per entry
+    try:
+        images = np.load(os.path.join(folder, index["images"]), mmap_mode="r")
+    except FileNotFoundError:
+        return None
+    if len(images) != index["rows"] or len(images) != len(index["entries"]):
+        return None
+    return images
+
+
+def cache_fingerprint(split_dir, image_size, cache_dir=DEFAULT_CACHE_DIR):
+    # Changes whenever the cached image set changes; used to key derived caches
+    index_file = os.path.join(cache_path(split_dir, image_size, cache_dir), "index.json")
+    with open(index_file, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def open_cache(split_dir, image_size, cache_dir=DEFAULT_CACHE_DIR):
+    """Open an existing cache without touching the source images.
+
+    Returns None when the cache has not been built yet.
+    """
+    folder = cache_path(split_dir, image_size, cache_dir)
+    index = _read_index(folder)
+    if index is None:
+        return None
+    images = _open_images(folder, index)
+    if images is None:
+        return None
+    entries = index["entries"]
+    return CachedSplit(
+        images,
+        np.array([e["label"] for e in entries], dtype=np.int32),
+        [e["path"] for e in entries],
+        index["class_indices"],
+    )
+
+
+def build_cache(split_dir, image_size, cache_dir=DEFAULT_CACHE_DIR, workers=None, verbose=False):
+    """Create or incrementally refresh the cache for one split folder.
+
+    Rows whose (path, mtime, size) still match are copied from the previous
+    cache; only new or modified images are decoded. Removed images drop out.
+    Every build writes a new images file and then swaps in the index that
+    names it, so readers see either the old cache or the new one.
+    """
+    # Imported here so the cache can be read without pulling in TensorFlow
+    from src.data_loader import list_image_files
+
+    folder = cache_path(split_dir, image_size, cache_dir)
+    os.makedirs(folder, exist_ok=True)
+
+    filepaths, labels, class_indices = list_image_files(split_dir)
+    keys = [file_key(p) for p in filepaths]
+
+    old_index = _read_index(folder)
+    old_images = _open_images(folder, old_index) if old_index is not None else None
+    if old_images is None:
+        old_index = None
+    old_rows = {}
+    if old_index is not None:
+        old_rows = {
+            e["path"]: (row, e["key"]) for row, e in enumerate(old_index["entries"])
+        }
+
+    reuse, todo = {}, []
+    for i, (path, key) in enumerate(zip(filepaths, keys)):
+        hit = old_rows.get(path)
+        if hit is not None and hit[1] == key:
+            reuse[i] = hit[0]
+        else:
+            todo.append(i)
+
+    unchanged = (
+        old_index is not None
+        and not todo
+        and len(reuse) == len(old_rows)
+        and old_index["class_indices"] == class_indices
+    )
+    if unchanged:
+        return open_cache(split_dir, image_size, cache_dir)
+
+    start = time.perf_counter()
+    images_name = f"images-{time.time_ns()}-{os.getpid()}.npy"
+    tmp_file = os.path.join(folder, f"{images_name}.tmp")
+    images = np.lib.format.open_memmap(
+        tmp_file, mode="w+", dtype=np.uint8, shape=(len(filepaths), image_size[0], image_size[1], 3)
+    )
+    for i, row in reuse.items():
+        images[i] = old_images[row]
+
+    def decode(i):
+        images[i] = load_resized(filepaths[i], image_size)
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        list(pool.map(decode, todo))
+    images.flush()
+    del images, old_images
+
+    os.replace(tmp_file, os.path.join(folder, images_name))
+    index = {
+        "version": INDEX_VERSION,
+        "image_size": list(image_size),
+        "images": images_name,
+        "rows": len(filepaths),
+        "class_indices": class_indices,
+        "entries": [
+            {"path": p, "key": k, "label": l} for p, k, l in zip(filepaths, keys, labels)
+        ],
+    }
+    index_file = os.path.join(folder, "index.json")
+    tmp_index = f"{index_file}.{os.getpid()}.tmp"
+    with open(tmp_index, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(tmp_index, index_file)
+    # Readers that already mapped the old file keep it until they close it
+    if old_index is not None and old_index["images"] != images_name:
+        try:
+            os.remove(os.path.join(folder, old_index["images"]))
+        except FileNotFoundError:
+            pass
+
+    if verbose:
+        print(f"{folder}: {len(reuse)} reused, {len(todo)} decoded, "
+              f"{len(old_rows) - len(reuse)} dropped in {time.perf_counter() - start:.1f}s")
+    return open_cache(split_dir, image_size, cache_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the resized uint8 image cache")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--splits", nargs="+", default=["train", "val", "test"])
+    parser.add_argument("--size", type=int, default=224)
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    for split in args.splits:
+        build_cache(os.path.join(args.data_dir, split), (args.size, args.size),
+                    args.cache_dir, args.workers, verbose=True)
+
+
+if __name__ == "__main__":
+    main()
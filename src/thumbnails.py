@@ -0,0 +1,197 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from src.manifest import DEFAULT_INDEX_PATH, scan_split, split_files
+
+DEFAULT_THUMB_DIR = os.path.join("cache", "thumbnails")
+THUMB_SIZE = 256
+INDEX_VERSION = 1
+
+# WebP is about a third smaller than JPEG at the same quality
+FORMATS = {"webp": ("WEBP", ".webp"), "jpeg": ("JPEG", ".jpg")}
+
+
+def thumbnail_name(digest, size, fmt):
+    # Content-addressed: identical images share one file, renames cost nothing.
+    # Fanned out over 256 folders so none of them gets huge.
+    return os.path.join(digest[:2], f"{digest}_{size}{FORMATS[fmt][1]}")
+
+
+def make_thumbnail(path, dest, size=THUMB_SIZE, fmt="webp"):
+    with Image.open(path) as image:
+        # JPEG draft mode decodes at 1/2..1/8 scale, far cheaper than a full decode
+        image.draft("RGB", (size, size))
+        image = image.convert("RGB")
+        image.thumbnail((size, size), Image.BILINEAR)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        # Two workers may render the same content at once; each writes its own temp file
+        tmp_path = f"{dest}.{os.getpid()}.{threading.get_ident()}.tmp"
+        image.save(tmp_path, FORMATS[fmt][0], quality=80)
+    os.replace(tmp_path, dest)
+
+
+def index_file(split_dir, size=THUMB_SIZE, thumb_dir=DEFAULT_THUMB_DIR):
+    # One index per (split folder, size), e.g. cache/thumbnails/val_3f2a91c0_256.json;
+    # like the tensor cache, the hash of the absolute path keeps data/val and other/val apart
+    split_dir = os.path.abspath(os.path.normpath(split_dir))
+    digest = hashlib.sha1(split_dir.encode("utf-8")).hexdigest()[:8]
+    return os.path.join(thumb_dir, f"{os.path.basename(split_dir)}_{digest}_{size}.json")
+
+
+def list_split(split_dir, manifest_path=DEFAULT_INDEX_PATH):
+    # The manifest when it covers the folder (no directory walk), otherwise a scan
+    listed = split_files(manifest_path, split_dir, drop_leaks=False) if os.path.exists(manifest_path) else None
+    return listed or scan_split(split_dir)
+
+
+class Gallery:
+    """Per-class lists of (thumbnail, source image, class) tuples for one split.
+
+    Paging and sampling only touch the in-memory index; the page then reads
+    a few small thumbnail files.
+    """
+
+    def __init__(self, index, thumb_dir=DEFAULT_THUMB_DIR):
+        self.thumb_dir = thumb_dir
+        self.size = index["size"]
+        self.classes = {name: [(os.path.join(thumb_dir, e["thumb"]), e["path"], name) for e in entries]
+                        for name, entries in index["classes"].items()}
+        self.items = [item for items in self.classes.values() for item in items]
+        self.by_path = {path: thumb for thumb, path, _ in self.items}
+
+    def class_names(self):
+        return list(self.classes)
+
+    def _items(self, class_name):
+        return self.items if class_name is None else self.classes.get(class_name, [])
+
+    def count(self, class_name=None):
+        return len(self._items(class_name))
+
+    def page(self, class_name=None, page=0, per_page=12):
+        # Images page * per_page .. (page + 1) * per_page of one class (or all), in file name order
+        return self._items(class_name)[page * per_page:(page + 1) * per_page]
+
+    def sample(self, n=8, class_name=None, seed=None):
+        # n random images of one class, or spread round-robin over all classes
+        rng = random.Random(seed)
+        if class_name is not None:
+            items = self._items(class_name)
+            return rng.sample(items, min(n, len(items)))
+        pools = [rng.sample(items, len(items)) for items in self.classes.values() if items]
+        picked = []
+        while pools and len(picked) < n:
+            for pool in list(pools):
+                if len(picked) == n:
+                    break
+                picked.append(pool.pop())
+                if not pool:
+                    pools.remove(pool)
+        return picked
+
+    def thumbnail(self, path):
+        # Thumbnail of a source image in this split, None if it isn't indexed
+        return self.by_path.get(path)
+
+
+def _read_index(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        index = json.load(f)
+    if index.get("version") != INDEX_VERSION:
+        return None
+    return index
+
+
+def open_gallery(split_dir, size=THUMB_SIZE, thumb_dir=DEFAULT_THUMB_DIR):
+    """Open a built gallery without touching the source images; None if not built yet."""
+    index = _read_index(index_file(split_dir, size, thumb_dir))
+    return Gallery(index, thumb_dir) if index is not None else None
+
+
+def build_gallery(split_dir, size=THUMB_SIZE, thumb_dir=DEFAULT_THUMB_DIR, fmt="webp", workers=None,
+                  manifest_path=DEFAULT_INDEX_PATH, verbose=False):
+    """Create or refresh the thumbnails and per-class index of one split.
+
+    Images whose (path, mtime, size) match the previous index are skipped
+    without being read; the rest are hashed on a thread pool and only get a
+    new thumbnail when no image with the same content has one already.
+    """
+    start = time.perf_counter()
+    filepaths, labels, class_indices = list_split(split_dir, manifest_path)
+    names = list(class_indices)
+    path_file = index_file(split_dir, size, thumb_dir)
+    old_index = _read_index(path_file)
+    old = {}
+    if old_index is not None and old_index["format"] == fmt:
+        old = {e["path"]: e for entries in old_index["classes"].values() for e in entries}
+
+    def process(path):
+        stat = os.stat(path)
+        key = [stat.st_mtime_ns, stat.st_size]
+        hit = old.get(path)
+        if hit is not None and hit["key"] == key and os.path.exists(os.path.join(thumb_dir, hit["thumb"])):
+            return hit, False
+        with open(path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        thumb = thumbnail_name(digest, size, fmt)
+        dest = os.path.join(thumb_dir, thumb)
+        created = not os.path.exists(dest)
+        if created:
+            make_thumbnail(path, dest, size, fmt)
+        return {"path": path, "key": key, "thumb": thumb}, created
+
+    classes = {name: [] for name in names}
+    created, failed = 0, 0
+    with ThreadPoolExecutor(max_workers=workers or min(32, (os.cpu_count() or 1) + 4)) as pool:
+        futures = [pool.submit(process, path) for path in filepaths]
+        for future, label in zip(futures, labels):
+            try:
+                entry, new = future.result()
+            except Exception:
+                # Unreadable images just stay out of the gallery
+                failed += 1
+                continue
+            classes[names[label]].append(entry)
+            created += new
+
+    os.makedirs(thumb_dir, exist_ok=True)
+    tmp_path = f"{path_file}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": INDEX_VERSION, "size": size, "format": fmt, "classes": classes}, f)
+    os.replace(tmp_path, path_file)
+    if verbose:
+        print(f"{path_file}: {len(filepaths) - failed} images, {created} thumbnails created, "
+              f"{failed} unreadable in {time.perf_counter() - start:.1f}s")
+    return open_gallery(split_dir, size, thumb_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-build the Sample Gallery thumbnails and class index")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--splits", nargs="+", default=["val", "train"])
+    parser.add_argument("--size", type=int, default=THUMB_SIZE, help="longest thumbnail side in pixels")
+    parser.add_argument("--format", choices=FORMATS, default="webp")
+    parser.add_argument("--thumb-dir", default=DEFAULT_THUMB_DIR)
+    parser.add_argument("--manifest", default=DEFAULT_INDEX_PATH, help="read the file list from this manifest")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    for split in args.splits:
+        split_dir = os.path.join(args.data_dir, split)
+        if os.path.isdir(split_dir):
+            build_gallery(split_dir, args.size, args.thumb_dir, args.format, args.workers, args.manifest,
+                          verbose=True)
+
+
+if __name__ == "__main__":
+    main()
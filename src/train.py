@@ -0,0 +1,1019 @@
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import tensorflow as tf
+
+from src.backends import load_backend, read_metadata, write_metadata
+from src.data_loader import AUTOTUNE, BATCH_SIZE, array_batches, make_dataset
+from src.inference import CLASS_NAMES
+from src.modeling import (ARCHITECTURES, HEADS, IMAGE_SIZE, assemble, build_backbone, build_cnn, build_head,
+                          compile_model, count_flops, measure_latency, unfreeze_top)
+from src.preprocessing import PIXEL_SCALE, with_rescaling
+from src.tensor_cache import DEFAULT_CACHE_DIR, build_cache, cache_fingerprint, open_cache
+
+FEATURE_CACHE_DIR = os.path.join("cache", "features")
+TEACHER_CACHE_DIR = os.path.join("cache", "teachers")
+MODELS_DIR = "models"
+SPLITS = ("train", "val", "test")
+
+# Training performance profile; the defaults are the notebook's float32 run with TensorFlow's own
+# threading. 0 threads keeps TensorFlow's choice, "auto" jit_compile is Keras' (off on CPU).
+PERF_DEFAULTS = {"precision": "float32", "jit_compile": "auto", "intra_op_threads": 0, "inter_op_threads": 0}
+PRECISIONS = ("float32", "mixed_bfloat16")
+PERF_PROFILE_PATH = os.path.join("reports", "perf_profile.json")
+
+# Per-run stopping rules, all on val accuracy. 0 patience turns a rule off, so the defaults train
+# every epoch like the notebook. max_seconds is the run's training-time budget, max_epochs caps the
+# epochs (all stages together) run before the run pauses; successive halving resumes it later.
+SCHEDULE_DEFAULTS = {"patience": 0, "plateau_patience": 0, "plateau_factor": 0.5, "min_lr": 1e-6,
+                     "min_delta": 0.0, "max_seconds": None, "max_epochs": None}
+CHECKPOINT_DIR = os.path.join("cache", "checkpoints")
+CHECKPOINT_VERSION = 1
+
+
+def model_filename(arch):
+    # Same file names the notebook saved
+    return f"{arch}_fish_model.keras"
+
+
+def weights_tag(backbone, weights):
+    # ImageNet weights are the same in every run; anything else (random init) is keyed by a hash of
+    # the backbone's actual weights, so features are only reused for that exact backbone
+    if weights == "imagenet":
+        return weights
+    digest = hashlib.sha1()
+    for w in backbone.weights:
+        digest.update(np.ascontiguousarray(w.numpy()).tobytes())
+    return f"init{digest.hexdigest()[:12]}"
+
+
+def cached_features(backbone, backbone_name, split_dir, image_size, batch_size=BATCH_SIZE,
+                    tensor_cache=DEFAULT_CACHE_DIR, feature_cache=FEATURE_CACHE_DIR, weights="imagenet"):
+    """Frozen-backbone feature maps for one split, computed once and memory-mapped.
+
+    Stored as float16 under feature_cache/<backbone>_<weights>_<H>x<W>/<split>.npy
+    and reused as long as the split's tensor cache fingerprint is unchanged.
+    Randomly initialised backbones are keyed by a hash of their weights.
+    Returns (features, labels).
+    """
+    cached = build_cache(split_dir, image_size, tensor_cache)
+    fingerprint = cache_fingerprint(split_dir, image_size, tensor_cache)
+    split = os.path.basename(os.path.normpath(split_dir))
+    tag = weights_tag(backbone, weights)
+    folder = os.path.join(feature_cache, f"{backbone_name}_{tag}_{image_size[0]}x{image_size[1]}")
+    if backbone.dtype_policy.name != "float32":
+        # Features computed in bfloat16 differ slightly; keep them apart from the float32 ones
+        folder += f"_{backbone.dtype_policy.name}"
+    array_path = os.path.join(folder, f"{split}.npy")
+    meta_path = os.path.join(folder, f"{split}.json")
+
+    if os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            if json.load(f).get("fingerprint") == fingerprint:
+                return np.load(array_path, mmap_mode="r"), cached.labels
+
+    os.makedirs(folder, exist_ok=True)
+    start = time.perf_counter()
+    tmp_path = os.path.join(folder, f"{split}.{os.getpid()}.tmp.npy")
+    features = np.lib.format.open_memmap(
+        tmp_path, mode="w+", dtype=np.float16, shape=(len(cached.labels), *backbone.output_shape[1:])
+    )
+    # Batches are read from the uint8 memmap on a tf.data thread while the backbone runs
+    images = tf.data.Dataset.from_tensor_slices(np.arange(len(cached.labels))).batch(batch_size)
+    images = images.map(
+        lambda idx: tf.numpy_function(lambda i: cached.images[i], [idx], tf.uint8),
+        num_parallel_calls=AUTOTUNE,
+    ).prefetch(AUTOTUNE)
+    row = 0
+    for batch in images:
+        out = backbone(tf.cast(batch, tf.float32) * PIXEL_SCALE, training=False)
+        features[row:row + len(out)] = out.numpy()
+        row += len(out)
+    features.flush()
+    del features
+    os.replace(tmp_path, array_path)
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump({"fingerprint": fingerprint, "seconds": time.perf_counter() - start}, f)
+    print(f"Cached {backbone_name} features for {split} in {time.perf_counter() - start:.1f}s")
+    return np.load(array_path, mmap_mode="r"), cached.labels
+
+
+def feature_dataset(features, labels, num_classes, batch_size, shuffle=False, seed=None, targets=None,
+                    first_epoch=None):
+    ds = array_batches(features, labels, num_classes, batch_size, shuffle, seed, targets, first_epoch)
+    return ds.map(lambda x, y: (tf.cast(x, tf.float32), y), num_parallel_calls=AUTOTUNE).prefetch(AUTOTUNE)
+
+
+def distillation_loss(num_classes, temperature=4.0, alpha=0.3):
+    """Hinton-style loss for labels laid out as [one-hot | teacher log-probs].
+
+    alpha weighs the cross-entropy on the true labels, 1 - alpha the KL
+    divergence between teacher and student at the given temperature. The
+    student keeps its softmax output, so its log-probs stand in for logits.
+    """
+    def loss(y_true, y_pred):
+        hard, teacher = y_true[:, :num_classes], y_true[:, num_classes:]
+        log_student = tf.math.log(tf.clip_by_value(y_pred, 1e-7, 1.0))
+        soft_teacher = tf.nn.softmax(teacher / temperature)
+        soft_student = tf.nn.log_softmax(log_student / temperature)
+        kl = tf.reduce_sum(soft_teacher * (tf.math.log(soft_teacher + 1e-7) - soft_student), axis=-1)
+        ce = -tf.reduce_sum(hard * log_student, axis=-1)
+        return alpha * ce + (1 - alpha) * temperature ** 2 * kl
+
+    def accuracy(y_true, y_pred):
+        return tf.keras.metrics.categorical_accuracy(y_true[:, :num_classes], y_pred)
+
+    return loss, accuracy
+
+
+def teacher_outputs(teachers, split_dir, batch_size=64, tensor_cache=DEFAULT_CACHE_DIR,
+                    teacher_cache=TEACHER_CACHE_DIR):
+    """Log of the teachers' averaged probabilities for every image of a split.
+
+    teachers are loaded backends (src.backends); each reads the tensor cache
+    at its own input size. The result is stored under
+    teacher_cache/<teachers>/<split>.npy and reused until a teacher file or
+    the image set changes, so distillation epochs never run the teachers.
+    Returns (log_probs, filepaths).
+    """
+    from src.prediction_cache import model_identity
+
+    identity = "|".join(sorted(model_identity(b.model_path) for b in teachers))
+    folder = os.path.join(teacher_cache, hashlib.sha1(identity.encode()).hexdigest()[:16])
+    split = os.path.basename(os.path.normpath(split_dir))
+    array_path = os.path.join(folder, f"{split}.npy")
+    meta_path = os.path.join(folder, f"{split}.json")
+
+    caches = [build_cache(split_dir, b.input_size, tensor_cache) for b in teachers]
+    fingerprint = [cache_fingerprint(split_dir, b.input_size, tensor_cache) for b in teachers]
+    if os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            if json.load(f).get("fingerprint") == fingerprint:
+                return np.load(array_path), caches[0].filepaths
+
+    start = time.perf_counter()
+    probs = 0
+    for backend, cached in zip(teachers, caches):
+        out = [backend.predict_on_batch(cached.images[i:i + batch_size])
+               for i in range(0, len(cached.labels), batch_size)]
+        probs = probs + np.concatenate(out)
+    log_probs = np.log(np.clip(probs / len(teachers), 1e-7, 1.0)).astype(np.float32)
+
+    os.makedirs(folder, exist_ok=True)
+    np.save(array_path, log_probs)
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump({"fingerprint": fingerprint, "teachers": identity.split("|"),
+                   "seconds": time.perf_counter() - start}, f)
+    print(f"Cached teacher outputs for {split} in {time.perf_counter() - start:.1f}s")
+    return log_probs, caches[0].filepaths
+
+
+def configure_threads(intra_op_threads=0, inter_op_threads=0):
+    # Must run before TensorFlow executes its first op; 0 keeps TensorFlow's default. oneDNN runs on
+    # TensorFlow's intra-op pool, and OMP_NUM_THREADS would be read at import time, too early to set here.
+    if intra_op_threads:
+        tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    if inter_op_threads:
+        tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+
+
+def _float32_config(config):
+    if isinstance(config, dict):
+        if config.get("class_name") in ("DTypePolicy", "FloatDTypePolicy"):
+            return "float32"
+        return {k: _float32_config(v) for k, v in config.items()}
+    if isinstance(config, list):
+        return [_float32_config(v) for v in config]
+    return config
+
+
+def float32_copy(model):
+    """Same architecture and weights with every layer back on the float32 policy.
+
+    Mixed precision keeps the variables in float32 already, so the copy is
+    exact; the saved model then runs in float32 wherever it is deployed.
+    """
+    copy = model.__class__.from_config(_float32_config(model.get_config()))
+    copy.set_weights(model.get_weights())
+    return copy
+
+
+class StepTimer(tf.keras.callbacks.Callback):
+    """Median training step time of the last fit() it was passed to, ignoring the first warmup steps."""
+
+    def __init__(self, warmup=3):
+        super().__init__()
+        self.warmup = warmup
+        self.times = []
+
+    def on_train_begin(self, logs=None):
+        self.times = []
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self.start = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.times.append(time.perf_counter() - self.start)
+
+    def step_ms(self):
+        times = self.times[self.warmup:] or self.times
+        return float(np.median(times) * 1000) if times else None
+
+
+class TrainingState:
+    """Progress of one training run, kept in checkpoint_dir/state.json next to per-stage weights.
+
+    Weight files (<stage>.weights.h5) include the optimizer state. A state
+    left by a different setup (see fingerprint in train_architecture) is
+    discarded. With checkpoint_dir=None nothing is written and the state
+    only lives for one call.
+    """
+
+    def __init__(self, checkpoint_dir, fingerprint, seed=None):
+        self.checkpoint_dir = checkpoint_dir
+        data = None
+        if checkpoint_dir and os.path.exists(self._path("state.json")):
+            with open(self._path("state.json"), "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != CHECKPOINT_VERSION or data.get("fingerprint") != fingerprint:
+                print(f"Ignoring the checkpoint in {checkpoint_dir}: it was written for another setup")
+                self.clear()
+                data = None
+        if data is None:
+            data = {"version": CHECKPOINT_VERSION, "fingerprint": fingerprint,
+                    "seed": int(np.random.default_rng().integers(2 ** 31)) if seed is None else seed,
+                    "elapsed": 0.0, "epochs_run": 0, "stages": {}}
+        self.data = data
+        self.resumed = bool(data["stages"])
+        self.best_weights = {}
+
+    def _path(self, name):
+        return os.path.join(self.checkpoint_dir, name)
+
+    @property
+    def seed(self):
+        return self.data["seed"]
+
+    def stage(self, name, lr):
+        return self.data["stages"].setdefault(name, {
+            "epoch": 0, "history": {}, "best": None, "wait": 0, "plateau_wait": 0, "lr": lr,
+            "done": False, "stop_reason": None,
+        })
+
+    def val_accuracy(self):
+        # Last val accuracy of the latest stage that has one; what successive halving ranks runs on
+        for stage in reversed(list(self.data["stages"].values())):
+            if stage["history"].get("val_accuracy"):
+                return stage["history"]["val_accuracy"][-1]
+        return None
+
+    def budget_reason(self, schedule):
+        if schedule["max_seconds"] and self.data["elapsed"] >= schedule["max_seconds"]:
+            return "time_budget"
+        if schedule["max_epochs"] is not None and self.data["epochs_run"] >= schedule["max_epochs"]:
+            return "epoch_budget"
+        return None
+
+    def save(self, model=None, stage=None, best=False):
+        if best and not self.checkpoint_dir:
+            # Without a checkpoint folder the best weights stay in memory
+            self.best_weights[stage] = model.get_weights()
+            return
+        if not self.checkpoint_dir:
+            return
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        if model is not None:
+            path = self._path(f"{stage}.best.weights.h5" if best else f"{stage}.weights.h5")
+            # Keras wants the .weights.h5 suffix on the temp file too
+            tmp_path = f"{path[:-len('.weights.h5')]}.{os.getpid()}.tmp.weights.h5"
+            model.save_weights(tmp_path)
+            os.replace(tmp_path, path)
+        if not best:
+            tmp_path = self._path(f"state.{os.getpid()}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.data, f)
+            os.replace(tmp_path, self._path("state.json"))
+
+    def load_weights(self, model, stage, best=False):
+        # False when there is nothing to restore
+        if not self.checkpoint_dir:
+            if not best or stage not in self.best_weights:
+                return False
+            model.set_weights(self.best_weights[stage])
+            return True
+        path = self._path(f"{stage}.best.weights.h5" if best else f"{stage}.weights.h5")
+        if not os.path.exists(path):
+            return False
+        model.load_weights(path)
+        return True
+
+    def clear(self):
+        if self.checkpoint_dir and os.path.isdir(self.checkpoint_dir):
+            shutil.rmtree(self.checkpoint_dir)
+
+
+class TrainingControl(tf.keras.callbacks.Callback):
+    """Per-epoch bookkeeping of one training stage, see fit_stage.
+
+    After every epoch: records the logs, applies early stopping and
+    reduce-on-plateau on val_accuracy, checks the run's budgets, then
+    checkpoints weights and state. Budgets are checked at epoch ends, so a
+    run can overshoot its time budget by at most one epoch.
+    """
+
+    def __init__(self, state, name, schedule):
+        super().__init__()
+        self.state = state
+        self.name = name
+        self.schedule = schedule
+
+    def on_train_begin(self, logs=None):
+        self.last = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        now = time.perf_counter()
+        run, stage, schedule = self.state.data, self.state.data["stages"][self.name], self.schedule
+        run["elapsed"] += now - self.last
+        self.last = now
+        run["epochs_run"] += 1
+        stage["epoch"] = epoch + 1
+        for key, value in (logs or {}).items():
+            stage["history"].setdefault(key, []).append(float(value))
+
+        accuracy = float(logs["val_accuracy"])
+        if stage["best"] is None or accuracy > stage["best"] + schedule["min_delta"]:
+            stage["best"], stage["wait"], stage["plateau_wait"] = accuracy, 0, 0
+            if schedule["patience"]:
+                self.state.save(self.model, self.name, best=True)
+        else:
+            stage["wait"] += 1
+            stage["plateau_wait"] += 1
+            if schedule["plateau_patience"] and stage["plateau_wait"] >= schedule["plateau_patience"]:
+                lr = max(stage["lr"] * schedule["plateau_factor"], schedule["min_lr"])
+                if lr < stage["lr"]:
+                    self.model.optimizer.learning_rate.assign(lr)
+                    print(f"\n{self.name}: val accuracy stalled, learning rate {stage['lr']:.2e} -> {lr:.2e}")
+                    stage["lr"] = lr
+                stage["plateau_wait"] = 0
+
+        if schedule["patience"] and stage["wait"] >= schedule["patience"]:
+            stage["stop_reason"] = "early_stopping"
+        else:
+            stage["stop_reason"] = self.state.budget_reason(schedule)
+        if stage["stop_reason"]:
+            self.model.stop_training = True
+        self.state.save(self.model, self.name)
+
+
+def fit_stage(model, name, state, train_data, val_data, epochs, lr, schedule, callbacks=None):
+    """Train (or resume, or skip if finished) one stage of a run; returns the stage's state.
+
+    model must be compiled with its final trainable layers. train_data(e)
+    returns (dataset, steps_per_epoch) for a stream starting at epoch e
+    whose order only depends on (seed, epoch), so the saved epoch is the
+    exact data position. The stage is left unfinished (stage["done"] is
+    False) when the run's epoch budget runs out first.
+    """
+    stage = state.stage(name, lr)
+    if stage["done"]:
+        state.load_weights(model, name)
+        return stage
+    model.optimizer.build(model.trainable_variables)
+    if state.load_weights(model, name):
+        model.optimizer.learning_rate.assign(stage["lr"])
+        print(f"Resuming {name} after epoch {stage['epoch']}")
+
+    stage["stop_reason"] = state.budget_reason(schedule)
+    if stage["epoch"] < epochs and not stage["stop_reason"]:
+        dataset, steps = train_data(stage["epoch"])
+        model.fit(dataset, steps_per_epoch=steps, validation_data=val_data, initial_epoch=stage["epoch"],
+                  epochs=epochs, callbacks=[TrainingControl(state, name, schedule), *(callbacks or [])])
+    if stage["stop_reason"] == "epoch_budget" and stage["epoch"] < epochs:
+        state.save()
+        return stage
+    # Like EarlyStopping(restore_best_weights=True) when early stopping is on
+    if schedule["patience"]:
+        state.load_weights(model, name, best=True)
+    stage["done"] = True
+    state.save(model, name)
+    return stage
+
+
+def kept_accuracy(stage, schedule):
+    # Val accuracy of the weights a finished stage kept, None if it never ran an epoch
+    if schedule["patience"] or not stage["history"].get("val_accuracy"):
+        return stage["best"]
+    return stage["history"]["val_accuracy"][-1]
+
+
+def train_architecture(arch, data_dir="data", image_size=IMAGE_SIZE, batch_size=BATCH_SIZE, head_epochs=5,
+                       fine_tune_epochs=5, tensor_cache=DEFAULT_CACHE_DIR, feature_cache=FEATURE_CACHE_DIR,
+                       models_dir=MODELS_DIR, weights="imagenet", seed=None, config=None, teacher=None,
+                       perf=None, callbacks=None, checkpoint_dir=None, schedule=None):
+    """Train one architecture and save it to models_dir.
+
+    Transfer-learning models train their head on cached frozen-backbone
+    features (no augmentation in this stage, since features are computed
+    once), then optionally fine-tune the top backbone layers end to end on
+    augmented images. The scratch CNN is trained end to end directly.
+
+    teacher = {"targets": {split: log_probs}, "temperature", "alpha"} trains
+    every stage with distillation_loss instead of plain cross-entropy.
+
+    perf sets precision and jit_compile (see PERF_DEFAULTS; thread counts
+    are per process, see configure_threads). Under mixed_bfloat16 the model
+    trains in bfloat16 and is saved as float32. callbacks go to every fit().
+
+    schedule sets early stopping, reduce-on-plateau and budgets (see
+    SCHEDULE_DEFAULTS). With checkpoint_dir every epoch is checkpointed
+    there and an interrupted run resumes where it stopped, keeping its
+    original seed; the folder is removed once the model is saved. When
+    schedule["max_epochs"] pauses the run, nothing is saved and the result
+    has status "paused" and the current val accuracy.
+    """
+    cfg = dict(ARCHITECTURES[arch], **(config or {}))
+    perf = dict(PERF_DEFAULTS, **(perf or {}))
+    schedule = dict(SCHEDULE_DEFAULTS, **(schedule or {}))
+    split_dirs = {split: os.path.join(data_dir, split) for split in SPLITS}
+    start = time.perf_counter()
+    result = {"arch": arch, "config": cfg, "perf": perf, "schedule": schedule}
+    targets = teacher["targets"] if teacher else dict.fromkeys(SPLITS)
+    # Anything that makes old weights or epochs meaningless; epoch counts may change between sessions
+    setup = {"arch": arch, "config": cfg, "data_dir": data_dir, "image_size": list(image_size),
+             "batch_size": batch_size, "weights": weights, "precision": perf["precision"],
+             "teacher": teacher and [teacher["temperature"], teacher["alpha"]]}
+    state = TrainingState(checkpoint_dir, hashlib.sha1(json.dumps(setup, sort_keys=True).encode()).hexdigest(), seed)
+    seed = state.seed
+    # Layers pick up the global policy when they are built
+    previous_policy = tf.keras.mixed_precision.global_policy()
+    tf.keras.mixed_precision.set_global_policy(perf["precision"])
+
+    def image_data(split, augment=False, first_epoch=None):
+        return make_dataset(split_dirs[split], image_size, batch_size, augment=augment, shuffle=augment,
+                            seed=seed, tensor_cache=tensor_cache, targets=targets[split], first_epoch=first_epoch)
+
+    def image_stream(first_epoch):
+        train = image_data("train", augment=True, first_epoch=first_epoch)
+        return train.dataset, -(-train.samples // batch_size)
+
+    def compile_for_training(model, lr):
+        if not teacher:
+            return compile_model(model, lr, perf["jit_compile"])
+        loss, accuracy = distillation_loss(model.output_shape[-1], teacher["temperature"], teacher["alpha"])
+        model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=lr), loss=loss, metrics=[accuracy],
+                      jit_compile=perf["jit_compile"])
+        return model
+
+    def paused(stage):
+        tf.keras.mixed_precision.set_global_policy(previous_policy)
+        result.update(status="paused", val_accuracy=state.val_accuracy(), epochs_run=state.data["epochs_run"],
+                      train_seconds=time.perf_counter() - start)
+        print(f"{arch}: paused in {stage} after {state.data['epochs_run']} epochs")
+        return model, result
+
+    fine_tuned = False
+    if cfg["backbone"] is None:
+        class_indices = build_cache(split_dirs["train"], image_size, tensor_cache).class_indices
+        model = compile_for_training(build_cnn(image_size, len(class_indices)), cfg["lr"])
+        stage = fit_stage(model, "cnn", state, image_stream, image_data("val").dataset, head_epochs, cfg["lr"],
+                          schedule, callbacks)
+        if not stage["done"]:
+            return paused("cnn")
+        result["history"] = stage["history"]
+        result["val_accuracy"] = kept_accuracy(stage, schedule)
+        _, result["test_accuracy"] = model.evaluate(image_data("test").dataset, verbose=0)
+    else:
+        if weights is None:
+            # Seeded, a resumed run rebuilds the same random backbone and finds its cached features
+            tf.keras.utils.set_random_seed(seed)
+        backbone = build_backbone(cfg["backbone"], image_size, weights)
+        feature_start = time.perf_counter()
+        features = {
+            split: cached_features(backbone, cfg["backbone"], split_dirs[split], image_size, batch_size,
+                                   tensor_cache, feature_cache, weights)
+            for split in SPLITS
+        }
+        result["feature_seconds"] = time.perf_counter() - feature_start
+
+        class_indices = open_cache(split_dirs["train"], image_size, tensor_cache).class_indices
+        num_classes = len(class_indices)
+        head = build_head(backbone.output_shape[1:], num_classes, cfg["head"], cfg["units"], cfg["dropout"])
+        compile_for_training(head, cfg["lr"])
+
+        def feature_stream(first_epoch):
+            train_features, train_labels = features["train"]
+            return (feature_dataset(train_features, train_labels, num_classes, batch_size, shuffle=True, seed=seed,
+                                    targets=targets["train"], first_epoch=first_epoch),
+                    -(-len(train_labels) // batch_size))
+
+        head_start = time.perf_counter()
+        stage = fit_stage(head, "head", state, feature_stream,
+                          feature_dataset(*features["val"], num_classes, batch_size, targets=targets["val"]),
+                          head_epochs, cfg["lr"], schedule, callbacks)
+        model = assemble(backbone, head, name=arch)
+        if not stage["done"]:
+            return paused("head")
+        result["head_seconds"] = time.perf_counter() - head_start
+        result["history"] = stage["history"]
+        result["val_accuracy"] = kept_accuracy(stage, schedule)
+
+        # A run out of time keeps its head; one already fine-tuning before a restart carries on
+        fine_tuned = bool(fine_tune_epochs and cfg["fine_tune_layers"]) and (
+            "fine_tune" in state.data["stages"] or state.budget_reason(schedule) != "time_budget")
+        if fine_tuned:
+            unfreeze_top(backbone, cfg["fine_tune_layers"])
+            compile_for_training(model, cfg["fine_tune_lr"])
+            fine_start = time.perf_counter()
+            stage = fit_stage(model, "fine_tune", state, image_stream, image_data("val").dataset, fine_tune_epochs,
+                              cfg["fine_tune_lr"], schedule, callbacks)
+            if not stage["done"]:
+                return paused("fine_tune")
+            result["fine_tune_seconds"] = time.perf_counter() - fine_start
+            result["fine_tune_history"] = stage["history"]
+            if stage["history"]:
+                result["val_accuracy"] = kept_accuracy(stage, schedule)
+            _, result["test_accuracy"] = model.evaluate(image_data("test").dataset, verbose=0)
+        else:
+            # Frozen model: the head on cached test features gives the same answer, much faster
+            _, result["test_accuracy"] = head.evaluate(
+                feature_dataset(*features["test"], num_classes, batch_size, targets=targets["test"]), verbose=0)
+
+    result["val_accuracy"] = float(result["val_accuracy"])
+    result["stop_reasons"] = {name: s["stop_reason"] for name, s in state.data["stages"].items()}
+    result["status"] = "completed"
+    result["epochs_run"] = state.data["epochs_run"]
+    result["resumed"] = state.resumed
+    result["train_seconds"] = time.perf_counter() - start
+
+    # The saved model takes uint8 pixels and rescales them itself (src/preprocessing.py). Nested
+    # models keep their own compile config, so after distillation they are all recompiled with
+    # the plain loss and loading the file never needs the distillation objects.
+    lr = cfg["fine_tune_lr"] if fine_tuned else cfg["lr"]
+    tf.keras.mixed_precision.set_global_policy(previous_policy)
+    if perf["precision"] != "float32":
+        model = float32_copy(model)
+    if teacher:
+        for sub in (model, *model.layers):
+            if isinstance(sub, tf.keras.Model) and sub.compiled:
+                compile_model(sub, lr)
+    model = compile_model(with_rescaling(model), lr)
+    model.optimizer.build(model.trainable_variables)
+    os.makedirs(models_dir, exist_ok=True)
+    result["model_path"] = os.path.join(models_dir, model_filename(arch))
+    model.save(result["model_path"])
+    # Sidecar read by src.registry, so models can be listed without loading them
+    class_names = sorted(class_indices, key=class_indices.get)
+    if len(class_names) == len(CLASS_NAMES):
+        class_names = CLASS_NAMES
+    write_metadata(result["model_path"], {
+        "arch": arch, "class_names": class_names, "image_size": image_size[0],
+        "pixels": "uint8", "version": time.strftime("%Y%m%d-%H%M%S"),
+        "val_accuracy": result["val_accuracy"], "test_accuracy": float(result["test_accuracy"]),
+    })
+    state.clear()
+    return model, result
+
+
+def distill(arch, teacher_paths, data_dir="data", image_size=(160, 160), batch_size=BATCH_SIZE, head_epochs=5,
+            fine_tune_epochs=5, temperature=4.0, alpha=0.3, tensor_cache=DEFAULT_CACHE_DIR,
+            feature_cache=FEATURE_CACHE_DIR, teacher_cache=TEACHER_CACHE_DIR,
+            models_dir=os.path.join(MODELS_DIR, "students"), weights="imagenet", seed=None, config=None,
+            perf=None, checkpoint_dir=None, schedule=None):
+    """Distill one or more saved teachers into a (smaller, lower-resolution) student.
+
+    Returns (model, report) where the report puts the student's accuracy and
+    CPU latency next to the teachers'.
+    """
+    teachers = [load_backend(path) for path in teacher_paths]
+    targets, teacher_accuracy = {}, {}
+    for split in SPLITS:
+        split_dir = os.path.join(data_dir, split)
+        log_probs, filepaths = teacher_outputs(teachers, split_dir, batch_size, tensor_cache, teacher_cache)
+        cached = build_cache(split_dir, image_size, tensor_cache)
+        if filepaths != cached.filepaths:
+            raise ValueError(f"Teacher outputs for {split} don't line up with the {image_size} image cache")
+        targets[split] = log_probs
+        teacher_accuracy[split] = float(np.mean(np.argmax(log_probs, axis=1) == cached.labels))
+
+    model, result = train_architecture(
+        arch, data_dir, image_size, batch_size, head_epochs, fine_tune_epochs, tensor_cache, feature_cache,
+        models_dir, weights, seed, config, {"targets": targets, "temperature": temperature, "alpha": alpha},
+        perf=perf, checkpoint_dir=checkpoint_dir, schedule=schedule,
+    )
+    teacher_latency = sum(measure_latency(b, b.input_size)["p50_ms"] for b in teachers)
+
+    report = {
+        "student": {"arch": arch, "image_size": image_size[0], "model_path": result["model_path"],
+                    "params": int(model.count_params()), "mflops": count_flops(model) / 1e6,
+                    "val_accuracy": result["val_accuracy"], "test_accuracy": float(result["test_accuracy"]),
+                    "train_seconds": result["train_seconds"], **measure_latency(model, image_size)},
+        "teacher": {"models": list(teacher_paths), "val_accuracy": teacher_accuracy["val"],
+                    "test_accuracy": teacher_accuracy["test"], "p50_ms": teacher_latency},
+        "temperature": temperature,
+        "alpha": alpha,
+    }
+    return model, report
+
+
+def _limit_threads(threads):
+    # Runs first in every worker. Unpickling it imports src.train and with it TensorFlow, so
+    # environment variables would come too late; tf.config still applies until TF first runs an op.
+    configure_threads(threads, max(1, min(2, threads)))
+
+
+def _extract_task(backbone_name, image_size, batch_size, data_dir, tensor_cache, feature_cache, weights,
+                  precision="float32"):
+    tf.keras.mixed_precision.set_global_policy(precision)
+    backbone = build_backbone(backbone_name, image_size, weights)
+    for split in SPLITS:
+        cached_features(backbone, backbone_name, os.path.join(data_dir, split), image_size, batch_size,
+                        tensor_cache, feature_cache, weights)
+    return backbone_name
+
+
+def _run_task(spec, common, max_epochs=None):
+    # Checkpoints live next to the run's model, so a rerun or the next halving rung resumes the run
+    size = spec.get("image_size", IMAGE_SIZE[0])
+    image_size = (size, size)
+    run_dir = os.path.join(common["runs_dir"], spec["name"])
+    model, result = train_architecture(
+        spec["arch"], common["data_dir"], image_size, spec.get("batch_size", BATCH_SIZE),
+        spec.get("head_epochs", 5), spec.get("fine_tune_epochs", 5), common["tensor_cache"],
+        common["feature_cache"], run_dir, spec.get("weights", "imagenet"), spec.get("seed"), spec.get("config"),
+        perf=spec.get("perf"), checkpoint_dir=os.path.join(run_dir, "checkpoint"),
+        schedule=dict(spec.get("schedule", {}), max_epochs=max_epochs),
+    )
+    result.update(name=spec["name"], image_size=size)
+    if result["status"] == "completed":
+        result.update(latency=measure_latency(model, image_size), params=int(model.count_params()))
+    # History values are numpy floats; make the result JSON-safe
+    return json.loads(json.dumps(result, default=float))
+
+
+def _perf_trial(arch, perf, kwargs):
+    # Runs in its own process, whose thread pools were set up for this profile
+    timer = StepTimer()
+    _, result = train_architecture(arch, perf=perf, callbacks=[timer], **kwargs)
+    return {"perf": perf, "step_ms": timer.step_ms(), "val_accuracy": result["val_accuracy"],
+            "train_seconds": result["train_seconds"]}
+
+
+def perf_candidates(precisions=PRECISIONS, jit=("auto", True), threads=((0, 0),)):
+    # Every combination, the notebook's defaults first (the accuracy baseline)
+    return [dict(PERF_DEFAULTS, precision=p, jit_compile=j, intra_op_threads=intra, inter_op_threads=inter)
+            for p, j, (intra, inter) in itertools.product(precisions, jit, threads)]
+
+
+def sweep_perf(arch, candidates, tolerance=0.01, data_dir="data", image_size=IMAGE_SIZE, batch_size=BATCH_SIZE,
+               epochs=1, tensor_cache=DEFAULT_CACHE_DIR, feature_cache=FEATURE_CACHE_DIR, weights="imagenet",
+               seed=0):
+    """Train arch briefly under each performance profile and pick the fastest.
+
+    Every trial runs in a fresh process (thread pools and XLA caches are
+    per process) with the same seed and epochs. Speed is the median step
+    time of the last training stage (fine-tuning, or the CNN's only stage);
+    a profile only qualifies if its val accuracy is within tolerance of the
+    first float32 candidate that finished (the next one if the first
+    fails). Returns (selected profile, trial results).
+    """
+    results = []
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as models_dir:
+        kwargs = dict(data_dir=data_dir, image_size=image_size, batch_size=batch_size, head_epochs=epochs,
+                      fine_tune_epochs=epochs, tensor_cache=tensor_cache, feature_cache=feature_cache,
+                      models_dir=models_dir, weights=weights, seed=seed)
+        for perf in candidates:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=configure_threads,
+                                     initargs=(perf["intra_op_threads"], perf["inter_op_threads"])) as pool:
+                try:
+                    trial = pool.submit(_perf_trial, arch, perf, kwargs).result()
+                except Exception as e:
+                    # e.g. an op XLA can't compile; the profile just drops out
+                    trial = {"perf": perf, "step_ms": None, "val_accuracy": None, "error": str(e)}
+            results.append(trial)
+            print(f"{perf['precision']:<15} jit {str(perf['jit_compile']):<5} threads "
+                  f"{perf['intra_op_threads'] or 'default'}/{perf['inter_op_threads'] or 'default'}: "
+                  + (f"{trial['step_ms']:.1f} ms/step, val {trial['val_accuracy']:.4f}"
+                     if trial["step_ms"] is not None else f"failed ({trial.get('error', 'no steps')})"))
+
+    baselines = [r for r in results if r["perf"]["precision"] == "float32" and r["val_accuracy"] is not None]
+    if not baselines:
+        raise RuntimeError("No float32 profile finished its trial, so there is no accuracy baseline")
+    baseline = baselines[0]["val_accuracy"]
+    qualified = [r for r in results if r["step_ms"] is not None and r["val_accuracy"] >= baseline - tolerance]
+    if not qualified:
+        raise RuntimeError("No performance profile finished its trial")
+    return min(qualified, key=lambda r: r["step_ms"])["perf"], results
+
+
+def load_perf_profile(path=PERF_PROFILE_PATH):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["selected"]
+
+
+def load_experiments(path):
+    """Read an experiment file: {"defaults": {...}, "runs": [{"name", "arch", ...}]}.
+
+    Every run inherits the defaults; "config" overrides entries of
+    modeling.ARCHITECTURES (lr, units, dropout, fine_tune_layers, ...).
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        experiments = json.load(f)
+    defaults = experiments.get("defaults", {})
+    runs = []
+    for run in experiments["runs"]:
+        spec = dict(defaults, **run)
+        spec.setdefault("name", spec["arch"])
+        if str(spec.get("weights", "imagenet")).lower() == "none":
+            spec["weights"] = None
+        runs.append(spec)
+    names = [spec["name"] for spec in runs]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Run names must be unique: {names}")
+    return runs
+
+
+def promote_best(results, models_dir=MODELS_DIR, select_on="val_accuracy"):
+    # Copies the winning run to models/BEST_FISH_MODEL.keras with a metadata sidecar
+    best = max((r for r in results if r["status"] == "completed"), key=lambda r: r[select_on])
+    os.makedirs(models_dir, exist_ok=True)
+    target = os.path.join(models_dir, "BEST_FISH_MODEL.keras")
+    shutil.copyfile(best["model_path"], target)
+    write_metadata(target, dict(
+        read_metadata(best["model_path"]), source=best["model_path"], run=best["name"], selected_on=select_on,
+        promoted=time.strftime("%Y-%m-%d %H:%M:%S"),
+    ))
+    return best, target
+
+
+def run_experiments(runs, data_dir="data", workers=2, threads_per_worker=None, tensor_cache=DEFAULT_CACHE_DIR,
+                    feature_cache=FEATURE_CACHE_DIR, runs_dir=os.path.join(MODELS_DIR, "runs"), perf=None,
+                    schedule=None, halving=None, min_epochs=1):
+    """Train every run on a spawn-based process pool.
+
+    Image caches are built up front, then each distinct frozen backbone
+    extracts its features once (in parallel), then the runs themselves are
+    scheduled. Each worker is limited to threads_per_worker threads so the
+    runs don't oversubscribe the machine. perf (precision, jit_compile) and
+    schedule (early stopping, budgets) are the defaults for runs without
+    their own "perf"/"schedule".
+
+    halving=eta turns on successive halving: every run trains min_epochs
+    epochs, the best 1/eta of the paused runs by val accuracy resume from
+    their checkpoints for eta times as many epochs, and so on until one is
+    left, which trains to the end. The others end with status "stopped".
+    A run that raises ends with status "failed" and its error; the rest of
+    the sweep carries on.
+    """
+    if halving is not None and (halving < 2 or min_epochs < 1):
+        raise ValueError(f"Successive halving needs eta >= 2 and min_epochs >= 1, got {halving} and {min_epochs}")
+    threads = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+    runs = [dict(spec, perf=dict(perf or {}, **spec.get("perf", {})),
+                 schedule=dict(schedule or {}, **spec.get("schedule", {}))) for spec in runs]
+    common = {"data_dir": data_dir, "tensor_cache": tensor_cache, "feature_cache": feature_cache,
+              "runs_dir": runs_dir}
+
+    sizes = sorted({spec.get("image_size", IMAGE_SIZE[0]) for spec in runs})
+    for size in sizes:
+        for split in SPLITS:
+            build_cache(os.path.join(data_dir, split), (size, size), tensor_cache)
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_limit_threads, initargs=(threads,)) as pool:
+        backbones = {}
+        for spec in runs:
+            backbone = dict(ARCHITECTURES[spec["arch"]], **spec.get("config", {}))["backbone"]
+            # Random-init features belong to one run's backbone, so only that run can compute them
+            if backbone is not None and spec.get("weights", "imagenet") is not None:
+                size = spec.get("image_size", IMAGE_SIZE[0])
+                precision = spec["perf"].get("precision", PERF_DEFAULTS["precision"])
+                backbones[(backbone, size, spec.get("weights", "imagenet"), precision)] = spec.get(
+                    "batch_size", BATCH_SIZE)
+        extract = [
+            pool.submit(_extract_task, name, (size, size), batch_size, data_dir, tensor_cache, feature_cache,
+                        weights, precision)
+            for (name, size, weights, precision), batch_size in backbones.items()
+        ]
+        for future in as_completed(extract):
+            try:
+                future.result()
+            except Exception as e:
+                # The runs compute whatever features are still missing themselves
+                print(f"Feature extraction failed: {e!r}")
+
+        results, active, seconds = [], runs, {}
+        budget = min_epochs if halving and len(runs) > 1 else None
+        while active:
+            futures = {pool.submit(_run_task, spec, common, budget): spec for spec in active}
+            paused = []
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # One broken run (out of memory, bad config) is reported instead of ending the sweep
+                    spec = futures[future]
+                    results.append({"name": spec["name"], "arch": spec["arch"],
+                                    "image_size": spec.get("image_size", IMAGE_SIZE[0]), "status": "failed",
+                                    "error": repr(e), "epochs_run": None, "val_accuracy": None,
+                                    "train_seconds": seconds.get(spec["name"], 0.0)})
+                    print(f"{spec['name']}: failed: {e!r}")
+                    continue
+                # Each rung resumes the run, so its training time adds up over rungs
+                seconds[result["name"]] = result["train_seconds"] = (
+                    seconds.get(result["name"], 0.0) + result["train_seconds"])
+                if result["status"] == "paused":
+                    paused.append(result)
+                    print(f"{result['name']}: val {result['val_accuracy']:.4f} after "
+                          f"{result['epochs_run']} epochs (rung of {budget})")
+                    continue
+                results.append(result)
+                print(f"{result['name']}: val {result['val_accuracy']:.4f} test {result['test_accuracy']:.4f} "
+                      f"in {result['train_seconds']:.0f}s, p50 {result['latency']['p50_ms']:.1f}ms")
+
+            paused.sort(key=lambda r: r["val_accuracy"], reverse=True)
+            keep = max(1, len(paused) // halving) if paused else 0
+            for result in paused[keep:]:
+                result["status"] = "stopped"
+                results.append(result)
+                print(f"{result['name']}: stopped by successive halving")
+            survivors = {r["name"] for r in paused[:keep]}
+            active = [spec for spec in active if spec["name"] in survivors]
+            budget = None if keep <= 1 else budget * halving
+    return sorted(results, key=lambda r: (r["status"] == "completed", r["val_accuracy"] or 0.0), reverse=True)
+
+
+def write_experiment_report(results, json_path=os.path.join("reports", "experiments.json")):
+    os.makedirs(os.path.dirname(json_path) or ".", exist_ok=True)
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    with open(os.path.splitext(json_path)[0] + ".csv", "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Run", "Architecture", "Image Size", "Status", "Epochs", "Val Accuracy", "Test Accuracy",
+                         "Train Seconds", "p50 ms", "Params", "Model Path"])
+        for r in results:
+            # Runs stopped by successive halving were never evaluated or saved; failed runs have no scores
+            completed = r["status"] == "completed"
+            epochs, val = r["epochs_run"], r["val_accuracy"]
+            writer.writerow([r["name"], r["arch"], r["image_size"], r["status"], "" if epochs is None else epochs,
+                             "" if val is None else f"{val:.4f}", f"{r['test_accuracy']:.4f}" if completed else "",
+                             f"{r['train_seconds']:.1f}", f"{r['latency']['p50_ms']:.2f}" if completed else "",
+                             r.get("params", ""), r.get("model_path", "")])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the fish classifiers")
+    parser.add_argument("--archs", nargs="+", default=list(ARCHITECTURES), choices=list(ARCHITECTURES))
+    parser.add_argument("--config", default=None, help="experiment file (see configs/experiments.json)")
+    parser.add_argument("--workers", type=int, default=2, help="parallel training processes for --config")
+    parser.add_argument("--threads-per-worker", type=int, default=None)
+    parser.add_argument("--select-on", choices=["val_accuracy", "test_accuracy"], default="val_accuracy")
+    parser.add_argument("--no-promote", action="store_true", help="don't replace models/BEST_FISH_MODEL.keras")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--image-size", type=int, default=IMAGE_SIZE[0])
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--head-epochs", type=int, default=5)
+    parser.add_argument("--fine-tune-epochs", type=int, default=5)
+    parser.add_argument("--tensor-cache", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--feature-cache", default=FEATURE_CACHE_DIR)
+    parser.add_argument("--models-dir", default=MODELS_DIR)
+    parser.add_argument("--head", choices=list(HEADS), default=None, help="override each architecture's head")
+    parser.add_argument("--weights", default="imagenet", help="backbone weights, 'none' for random init")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--distill-from", nargs="+", default=None, metavar="MODEL",
+                        help="teacher model file(s); trains each --archs model as a student")
+    parser.add_argument("--temperature", type=float, default=4.0)
+    parser.add_argument("--alpha", type=float, default=0.3, help="weight of the hard-label loss when distilling")
+    parser.add_argument("--latency-budget-ms", type=float, default=None, help="p50 budget the student must meet")
+    parser.add_argument("--precision", choices=PRECISIONS, default=None,
+                        help="mixed_bfloat16 runs on the CPU's AVX-512/AMX bfloat16 units; models are saved as float32")
+    parser.add_argument("--jit-compile", action="store_true", default=None, help="compile training steps with XLA")
+    parser.add_argument("--intra-op-threads", type=int, default=None)
+    parser.add_argument("--inter-op-threads", type=int, default=None)
+    parser.add_argument("--perf-profile", default=None, metavar="PATH",
+                        help=f"start from the profile a --perf-sweep picked ({PERF_PROFILE_PATH})")
+    parser.add_argument("--perf-sweep", action="store_true",
+                        help="time each precision/XLA/thread combination on the first --archs model and train "
+                             "with the fastest one that keeps val accuracy")
+    parser.add_argument("--sweep-threads", nargs="+", default=None, metavar="INTRA:INTER",
+                        help="thread counts the sweep tries, 0 for TensorFlow's default")
+    parser.add_argument("--sweep-epochs", type=int, default=1, help="head and fine-tune epochs of each trial")
+    parser.add_argument("--sweep-tolerance", type=float, default=0.01, help="val accuracy a profile may lose")
+    parser.add_argument("--checkpoint-dir", default=CHECKPOINT_DIR,
+                        help="per-epoch checkpoints of --archs runs; an interrupted run resumes from here")
+    parser.add_argument("--fresh", action="store_true", help="discard existing checkpoints and start over")
+    parser.add_argument("--patience", type=int, default=0,
+                        help="stop a stage after this many epochs without val accuracy gains (0 = off)")
+    parser.add_argument("--plateau-patience", type=int, default=0,
+                        help="scale the learning rate by --plateau-factor after this many flat epochs (0 = off)")
+    parser.add_argument("--plateau-factor", type=float, default=SCHEDULE_DEFAULTS["plateau_factor"])
+    parser.add_argument("--max-minutes", type=float, default=None, help="training time budget of each run")
+    parser.add_argument("--halving", type=int, default=None, metavar="ETA",
+                        help="successive halving for --config: keep the best 1/ETA runs after each rung")
+    parser.add_argument("--min-epochs", type=int, default=1, help="epochs of the first successive-halving rung")
+    args = parser.parse_args()
+    # ETA 1 would never narrow the field and 0 divides by zero; a 0-epoch rung has nothing to rank
+    if args.halving is not None and args.halving < 2:
+        parser.error("--halving must be at least 2")
+    if args.min_epochs < 1:
+        parser.error("--min-epochs must be at least 1")
+
+    weights = None if args.weights.lower() == "none" else args.weights
+    image_size = (args.image_size, args.image_size)
+    config = {"head": args.head} if args.head else None
+
+    perf = load_perf_profile(args.perf_profile) if args.perf_profile else dict(PERF_DEFAULTS)
+    if args.perf_sweep:
+        cpus = os.cpu_count() or 1
+        threads = ([tuple(int(n) for n in t.split(":")) for t in args.sweep_threads] if args.sweep_threads
+                   else [(0, 0), (cpus, 1), (cpus, 2)])
+        perf, trials = sweep_perf(args.archs[0], perf_candidates(threads=threads), args.sweep_tolerance,
+                                  args.data_dir, image_size, args.batch_size, args.sweep_epochs, args.tensor_cache,
+                                  args.feature_cache, weights, 0 if args.seed is None else args.seed)
+        os.makedirs(os.path.dirname(PERF_PROFILE_PATH), exist_ok=True)
+        with open(PERF_PROFILE_PATH, "w", encoding="utf-8") as f:
+            json.dump({"arch": args.archs[0], "image_size": args.image_size,
+                       "created": time.strftime("%Y-%m-%d %H:%M:%S"), "tolerance": args.sweep_tolerance,
+                       "selected": perf, "trials": trials}, f, indent=2)
+        print(f"Selected {perf} -> {PERF_PROFILE_PATH}")
+    overrides = {"precision": args.precision, "jit_compile": args.jit_compile,
+                 "intra_op_threads": args.intra_op_threads, "inter_op_threads": args.inter_op_threads}
+    perf.update({k: v for k, v in overrides.items() if v is not None})
+    schedule = {"patience": args.patience, "plateau_patience": args.plateau_patience,
+                "plateau_factor": args.plateau_factor,
+                "max_seconds": args.max_minutes * 60 if args.max_minutes else None}
+
+    def checkpoint_dir(name):
+        path = os.path.join(args.checkpoint_dir, name)
+        if args.fresh and os.path.isdir(path):
+            shutil.rmtree(path)
+        return path
+
+    if args.config:
+        # Worker threads come from --threads-per-worker; each run checkpoints next to its model
+        runs = load_experiments(args.config)
+        if args.fresh:
+            for spec in runs:
+                shutil.rmtree(os.path.join(args.models_dir, "runs", spec["name"], "checkpoint"), ignore_errors=True)
+        results = run_experiments(
+            runs, args.data_dir, args.workers, args.threads_per_worker,
+            args.tensor_cache, args.feature_cache, os.path.join(args.models_dir, "runs"),
+            {"precision": perf["precision"], "jit_compile": perf["jit_compile"]}, schedule, args.halving,
+            args.min_epochs,
+        )
+        write_experiment_report(results)
+        failed = [r["name"] for r in results if r["status"] == "failed"]
+        if failed:
+            print(f"{len(failed)} runs failed: {', '.join(failed)} (errors in reports/experiments.json)")
+        if not any(r["status"] == "completed" for r in results):
+            print("No run completed, nothing to promote")
+            return
+        if not args.no_promote:
+            best, target = promote_best(results, args.models_dir, args.select_on)
+            print(f"Promoted {best['name']} ({args.select_on} {best[args.select_on]:.4f}) to {target}")
+        return
+
+    configure_threads(perf["intra_op_threads"], perf["inter_op_threads"])
+    if args.distill_from:
+        reports = []
+        for arch in args.archs:
+            _, report = distill(
+                arch, args.distill_from, args.data_dir, image_size, args.batch_size, args.head_epochs,
+                args.fine_tune_epochs, args.temperature, args.alpha, args.tensor_cache, args.feature_cache,
+                TEACHER_CACHE_DIR, os.path.join(args.models_dir, "students"), weights, args.seed, config, perf,
+                checkpoint_dir(f"{arch}_{args.image_size}_student"), schedule,
+            )
+            student, teacher = report["student"], report["teacher"]
+            report["latency_budget_ms"] = args.latency_budget_ms
+            report["within_budget"] = args.latency_budget_ms is None or student["p50_ms"] <= args.latency_budget_ms
+            reports.append(report)
+            print(f"{arch} student @{student['image_size']}: test {student['test_accuracy']:.4f} "
+                  f"p50 {student['p50_ms']:.1f}ms | teacher: test {teacher['test_accuracy']:.4f} "
+                  f"p50 {teacher['p50_ms']:.1f}ms" + ("" if report["within_budget"] else " (over budget)"))
+        os.makedirs("reports", exist_ok=True)
+        with open(os.path.join("reports", "distillation.json"), "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
+        return
+
+    for arch in args.archs:
+        _, result = train_architecture(
+            arch, args.data_dir, image_size, args.batch_size, args.head_epochs, args.fine_tune_epochs,
+            args.tensor_cache, args.feature_cache, args.models_dir, weights, args.seed, config, perf=perf,
+            checkpoint_dir=checkpoint_dir(f"{arch}_{args.image_size}"), schedule=schedule,
+        )
+        print(f"{arch}: test accuracy {result['test_accuracy']:.4f} in {result['train_seconds']:.0f}s "
+              f"-> {result['model_path']}")
+
+
+if __name__ == "__main__":
+    main()
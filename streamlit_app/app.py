@@ -1,10 +1,36 @@
+import time
+_script_start = time.perf_counter()
+
+import io
 import streamlit as st
-import tensorflow as tf
 from PIL import Image
 import numpy as np
 import plotly.graph_objects as go
 import os
+import sys
+import csv
 import base64
+import logging
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Make the repo's src package importable when launched as `streamlit run streamlit_app/app.py`
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.backends import load_backend
+from src.benchmark import load_report
+from src.drift import DRIFT_THRESHOLD, monitor_key, open_monitor
+from src.embeddings import get_embedder, index_path, open_index
+from src.ensemble import Cascade, Ensemble, engine_key
+from src.prediction_cache import PredictionCache, image_key, split_cached
+from src.registry import DEFAULT_MODEL, ModelRegistry, source_model
+from src.inference import CLASS_NAMES, open_uploads, predict_in_chunks, top_k
+from src.manifest import DEFAULT_INDEX_PATH, class_samples
+from src.metrics import StageMetrics, TraceCapture
+from src.preprocessing import load_batch, load_image
+from src.tensor_cache import file_key, open_cache
+from src.thumbnails import index_file, open_gallery
 
 # Set page configuration
 st.set_page_config(
@@ -22,41 +48,173 @@ def get_base64_of_bin_file(bin_file):
         return base64.b64encode(data).decode()
     return ""
 
-# Define classes as per model indices
-CLASS_NAMES = [
-    'Black Sea Sprat', 
-    'Gilt Head Bream', 
-    'Hourse Mackerel', 
-    'Red Mullet', 
-    'Red Sea Bream', 
-    'Sea Bass', 
-    'Shrimp', 
-    'Striped Red Mullet', 
-    'Trout'
-]
+def find_models_dir():
+    return "models" if os.path.isdir("models") else "../models"
+
+def find_model_path():
+    return os.path.join(find_models_dir(), "BEST_FISH_MODEL.keras")
+
+def load_accuracy_table(path=os.path.join("reports", "model_comparison_table.csv")):
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        rows = [r for r in csv.DictReader(f) if r.get("Test Accuracy")]
+    for r in rows:
+        r["Test Accuracy"] = float(r["Test Accuracy"])
+    return rows
+
+def pick_deployed_benchmark(results):
+    # Headline latency: the deployed Keras model at its fastest thread count
+    deployed = [r for r in results if os.path.basename(r["path"]) == "BEST_FISH_MODEL.keras"] or results
+    return min(deployed, key=lambda r: r["p50_ms"]) if deployed else None
+
+logger = logging.getLogger("fish_app")
+
+@st.cache_resource
+def startup_timings():
+    # Process-wide startup numbers, shown on the performance page
+    return {"boot": time.perf_counter()}
+
+def _load_and_warm_up(model_path, timings):
+    start = time.perf_counter()
+    if model_path.endswith(".keras"):
+        import tensorflow  # timed on its own so the import cost is visible
+        timings.setdefault("tf_import_s", time.perf_counter() - start)
+    model = load_backend(model_path)
+    timings.setdefault("model_ready_s", time.perf_counter() - start)
+
+    # One dummy prediction so graph tracing doesn't land on the first real request
+    start = time.perf_counter()
+    h, w = model.input_size
+    model.predict_on_batch(np.zeros((1, h, w, 3), dtype=np.uint8))
+    timings.setdefault("warmup_predict_ms", (time.perf_counter() - start) * 1000)
+    logger.info("Model %s ready: %s", model_path, timings)
+    return model
+
+@st.cache_resource
+def model_registry():
+    # Every model in models/, loaded on demand and evicted (LRU) past FISH_MODEL_MEMORY_MB
+    return ModelRegistry(find_models_dir(), loader=lambda path: _load_and_warm_up(path, startup_timings()))
 
 # Load Model
 @st.cache_resource
-def load_fish_model():
-    model_path = os.path.join("models", "BEST_FISH_MODEL.keras")
-    if not os.path.exists(model_path):
-        model_path = "../models/BEST_FISH_MODEL.keras"
-    
+def model_loader(model_path):
+    # Starts loading in a background thread; pages that never classify don't wait for it.
+    # The future holds no reference to the model, so the registry can still evict it.
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-warmup")
+    return executor.submit(lambda: model_registry().get(model_path) and None)
+
+def load_fish_model(model_name=None):
     try:
-        model = tf.keras.models.load_model(model_path)
-        return model
+        return model_registry().get(model_name or find_model_path())
     except Exception as e:
         st.error(f"Error loading model: {e}")
         return None
 
-def preprocess_image(image):
-    if image.mode != "RGB":
-        image = image.convert("RGB")
-    image = image.resize((224, 224))
-    img_array = np.array(image)
-    img_array = img_array.astype('float32') / 255.0
-    img_array = np.expand_dims(img_array, axis=0)
-    return img_array
+def ensemble_candidates(model_name):
+    # Every other Keras model; TFLite copies and the promoted best model repeat weights already there
+    registry = model_registry()
+    return [name for name in registry.names() if registry.info(name).path.endswith(".keras")
+            and name != model_name and not name.startswith(DEFAULT_MODEL)]
+
+def ensemble_footprint(model_path, names):
+    # MB the cascade keeps referenced: the selected model plus every ensemble member
+    registry = model_registry()
+    return registry.info(model_path).size_mb + sum(registry.info(name).size_mb for name in names)
+
+def fitting_candidates(model_path, candidates):
+    # The candidates, in order, that fit in the registry's budget next to the selected model.
+    # Past the budget every click would evict members the cascade still holds and reload them.
+    budget, fitting = model_registry().memory_mb, []
+    for name in candidates:
+        if ensemble_footprint(model_path, fitting + [name]) <= budget:
+            fitting.append(name)
+    return fitting
+
+@st.cache_resource
+def prediction_cache():
+    # Set FISH_PREDICTION_DB to a file path to keep predictions across restarts
+    return PredictionCache(max_entries=4096, db_path=os.environ.get("FISH_PREDICTION_DB"))
+
+@st.cache_resource
+def _embedding_index(model_path, built_at, model_key):
+    return open_index(model_path)
+
+def embedding_index(model_path):
+    # None until python -m src.embeddings has built it for the current model file;
+    # reopened after each rebuild or retrain. TFLite variants share their Keras model's index.
+    keras_path = source_model(model_path)
+    index_file = os.path.join(index_path(keras_path), "index.json") if keras_path else None
+    if not index_file or not os.path.exists(index_file):
+        return None
+    return _embedding_index(keras_path, os.path.getmtime(index_file), tuple(file_key(keras_path)))
+
+def find_similar(index, images, k=5):
+    # Embeds uint8 images with the index's Keras model; returns (neighbours per image, ms)
+    embedder = get_embedder(model_registry().get(index.model_path))
+    start = time.perf_counter()
+    batch = np.stack([load_image(io.BytesIO(data), embedder.input_size) for data in images])
+    neighbours = index.search(embedder.embed(batch), k)
+    return neighbours, (time.perf_counter() - start) * 1000
+
+@st.cache_resource
+def _gallery(split_dir, built_at):
+    return open_gallery(split_dir)
+
+def gallery_index(split_dir):
+    # Thumbnails + per-class index from python -m src.thumbnails, reopened after a rebuild; None if not built
+    path = index_file(split_dir)
+    return _gallery(split_dir, os.path.getmtime(path)) if os.path.exists(path) else None
+
+def reference_image(path, split):
+    # Small thumbnail of a dataset image when the gallery has one, else the original file
+    gallery = gallery_index(os.path.join("data", split))
+    return (gallery and gallery.thumbnail(path)) or path
+
+@st.cache_resource
+def stage_metrics():
+    # Per-stage latency histograms for this server process, shown on the performance page
+    return StageMetrics()
+
+@st.cache_resource
+def trace_capture():
+    # FISH_PROFILE_REQUESTS=N captures a TensorFlow profiler trace of the next N classifications
+    return TraceCapture(os.environ.get("FISH_PROFILE_DIR", os.path.join("reports", "traces")),
+                        int(os.environ.get("FISH_PROFILE_REQUESTS", 0)))
+
+def export_metrics():
+    # FISH_METRICS_FILE (.prom for a node_exporter textfile collector, else JSON) is rewritten after each request
+    path = os.environ.get("FISH_METRICS_FILE")
+    if path:
+        stage_metrics().write(path)
+
+@st.cache_resource
+def _drift_monitor(model_path, num_classes, key):
+    threshold = float(os.environ.get("FISH_DRIFT_THRESHOLD", DRIFT_THRESHOLD))
+    return open_monitor(model_path, num_classes, threshold,
+                        on_drift=lambda report: logger.warning("Prediction drift on %s: %s", model_path, report["psi"]))
+
+@st.cache_resource
+def drift_monitors():
+    # {model path: monitor} of every model that served predictions, for the performance page.
+    # Shared by every session, hence the lock.
+    return {}, threading.Lock()
+
+def drift_monitor(model_path, class_names):
+    # Compares served predictions with the val baseline from python -m src.drift;
+    # starts over after the baseline is rebuilt or the model retrained
+    monitor = _drift_monitor(model_path, len(class_names), monitor_key(model_path))
+    monitors, lock = drift_monitors()
+    with lock:
+        monitors[model_path] = monitor
+    return monitor
+
+def record_prediction_time(start):
+    timings = startup_timings()
+    if "first_prediction_ms" not in timings:
+        timings["first_prediction_ms"] = (time.perf_counter() - start) * 1000
+        timings["boot_to_first_prediction_s"] = time.perf_counter() - timings["boot"]
+        logger.info("First prediction took %.0f ms", timings["first_prediction_ms"])
 
 # --- UI STYLING ---
 # Using a high-quality aquatic background image URL for the "Real Website" look
@@ -269,6 +427,10 @@ section[data-testid="stSidebar"] [data-testid="stVerticalBlock"] button {{
 """
 st.markdown(page_bg_img, unsafe_allow_html=True)
 
+# Kick off TF import, model load and warm-up without blocking this render
+startup_timings()
+model_loader(find_model_path())
+
 # Sidebar UI
 st.sidebar.markdown(f"""
 <div style='
@@ -395,23 +557,101 @@ if st.session_state.page == "home":
 
 elif st.session_state.page == "run_model":
     st.markdown("<div class='content-card'><h3>🚀 Fish Specie Classifier</h3>", unsafe_allow_html=True)
-    model = load_fish_model()
+    registry = model_registry()
+    names = registry.names()
+    if names:
+        # Any saved model (Keras or TFLite) by name; switching doesn't need a redeploy
+        default = names.index(DEFAULT_MODEL) if DEFAULT_MODEL in names else 0
+        model_name = st.selectbox("Model", names, index=default) if len(names) > 1 else names[0]
+        info = registry.info(model_name)
+        model_path, class_names = info.path, info.class_names
+        resident = registry.stats()["resident"]
+        st.caption(f"Version {info.version} · {info.size_mb:.0f} MB · "
+                   f"{len(resident)} of {len(names)} models in memory")
+    else:
+        model_name, model_path, class_names = None, find_model_path(), CLASS_NAMES
+    if not model_loader(model_path).done():
+        st.caption("⏳ Model is warming up in the background...")
+
+    # Cascade: the selected model answers first, the ensemble + TTA only sees uncertain images
+    candidates = ensemble_candidates(model_name) if names else []
+    use_ensemble = bool(candidates) and st.toggle("Ensemble + test-time augmentation for uncertain images")
+    if use_ensemble:
+        col_models, col_views, col_threshold = st.columns([2, 1, 1])
+        ensemble_names = col_models.multiselect("Ensemble models", candidates,
+                                                default=fitting_candidates(model_path, candidates))
+        views = col_views.multiselect("TTA views", ["identity", "flip", "crop", "flip_crop"],
+                                      default=["identity", "flip"]) or ["identity"]
+        threshold = col_threshold.slider("Escalate below confidence", 0.5, 0.99, 0.8, 0.01)
+        needed_mb = ensemble_footprint(model_path, ensemble_names)
+        if needed_mb > registry.memory_mb:
+            st.warning(f"These models need {needed_mb:.0f} MB, more than the {registry.memory_mb:.0f} MB model "
+                       "budget (FISH_MODEL_MEMORY_MB). The ensemble stays off until fewer are selected.")
+            use_ensemble = False
+    if use_ensemble:
+        model_id = engine_key(model_path, [registry.info(n).path for n in ensemble_names], views, threshold)
+    else:
+        model_id = engine_key(model_path)
+    metrics_label = f"{model_name or 'Best model'}{' + ensemble' if use_ensemble else ''}"
+    metrics = stage_metrics()
+
+    def load_engine():
+        model = load_fish_model(model_path)
+        if model is None or not use_ensemble:
+            return model
+        members = [load_fish_model(name) for name in ensemble_names]
+        if None in members:
+            return None
+        return Cascade(model, Ensemble([model] + members, views), threshold)
+
+    def observe_drift(*args):
+        # The val baseline describes the selected model alone; ensemble answers would read as drift
+        if not use_ensemble:
+            drift_monitor(model_path, class_names).observe(*args)
     
     col_up, col_pred = st.columns([1, 1])
     
     with col_up:
-        uploaded_file = st.file_uploader("Upload a fish image...", type=["jpg", "png", "jpeg"])
-        if uploaded_file:
-            img = Image.open(uploaded_file)
+        uploaded_files = st.file_uploader(
+            "Upload fish images or a zip archive...", type=["jpg", "png", "jpeg", "zip"],
+            accept_multiple_files=True,
+        )
+        uploads = open_uploads(uploaded_files or [])
+        img, img_error = None, None
+        if len(uploads) == 1:
+            # A corrupt upload (or a zip holding one) gets an error, like the batch rows, not a traceback
+            try:
+                img = Image.open(uploads[0][1])
+                img.load()
+            except Exception as e:
+                img_error = str(e)
+        if img_error is not None:
+            st.error(f"Unreadable image {uploads[0][0]}: {img_error}")
+        elif len(uploads) == 1:
             st.image(img, caption="Target Image", width="stretch")
             
             if st.button("Execute AI Analysis"):
-                if model:
+                click_start = time.perf_counter()
+                cache = prediction_cache()
+                key = image_key(uploads[0][1].getvalue(), model_id)
+                preds = cache.get(key)
+                model = load_engine() if preds is None else None
+                if preds is not None or model:
                     with st.spinner("Processing neural pathways..."):
-                        processed = preprocess_image(img)
-                        preds = model.predict(processed)[0]
+                        if preds is None:
+                            timings = {}
+                            processed = load_image(io.BytesIO(uploads[0][1].getvalue()), model.input_size, timings)
+                            metrics.observe_many(timings, metrics_label)
+                            with trace_capture().step(), metrics.timer("model", metrics_label):
+                                preds = model.predict(processed[None])[0]
+                            cache.put(key, preds)
+                            record_prediction_time(click_start)
+                            observe_drift(preds[None], processed[None], [img.size])
+                        else:
+                            observe_drift(preds[None])
+                        post_start = time.perf_counter()
                         idx = np.argmax(preds)
-                        label = CLASS_NAMES[idx]
+                        label = class_names[idx]
                         conf = preds[idx] * 100
                         
                         with col_pred:
@@ -424,7 +664,7 @@ elif st.session_state.page == "run_model":
                             
                             # Prob chart
                             fig = go.Figure(go.Bar(
-                                x=preds*100, y=CLASS_NAMES, orientation='h',
+                                x=preds*100, y=class_names, orientation='h',
                                 marker=dict(color=preds, colorscale='Blues')
                             ))
                             fig.update_layout(
@@ -437,8 +677,111 @@ elif st.session_state.page == "run_model":
                                 xaxis=dict(tickfont=dict(color='#1d1f02'))
                             )
                             st.plotly_chart(fig, width="stretch")
+                        metrics.observe("postprocess", time.perf_counter() - post_start, metrics_label)
+                        export_metrics()
+
+                        # Visual evidence: the closest labelled train/val images in the model's feature space
+                        index = embedding_index(model_path)
+                        with col_pred:
+                            if index is not None:
+                                neighbours, search_ms = find_similar(index, [uploads[0][1].getvalue()])
+                                st.markdown("**Most similar reference images**")
+                                for col, n in zip(st.columns(len(neighbours[0]) or 1), neighbours[0]):
+                                    image_path = reference_image(n.path, n.split)
+                                    if os.path.exists(image_path):
+                                        col.image(image_path, caption=f"{n.class_name} · {n.similarity:.2f}", width="stretch")
+                                st.caption(f"{len(index)} reference images searched in {search_ms:.0f} ms")
+                            else:
+                                st.caption("Run `python -m src.embeddings` to show similar reference images here.")
                 else:
                     st.error("Model unavailable.")
+        elif len(uploads) > 1:
+            st.markdown(f"**{len(uploads)} images queued for batch analysis**")
+            index = embedding_index(model_path)
+            show_nearest = index is not None and st.checkbox("Add the nearest reference image for each upload")
+            run_batch = st.button("Execute Batch Analysis")
+
+    # Batch mode: cached images are answered directly, the rest goes through
+    # parallel preprocessing and chunked predict calls
+    if len(uploads) > 1 and run_batch:
+        click_start = time.perf_counter()
+        cache = prediction_cache()
+        keys = [image_key(f.getvalue(), model_id) for _, f in uploads]
+        known, todo = split_cached(cache, keys)
+        prep_ms, model_ms, failed = {}, {}, {}
+        model = load_engine() if todo else None
+        if todo and model:
+            with st.spinner(f"Classifying {len(todo)} images ({len(uploads) - len(todo)} cached)..."):
+                batch, prep_times, errors = load_batch([uploads[i][1] for i in todo], model.input_size,
+                                                       metrics=metrics, model=metrics_label)
+                # Unreadable uploads become error rows instead of failing the whole batch
+                failed = {keys[i]: error for i, error in zip(todo, errors) if error is not None}
+                ok = [j for j, error in enumerate(errors) if error is None]
+                todo, batch, prep_times = [todo[j] for j in ok], batch[ok], [prep_times[j] for j in ok]
+                new_probs, model_times = np.empty((0, len(class_names)), dtype=np.float32), []
+                if todo:
+                    with trace_capture().step():
+                        new_probs, model_times = predict_in_chunks(model, batch)
+                for ms in model_times:
+                    metrics.observe("model", ms / 1000, metrics_label)
+                record_prediction_time(click_start)
+            cache.put_many([(keys[i], p) for i, p in zip(todo, new_probs)])
+            # Image sizes come from the headers only; cached answers below add just their predictions
+            sizes = [Image.open(io.BytesIO(uploads[i][1].getvalue())).size for i in todo]
+            if todo:
+                observe_drift(new_probs, batch, sizes)
+            for j, i in enumerate(todo):
+                known[keys[i]] = new_probs[j]
+                prep_ms[i], model_ms[i] = prep_times[j], model_times[j]
+
+        if not todo or model:
+            hits = [known[key] for i, key in enumerate(keys) if i not in model_ms and key not in failed]
+            if hits:
+                observe_drift(np.stack(hits))
+            readable = [i for i, key in enumerate(keys) if key not in failed]
+            nearest = [None] * len(uploads)
+            if show_nearest and readable:
+                neighbours, _ = find_similar(index, [uploads[i][1].getvalue() for i in readable], k=1)
+                for i, n in zip(readable, neighbours):
+                    nearest[i] = n[0]
+
+            post_start = time.perf_counter()
+            if readable:
+                top_idx, top_prob = top_k(np.stack([known[keys[i]] for i in readable]), k=3)
+            row_of = {i: j for j, i in enumerate(readable)}
+
+            rows = []
+            for i, (name, _) in enumerate(uploads):
+                if keys[i] in failed:
+                    rows.append({"Image": name, "Prediction": "Unreadable image", "Error": failed[keys[i]]})
+                    continue
+                j = row_of[i]
+                rows.append({
+                    "Image": name,
+                    "Prediction": class_names[top_idx[j, 0]],
+                    "Confidence (%)": round(float(top_prob[j, 0]) * 100, 2),
+                    "Top-3": ", ".join(
+                        f"{class_names[c]} ({p * 100:.1f}%)" for c, p in zip(top_idx[j], top_prob[j])
+                    ),
+                    "Cached": i not in model_ms,
+                    "Preprocess (ms)": round(prep_ms.get(i, 0.0), 1),
+                    "Model (ms)": round(model_ms.get(i, 0.0), 1),
+                    **({"Nearest reference": f"{nearest[i].class_name} ({nearest[i].similarity:.2f}) {nearest[i].path}"}
+                       if nearest[i] else {}),
+                })
+            st.dataframe(rows, width="stretch", hide_index=True)
+            post_s = (time.perf_counter() - post_start) / len(uploads)
+            for _ in uploads:
+                metrics.observe("postprocess", post_s, metrics_label)
+            export_metrics()
+            st.caption(f"Total model time: {sum(model_ms.values()):.0f} ms for {len(model_ms)} images, "
+                       f"{len(readable) - len(model_ms)} answered from cache")
+            if failed:
+                st.warning(f"{len(uploads) - len(readable)} files could not be read as images")
+            if isinstance(model, Cascade):
+                st.caption(f"{model.escalated} of {model.images} images were uncertain and went to the ensemble")
+        else:
+            st.error("Model unavailable.")
     st.markdown("</div>", unsafe_allow_html=True)
 
 elif st.session_state.page == "about":
@@ -504,7 +847,21 @@ elif st.session_state.page == "contact":
 
 elif st.session_state.page == "stats":
     st.markdown("<div class='content-card'><h3>📊 Model Performance Metrics</h3>", unsafe_allow_html=True)
-    
+
+    # Numbers come from reports/ (model comparison table and python -m src.benchmark)
+    accuracy_rows = load_accuracy_table()
+    best_row = max(accuracy_rows, key=lambda r: r["Test Accuracy"]) if accuracy_rows else None
+    accuracy_text = f"{best_row['Test Accuracy'] * 100:.1f}%" if best_row else "n/a"
+    accuracy_note = f"best: {best_row['Model Name']}" if best_row else "not measured yet"
+
+    benchmark = load_report()
+    latency_row = pick_deployed_benchmark(benchmark["results"]) if benchmark else None
+    latency_text = f"{latency_row['p50_ms']:.0f}ms" if latency_row else "n/a"
+    latency_note = (
+        f"p95 {latency_row['p95_ms']:.0f}ms · {latency_row['backend']}, {latency_row['threads']} threads"
+        if latency_row else "run python -m src.benchmark"
+    )
+
     col_m1, col_m2 = st.columns(2)
     
     with col_m1:
@@ -519,9 +876,9 @@ elif st.session_state.page == "stats":
                 margin-bottom: 20px;
             '>
                 <p style='color: rgba(255, 255, 255, 0.8); margin: 0; font-size: 16px; font-weight: 600; text-transform: uppercase;'>Overall Accuracy</p>
-                <h1 style='color: white; margin: 10px 0; font-size: 54px; font-weight: 900; filter: drop-shadow(0 2px 10px rgba(0,0,0,0.2));'>94.2%</h1>
+                <h1 style='color: white; margin: 10px 0; font-size: 54px; font-weight: 900; filter: drop-shadow(0 2px 10px rgba(0,0,0,0.2));'>{accuracy_text}</h1>
                 <div style='background: rgba(255, 255, 255, 0.2); display: inline-block; padding: 5px 15px; border-radius: 50px;'>
-                    <span style='color: #00ff87; font-weight: 800;'>↑ +1.2%</span> <span style='color: white; font-size: 12px;'>vs last week</span>
+                    <span style='color: white; font-size: 12px;'>{accuracy_note}</span>
                 </div>
             </div>
         """, unsafe_allow_html=True)
@@ -538,22 +895,120 @@ elif st.session_state.page == "stats":
                 margin-bottom: 20px;
             '>
                 <p style='color: rgba(255, 255, 255, 0.8); margin: 0; font-size: 16px; font-weight: 600; text-transform: uppercase;'>Inference Time</p>
-                <h1 style='color: white; margin: 10px 0; font-size: 54px; font-weight: 900; filter: drop-shadow(0 2px 10px rgba(0,0,0,0.2));'>42ms</h1>
+                <h1 style='color: white; margin: 10px 0; font-size: 54px; font-weight: 900; filter: drop-shadow(0 2px 10px rgba(0,0,0,0.2));'>{latency_text}</h1>
                 <div style='background: rgba(255, 255, 255, 0.2); display: inline-block; padding: 5px 15px; border-radius: 50px;'>
-                    <span style='color: #00ff87; font-weight: 800;'>↓ -5ms</span> <span style='color: white; font-size: 12px;'>optimized</span>
+                    <span style='color: white; font-size: 12px;'>{latency_note}</span>
                 </div>
             </div>
         """, unsafe_allow_html=True)
 
     st.markdown("<p style='font-weight: 700; color: #1d1f02; margin-bottom: 5px;'>Model Training Maturity</p>", unsafe_allow_html=True)
-    st.progress(94)
+    st.progress(int(best_row["Test Accuracy"] * 100) if best_row else 0)
+
+    if benchmark:
+        st.markdown(f"<p style='font-weight: 700; color: #1d1f02; margin: 15px 0 5px 0;'>Inference Benchmark ({benchmark['created']}, {benchmark['cpu_count']} CPUs)</p>", unsafe_allow_html=True)
+        st.dataframe([{
+            "Model": r["model"],
+            "Backend": r["backend"],
+            "Threads": r["threads"],
+            "Size (MB)": round(r["size_mb"], 1),
+            "Load (s)": round(r["load_s"], 2),
+            "p50 (ms)": round(r["p50_ms"], 1),
+            "p95 (ms)": round(r["p95_ms"], 1),
+            "p99 (ms)": round(r["p99_ms"], 1),
+            **{f"img/s @ batch {b}": round(v, 1) for b, v in r["throughput_img_s"].items()},
+        } for r in benchmark["results"]], width="stretch", hide_index=True)
+
+    timings = startup_timings()
+    startup_rows = [
+        ("TensorFlow import", timings.get("tf_import_s"), "s"),
+        ("Model load (incl. import)", timings.get("model_ready_s"), "s"),
+        ("Warm-up prediction", timings.get("warmup_predict_ms"), "ms"),
+        ("First page render", st.session_state.get("first_render_ms"), "ms"),
+        ("First real prediction", timings.get("first_prediction_ms"), "ms"),
+        ("Boot to first prediction", timings.get("boot_to_first_prediction_s"), "s"),
+    ]
+    st.markdown("<p style='font-weight: 700; color: #1d1f02; margin: 15px 0 5px 0;'>Startup Timings (this server process)</p>", unsafe_allow_html=True)
+    st.dataframe([
+        {"Stage": name, "Time": f"{value:.2f} {unit}" if value is not None else "pending"}
+        for name, value, unit in startup_rows
+    ], width="stretch", hide_index=True)
+
+    stage_report = stage_metrics().to_json()
+    if stage_report:
+        st.markdown("<p style='font-weight: 700; color: #1d1f02; margin: 15px 0 5px 0;'>Request Stages (this server process)</p>", unsafe_allow_html=True)
+        st.dataframe([{
+            "Model": model, "Stage": stage, "Count": s["count"], "Mean (ms)": round(s["mean_ms"], 1),
+            "p50 (ms)": round(s["p50_ms"], 1), "p95 (ms)": round(s["p95_ms"], 1), "p99 (ms)": round(s["p99_ms"], 1),
+        } for model, stages in stage_report.items() for stage, s in stages.items()], width="stretch", hide_index=True)
+        st.caption("Cached answers skip decode, preprocess and model; queue_wait only exists in the HTTP server and test_model.py.")
+
+    drift_rows = []
+    monitors, lock = drift_monitors()
+    with lock:
+        monitors = dict(monitors)
+    for path, monitor in monitors.items():
+        report = monitor.report()
+        drift_rows.append({
+            "Model": os.path.basename(path), "Predictions": report["total"], "Recent": report["samples"],
+            **{f"PSI {stat}": round(value, 3) for stat, value in report["psi"].items()},
+            "Drift": ", ".join(report["drifted"]) or ("no" if report["psi"] else "n/a"),
+        })
+        if report["drift"]:
+            st.warning(f"{os.path.basename(path)}: recent predictions drifted from the val split "
+                       f"({', '.join(report['drifted'])}, PSI > {report['threshold']})")
+    if drift_rows:
+        st.markdown("<p style='font-weight: 700; color: #1d1f02; margin: 15px 0 5px 0;'>Prediction Drift vs Val Split (this server process)</p>", unsafe_allow_html=True)
+        st.dataframe(drift_rows, width="stretch", hide_index=True)
+        st.caption("Population stability index of the latest predictions against the val baseline "
+                   "(python -m src.drift); n/a until the baseline exists and enough predictions came in.")
     st.markdown("</div>", unsafe_allow_html=True)
 
 elif st.session_state.page == "gallery":
     st.markdown("<div class='content-card'><h3>📸 Sample Dataset Gallery</h3>", unsafe_allow_html=True)
     # Show some images from the data/val folder
     val_path = "data/val"
-    if os.path.exists(val_path):
+    gallery = gallery_index(val_path)
+    # Without thumbnails: the pre-resized tensor cache, then the manifest index, then a folder scan
+    cached = open_cache(val_path, (224, 224)) if gallery is None and os.path.exists(val_path) else None
+    samples = (class_samples(DEFAULT_INDEX_PATH, val_path)
+               if gallery is None and cached is None and os.path.exists(DEFAULT_INDEX_PATH) else {})
+    if gallery is not None and gallery.count():
+        col_class, col_mode = st.columns([2, 1])
+        class_choice = col_class.selectbox("Species", ["All species"] + gallery.class_names())
+        class_name = None if class_choice == "All species" else class_choice
+        mode = col_mode.radio("Show", ["Random", "Browse"], horizontal=True)
+        per_page = 12
+        if mode == "Random":
+            shuffle = st.button("🔀 Shuffle")
+            if shuffle or "gallery_seed" not in st.session_state:
+                st.session_state.gallery_seed = random.randrange(1 << 30)
+            items = gallery.sample(per_page, class_name, seed=st.session_state.gallery_seed)
+        else:
+            pages = max(1, -(-gallery.count(class_name) // per_page))
+            page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1)
+            items = gallery.page(class_name, page - 1, per_page)
+        cols = st.columns(4)
+        for i, (thumb, _, name) in enumerate(items):
+            with cols[i % 4]:
+                st.image(thumb, caption=name, width="stretch")
+        st.caption(f"{gallery.count(class_name)} images · {gallery.size}px thumbnails from python -m src.thumbnails")
+    elif cached is not None and len(cached.labels):
+        class_dirs = {idx: name for name, idx in cached.class_indices.items()}
+        classes, first_rows = np.unique(cached.labels, return_index=True)
+        cols = st.columns(4)
+        for i in range(8):
+            j = i % len(classes)
+            with cols[i % 4]:
+                st.image(np.asarray(cached.images[first_rows[j]]), caption=class_dirs[int(classes[j])])
+    elif samples:
+        names = list(samples)
+        cols = st.columns(4)
+        for i in range(8):
+            name = names[i % len(names)]
+            with cols[i % 4]:
+                st.image(samples[name][0], caption=name)
+    elif os.path.exists(val_path):
         subdirs = [os.path.join(val_path, d) for d in os.listdir(val_path) if os.path.isdir(os.path.join(val_path, d))]
         if subdirs:
             cols = st.columns(4)
@@ -564,3 +1019,8 @@ elif st.session_state.page == "gallery":
                     with cols[i % 4]:
                         st.image(os.path.join(random_dir, imgs[0]), caption=os.path.basename(random_dir))
     st.markdown("</div>", unsafe_allow_html=True)
+
+# Startup instrumentation: how long this session's first full render took
+if "first_render_ms" not in st.session_state:
+    st.session_state.first_render_ms = (time.perf_counter() - _script_start) * 1000
+    logger.info("First render took %.0f ms", st.session_state.first_render_ms)
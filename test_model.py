@@ -1,58 +1,283 @@
-import tensorflow as tf
+import argparse
+import csv
+import io
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
+
 from PIL import Image
-import os
 
-# Load the model
-model_path = os.path.join("models", "BEST_FISH_MODEL.keras")
-model = tf.keras.models.load_model(model_path)
-
-CLASS_NAMES = [
-    'Black Sea Sprat', 
-    'Gilt Head Bream', 
-    'Hourse Mackerel', 
-    'Red Mullet', 
-    'Red Sea Bream', 
-    'Sea Bass', 
-    'Shrimp', 
-    'Striped Red Mullet', 
-    'Trout'
-]
-
-def preprocess_image(image_path):
-    image = Image.open(image_path)
-    if image.mode != "RGB":
-        image = image.convert("RGB")
-    image = image.resize((224, 224))
-    img_array = np.array(image)
-    img_array = img_array.astype('float32') / 255.0
-    img_array = np.expand_dims(img_array, axis=0)
-    return img_array
-
-# Test images
-test_images = {
-    "Trout": r"data\val\fish sea_food trout\ZZ4Q8GVER4BY.jpg",
-    "Shrimp": r"data\val\fish sea_food shrimp\09RYR968IP1O.jpg" # Guessing filename or find one
-}
-
-# Since I don't know the exact shrimp filename, I'll find one first
-shrimp_dir = r"data\val\fish sea_food shrimp"
-shrimp_files = [f for f in os.listdir(shrimp_dir) if f.endswith('.jpg')]
-if shrimp_files:
-    test_images["Shrimp"] = os.path.join(shrimp_dir, shrimp_files[0])
-
-for name, path in test_images.items():
-    if os.path.exists(path):
-        print(f"\nTesting {name} image: {path}")
-        processed_img = preprocess_image(path)
-        predictions = model.predict(processed_img)[0]
-        max_index = np.argmax(predictions)
-        result_class = CLASS_NAMES[max_index]
-        confidence = predictions[max_index] * 100
-        
-        print(f"Prediction: {result_class} ({confidence:.2f}%)")
-        print("Raw Probabilities:")
-        for idx, prob in enumerate(predictions):
-            print(f"  {CLASS_NAMES[idx]}: {prob:.4f}")
-    else:
-        print(f"File not found: {path}")
+from src.backends import BACKENDS
+from src.drift import DRIFT_THRESHOLD, open_monitor, print_report
+from src.ensemble import TTA_VIEWS, build_engine, engine_identity
+from src.inference import IMAGE_EXTENSIONS, top_k
+from src.metrics import StageMetrics, TraceCapture
+from src.prediction_cache import PredictionCache, image_key
+from src.preprocessing import IMAGE_SIZE, load_image
+from src.registry import DEFAULT_MODEL, DEFAULT_MODELS_DIR, describe, resolve
+
+def collect_images(inputs):
+    # Directories are walked recursively, .txt files are read as one path per line
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                dirs.sort()
+                for fname in sorted(files):
+                    if fname.lower().endswith(IMAGE_EXTENSIONS):
+                        paths.append(os.path.join(root, fname))
+        elif item.lower().endswith(".txt"):
+            with open(item, "r", encoding="utf-8") as f:
+                paths.extend(line.strip() for line in f if line.strip())
+        else:
+            paths.append(item)
+    return paths
+
+def drop_partial_line(output_path, chunk_size=1 << 16):
+    # A crash can leave a half-written last row; cut the file back to its last newline so
+    # the row isn't counted as done and the next append starts on a fresh line
+    if not os.path.exists(output_path):
+        return
+    with open(output_path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        pos = end
+        while pos > 0:
+            start = max(0, pos - chunk_size)
+            f.seek(start)
+            newline = f.read(pos - start).rfind(b"\n")
+            if newline >= 0:
+                pos = start + newline + 1
+                break
+            pos = start
+        if pos < end:
+            f.truncate(pos)
+
+def load_done(output_path, fmt):
+    # Paths already scored by a previous (possibly crashed) run
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r", encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            for row in csv.DictReader(f):
+                if row.get("path"):
+                    done.add(row["path"])
+        else:
+            for line in f:
+                try:
+                    done.add(json.loads(line)["path"])
+                except (ValueError, KeyError):
+                    continue
+    return done
+
+def produce_batches(paths, batch_size, workers, batches, cache=None, model_id=None, image_size=IMAGE_SIZE,
+                    metrics=None, model_name=""):
+    # Decodes batches on a thread pool; the bounded queue caps how far we run ahead.
+    # Each item is (array, error, cache_key, cached_probs, original_size); cache hits skip decoding.
+    def load(path):
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            key = image_key(data, model_id) if cache is not None else None
+            probs = cache.get(key) if cache is not None else None
+            if probs is not None:
+                return None, None, key, probs, None
+            timings = {}
+            image = Image.open(io.BytesIO(data))
+            array = load_image(image, image_size, timings)
+            if metrics is not None:
+                metrics.observe_many(timings, model_name)
+            return array, None, key, None, image.size
+        except Exception as e:
+            return None, str(e), None, None, None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for start in range(0, len(paths), batch_size):
+            chunk = paths[start:start + batch_size]
+            loaded = list(pool.map(load, chunk))
+            # The put time lets the consumer measure how long the batch sat decoded
+            batches.put((chunk, loaded, time.perf_counter()))
+    batches.put(None)
+
+def open_writer(output_path, fmt, k):
+    exists = os.path.exists(output_path) and os.path.getsize(output_path) > 0
+    f = open(output_path, "a", encoding="utf-8", newline="")
+    if fmt == "jsonl":
+        def write(path, classes, probs, error):
+            record = {"path": path, "error": error, "predictions": [
+                {"class": c, "probability": round(p, 6)} for c, p in zip(classes, probs)
+            ]}
+            f.write(json.dumps(record) + "\n")
+        return f, write
+
+    fields = ["path"]
+    for i in range(1, k + 1):
+        fields += [f"top{i}", f"top{i}_prob"]
+    fields.append("error")
+    writer = csv.writer(f)
+    if not exists:
+        writer.writerow(fields)
+
+    def write(path, classes, probs, error):
+        row = [path]
+        for i in range(k):
+            row += [classes[i], f"{probs[i]:.6f}"] if i < len(classes) else ["", ""]
+        row.append(error or "")
+        writer.writerow(row)
+    return f, write
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch-classify fish images into a CSV/JSONL file")
+    parser.add_argument("inputs", nargs="+", help="image directories, image files or .txt file lists")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="model file or name (python -m src.registry)")
+    parser.add_argument("--models-dir", default=DEFAULT_MODELS_DIR, help="where model names are looked up")
+    parser.add_argument("--backend", choices=BACKENDS, default="auto", help="auto picks TFLite for .tflite files")
+    parser.add_argument("--threads", type=int, default=None, help="TFLite interpreter threads")
+    parser.add_argument("--output", default="predictions.csv", help=".csv or .jsonl")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--prefetch", type=int, default=4, help="decoded batches kept ready ahead of the model")
+    parser.add_argument("--cache-db", default=None,
+                        help="SQLite prediction cache shared with the app (FISH_PREDICTION_DB)")
+    parser.add_argument("--no-resume", action="store_true", help="overwrite the output instead of continuing it")
+    parser.add_argument("--ensemble", nargs="+", default=[], metavar="MODEL", help="models averaged with --model")
+    parser.add_argument("--tta", nargs="+", choices=TTA_VIEWS, default=["identity"], help="test-time views")
+    parser.add_argument("--cascade-threshold", type=float, default=None,
+                        help="only run the ensemble/TTA when --model alone is less confident than this")
+    parser.add_argument("--metrics", default=None, metavar="PATH",
+                        help="write per-stage latency histograms (.prom for Prometheus text, else JSON)")
+    parser.add_argument("--profile-batches", type=int, default=0,
+                        help="capture a TensorFlow profiler trace of the first N batches")
+    parser.add_argument("--profile-dir", default="reports/traces", help="where --profile-batches writes the trace")
+    parser.add_argument("--drift-report", default=None, metavar="PATH",
+                        help="write the run's drift report against the val baseline (python -m src.drift) as JSON")
+    parser.add_argument("--drift-threshold", type=float, default=DRIFT_THRESHOLD,
+                        help="PSI above which a statistic counts as drifted")
+    args = parser.parse_args()
+
+    fmt = "jsonl" if args.output.lower().endswith((".jsonl", ".json")) else "csv"
+    if args.no_resume and os.path.exists(args.output):
+        os.remove(args.output)
+
+    paths = collect_images(args.inputs)
+    drop_partial_line(args.output)
+    done = load_done(args.output, fmt)
+    todo = [p for p in paths if p not in done]
+    print(f"{len(paths)} images found, {len(paths) - len(todo)} already scored, {len(todo)} to go")
+    if not todo:
+        return
+
+    try:
+        model_path = resolve(args.model, args.models_dir)
+        ensemble_paths = [resolve(m, args.models_dir) for m in args.ensemble]
+    except ValueError as e:
+        parser.error(str(e))
+    class_names = describe(model_path).class_names
+    model = build_engine(model_path, ensemble_paths, args.tta, args.cascade_threshold, args.backend, args.threads)
+    cache = PredictionCache(db_path=args.cache_db) if args.cache_db else None
+    # Stage times are per image: a batch's model, queue and postprocess time is split over its images
+    metrics = StageMetrics()
+    model_name = describe(model_path).name
+    trace = TraceCapture(args.profile_dir, args.profile_batches)
+    # The whole run is one window: this folder is compared with the val split as a whole. The
+    # baseline describes the single model, so ensemble/TTA/cascade answers aren't checked against it.
+    single_model = not hasattr(model, "identity")
+    monitor = open_monitor(model_path, len(class_names), args.drift_threshold, window=None) if single_model else None
+
+    batches = queue.Queue(maxsize=args.prefetch)
+    producer = threading.Thread(
+        target=produce_batches,
+        args=(todo, args.batch_size, args.workers, batches, cache, engine_identity(model), model.input_size,
+              metrics, model_name),
+        daemon=True,
+    )
+    producer.start()
+
+    f, write = open_writer(args.output, fmt, args.top_k)
+    scored, cached_count, start = 0, 0, time.perf_counter()
+    try:
+        while True:
+            item = batches.get()
+            if item is None:
+                break
+            chunk, loaded, put_at = item
+            waited = time.perf_counter() - put_at
+            probs = [cached for _, _, _, cached, _ in loaded]
+            pending = [i for i, (array, _, _, _, _) in enumerate(loaded) if array is not None]
+            for _ in pending:
+                metrics.observe("queue_wait", waited, model_name)
+            if pending:
+                images = np.stack([loaded[i][0] for i in pending])
+                t0 = time.perf_counter()
+                with trace.step():
+                    predicted = np.asarray(model.predict_on_batch(images))
+                elapsed = time.perf_counter() - t0
+                for _ in pending:
+                    metrics.observe("model", elapsed / len(pending), model_name)
+                for j, i in enumerate(pending):
+                    probs[i] = predicted[j]
+                if cache is not None:
+                    cache.put_many([(loaded[i][2], predicted[j]) for j, i in enumerate(pending)])
+            cached_count += sum(1 for p, (array, _, _, _, _) in zip(probs, loaded) if p is not None and array is None)
+
+            t0 = time.perf_counter()
+            ok = [i for i, p in enumerate(probs) if p is not None]
+            if ok:
+                top_idx, top_prob = top_k(np.stack([probs[i] for i in ok]), args.top_k)
+            results = {i: j for j, i in enumerate(ok)}
+
+            for i, path in enumerate(chunk):
+                if i in results:
+                    j = results[i]
+                    write(path, [class_names[c] for c in top_idx[j]], [float(p) for p in top_prob[j]], None)
+                else:
+                    write(path, [], [], loaded[i][1])
+            # Flush per batch so a crash loses at most the batch in flight
+            f.flush()
+            elapsed = time.perf_counter() - t0
+            for _ in ok:
+                metrics.observe("postprocess", elapsed / len(ok), model_name)
+            # Decoded images add pixel and size statistics, cache hits only their predictions
+            if monitor is not None and pending:
+                monitor.observe(predicted, images, [loaded[i][4] for i in pending])
+            hits = [probs[i] for i in ok if loaded[i][0] is None]
+            if monitor is not None and hits:
+                monitor.observe(np.stack(hits))
+
+            scored += len(chunk)
+            elapsed = time.perf_counter() - start
+            print(f"\r{scored}/{len(todo)} images  {scored / elapsed:.1f} img/s", end="", flush=True)
+    finally:
+        f.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"\nScored {scored} images in {elapsed:.1f}s ({scored / elapsed:.1f} img/s) -> {args.output}")
+    if cache is not None:
+        print(f"{cached_count} images answered from the prediction cache {args.cache_db}")
+    if hasattr(model, "stats"):
+        stats = model.stats()
+        print(f"{stats['escalated']} of {stats['images']} images went to the ensemble "
+              f"({stats['escalation_rate'] * 100:.1f}%)")
+    metrics.print_summary()
+    if args.metrics:
+        metrics.write(args.metrics)
+        print(f"Stage latencies written to {args.metrics}")
+    if monitor is None:
+        print(f"Drift not checked: the val baseline describes {model_name} alone, not the ensemble"
+              + (f", {args.drift_report} not written" if args.drift_report else ""))
+        return
+    report = monitor.report()
+    print_report(report, model_name)
+    if args.drift_report:
+        os.makedirs(os.path.dirname(args.drift_report) or ".", exist_ok=True)
+        with open(args.drift_report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+# Tests import the project as src.*, like python -m src.<tool> run from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def write_image(path, seed, size=(40, 30)):
+    # Random RGB noise: distinct seeds give distinct content (and hashes), the same seed a duplicate
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pixels = np.random.default_rng(seed).integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+    Image.fromarray(pixels).save(path)
+    return path
+
+
+def bump_mtime(path, seconds=1):
+    # Filesystem timestamps can be coarser than a fast test; make a change visible for certain
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + seconds * 10**9))
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # Tools default to cache/ relative to the working directory; keep each test's caches apart
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def split_dir(workdir):
+    # data/val with two classes of two images each
+    root = workdir / "data" / "val"
+    for c, name in enumerate(("Sea Bass", "Trout")):
+        for i in range(2):
+            write_image(str(root / name / f"{i}.png"), seed=10 * c + i)
+    return str(root)
@@ -0,0 +1,109 @@
+import os
+
+import numpy as np
+import pytest
+
+from conftest import bump_mtime, write_image
+
+tf = pytest.importorskip("tensorflow")
+
+from src.backends import load_backend  # noqa: E402
+from src.embeddings import build_index, get_embedder, index_path, open_index  # noqa: E402
+from src.tensor_cache import load_resized  # noqa: E402
+
+SIZE = (16, 16)
+MODEL_PATH = os.path.join("models", "tiny_fish_model.keras")
+
+
+def _save_model(seed):
+    # uint8 input with the rescaling layer, a 4-d embedding layer and a 2-class head
+    tf.keras.utils.set_random_seed(seed)
+    inputs = tf.keras.Input((*SIZE, 3))
+    x = tf.keras.layers.Rescaling(1 / 255)(inputs)
+    x = tf.keras.layers.GlobalAveragePooling2D()(x)
+    x = tf.keras.layers.Dense(4, activation="relu")(x)
+    outputs = tf.keras.layers.Dense(2, activation="softmax")(x)
+    os.makedirs("models", exist_ok=True)
+    tf.keras.Model(inputs, outputs).save(MODEL_PATH)
+    # A later seed always gets a later mtime, however coarse the filesystem's clock
+    bump_mtime(MODEL_PATH, seconds=seed)
+
+
+@pytest.fixture
+def data(workdir):
+    for split, offset in (("train", 0), ("val", 100)):
+        for c, name in enumerate(("Sea Bass", "Trout")):
+            for i in range(2):
+                write_image(str(workdir / "data" / split / name / f"{i}.png"), seed=offset + 10 * c + i)
+    _save_model(seed=1)
+    return str(workdir / "data")
+
+
+def _counting_backend():
+    # A backend whose embedder records how many images it embeds
+    backend = load_backend(MODEL_PATH, "keras")
+    embedder = get_embedder(backend)
+    embedder.rows = 0
+    embed = embedder.embed
+
+    def counting_embed(batch):
+        embedder.rows += len(batch)
+        return embed(batch)
+
+    embedder.embed = counting_embed
+    return backend, embedder
+
+
+def _embeddings_files():
+    folder = index_path(MODEL_PATH)
+    return sorted(name for name in os.listdir(folder) if name.endswith(".npy"))
+
+
+def test_build_then_search(data):
+    index = build_index(MODEL_PATH, data)
+    assert len(index) == 8
+    assert index.vectors.shape == (8, 4)
+    assert np.allclose(np.linalg.norm(np.asarray(index.vectors, dtype=np.float32), axis=1), 1.0, atol=1e-2)
+
+    embedder = get_embedder(load_backend(MODEL_PATH, "keras"))
+    query = embedder.embed(load_resized(index.paths[5], SIZE)[None])
+    np.testing.assert_allclose(index.vectors[5], query[0], atol=1e-2)
+    neighbours = index.search(query, k=3)[0]
+    assert len(neighbours) == 3
+    assert neighbours[0].similarity == pytest.approx(1.0, abs=1e-2)
+    assert [n.similarity for n in neighbours] == sorted((n.similarity for n in neighbours), reverse=True)
+
+
+def test_refresh_embeds_only_new_images(data):
+    backend, embedder = _counting_backend()
+    build_index(MODEL_PATH, data, backend=backend)
+    assert embedder.rows == 8
+
+    embedder.rows = 0
+    write_image(os.path.join(data, "train", "Trout", "2.png"), seed=500)
+    index = build_index(MODEL_PATH, data, backend=backend)
+    assert embedder.rows == 1
+    assert len(index) == 9
+    assert len(_embeddings_files()) == 1
+
+    embedder.rows = 0
+    build_index(MODEL_PATH, data, backend=backend)
+    assert embedder.rows == 0
+
+
+def test_retrained_model_invalidates_and_reembeds(data):
+    build_index(MODEL_PATH, data)
+    old_files = _embeddings_files()
+    assert open_index(MODEL_PATH) is not None
+
+    _save_model(seed=2)
+    # The index was built from the old weights, so it no longer answers for this file
+    assert open_index(MODEL_PATH) is None
+
+    backend, embedder = _counting_backend()
+    index = build_index(MODEL_PATH, data, backend=backend)
+    assert embedder.rows == 8
+    assert len(index) == 8
+    new_files = _embeddings_files()
+    assert len(new_files) == 1 and new_files != old_files
+    assert open_index(MODEL_PATH) is not None
@@ -0,0 +1,99 @@
+import os
+import sqlite3
+
+from conftest import bump_mtime, write_image
+from src.manifest import build_index, class_samples, split_files
+
+
+def _dataset(workdir):
+    # train/Trout/leak.png is byte-identical to val/Trout/0.png
+    data = workdir / "data"
+    for split, offset in (("train", 0), ("val", 100)):
+        for c, name in enumerate(("Sea Bass", "Trout")):
+            for i in range(2):
+                write_image(str(data / split / name / f"{i}.png"), seed=offset + 10 * c + i)
+    write_image(str(data / "train" / "Trout" / "leak.png"), seed=110)
+    return str(data)
+
+
+def _build(data, index_path):
+    build_index(data, ("train", "val"), index_path, workers=2).close()
+
+
+def test_split_files_drops_training_images_leaked_into_val(workdir):
+    data = _dataset(workdir)
+    index_path = str(workdir / "manifest.sqlite")
+    _build(data, index_path)
+
+    train = os.path.join(data, "train")
+    paths, labels, class_indices = split_files(index_path, train)
+    leak = os.path.join(train, "Trout", "leak.png")
+    assert leak not in paths
+    assert len(paths) == 4
+    assert class_indices == {"Sea Bass": 0, "Trout": 1}
+    assert labels == [0, 0, 1, 1]
+
+    paths, _, _ = split_files(index_path, train, drop_leaks=False)
+    assert leak in paths
+    # The val copy is what the model is checked on, so it stays
+    assert len(split_files(index_path, os.path.join(data, "val"))[0]) == 4
+
+
+def test_split_files_is_none_once_the_folder_changes(workdir):
+    data = _dataset(workdir)
+    index_path = str(workdir / "manifest.sqlite")
+    _build(data, index_path)
+    val = os.path.join(data, "val")
+    assert split_files(index_path, val) is not None
+
+    write_image(os.path.join(val, "Trout", "2.png"), seed=777)
+    bump_mtime(os.path.join(val, "Trout"))
+    assert split_files(index_path, val) is None
+    assert class_samples(index_path, val) == {}
+    # Only the changed split is stale
+    assert split_files(index_path, os.path.join(data, "train")) is not None
+
+    _build(data, index_path)
+    paths, _, _ = split_files(index_path, val)
+    assert os.path.join(val, "Trout", "2.png") in paths
+
+    os.remove(os.path.join(val, "Sea Bass", "0.png"))
+    bump_mtime(os.path.join(val, "Sea Bass"))
+    assert split_files(index_path, val) is None
+
+
+def test_split_files_follows_the_callers_spelling_of_the_folder(workdir, monkeypatch):
+    data = _dataset(workdir)
+    index_path = str(workdir / "manifest.sqlite")
+    _build(data, index_path)
+
+    absolute = os.path.join(data, "val")
+    expected = [os.path.join(absolute, "Sea Bass", "0.png"), os.path.join(absolute, "Sea Bass", "1.png")]
+    assert split_files(index_path, absolute)[0][:2] == expected
+
+    # Built from one working directory, read from another with a relative path
+    monkeypatch.chdir(os.path.join(data, "val"))
+    paths, _, _ = split_files(index_path, os.path.join("..", "val"))
+    assert paths[0] == os.path.join("..", "val", "Sea Bass", "0.png")
+    assert all(os.path.exists(path) for path in paths)
+
+
+def test_an_index_from_an_older_version_is_ignored(workdir):
+    data = _dataset(workdir)
+    index_path = str(workdir / "manifest.sqlite")
+    _build(data, index_path)
+    with sqlite3.connect(index_path) as db:
+        db.execute("PRAGMA user_version = 1")
+
+    val = os.path.join(data, "val")
+    assert split_files(index_path, val) is None
+    # Rebuilding starts the index over in the current layout
+    _build(data, index_path)
+    assert len(split_files(index_path, val)[0]) == 4
+
+
+def test_lookups_never_create_an_index(workdir):
+    index_path = str(workdir / "missing.sqlite")
+    assert split_files(index_path, str(workdir)) is None
+    assert class_samples(index_path, str(workdir)) == {}
+    assert not os.path.exists(index_path)
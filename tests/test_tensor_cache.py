@@ -0,0 +1,103 @@
+import json
+import os
+
+import numpy as np
+
+from conftest import bump_mtime, write_image
+from src import tensor_cache
+from src.tensor_cache import build_cache, cache_path, load_resized, open_cache
+
+SIZE = (16, 16)
+
+
+def _index(split_dir):
+    with open(os.path.join(cache_path(split_dir, SIZE), "index.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_build_then_open(split_dir):
+    built = build_cache(split_dir, SIZE)
+    assert built.images.shape == (4, *SIZE, 3)
+    assert list(built.labels) == [0, 0, 1, 1]
+    assert built.class_indices == {"Sea Bass": 0, "Trout": 1}
+
+    opened = open_cache(split_dir, SIZE)
+    assert opened.filepaths == built.filepaths
+    np.testing.assert_array_equal(opened.images, built.images)
+    for row, path in enumerate(opened.filepaths):
+        np.testing.assert_array_equal(opened.images[row], load_resized(path, SIZE))
+
+
+def test_refresh_decodes_only_new_and_modified_images(split_dir, monkeypatch):
+    build_cache(split_dir, SIZE)
+    modified = write_image(os.path.join(split_dir, "Sea Bass", "1.png"), seed=99)
+    bump_mtime(modified)
+    added = write_image(os.path.join(split_dir, "Trout", "2.png"), seed=98)
+    os.remove(os.path.join(split_dir, "Trout", "0.png"))
+
+    decoded = []
+
+    def counting_load(path, image_size):
+        decoded.append(path)
+        return load_resized(path, image_size)
+
+    monkeypatch.setattr(tensor_cache, "load_resized", counting_load)
+    refreshed = build_cache(split_dir, SIZE)
+
+    assert sorted(decoded) == sorted([modified, added])
+    assert len(refreshed.filepaths) == 4
+    assert os.path.join(split_dir, "Trout", "0.png") not in refreshed.filepaths
+    for row, path in enumerate(refreshed.filepaths):
+        np.testing.assert_array_equal(refreshed.images[row], load_resized(path, SIZE))
+
+    # Nothing changed since: no decoding and no new images file
+    decoded.clear()
+    images_file = _index(split_dir)["images"]
+    build_cache(split_dir, SIZE)
+    assert decoded == []
+    assert _index(split_dir)["images"] == images_file
+
+
+def test_rebuild_swaps_in_a_new_images_file(split_dir):
+    first = build_cache(split_dir, SIZE)
+    old_file = _index(split_dir)["images"]
+    old_rows = np.array(first.images)
+
+    write_image(os.path.join(split_dir, "Trout", "2.png"), seed=98)
+    second = build_cache(split_dir, SIZE)
+
+    index = _index(split_dir)
+    folder = cache_path(split_dir, SIZE)
+    assert index["images"] != old_file
+    assert index["rows"] == len(index["entries"]) == len(second.filepaths) == 5
+    assert sorted(name for name in os.listdir(folder) if name.endswith(".npy")) == [index["images"]]
+    # A reader that mapped the old file before the swap still sees its rows
+    np.testing.assert_array_equal(first.images, old_rows)
+
+
+def test_open_rejects_an_index_that_does_not_match_its_images(split_dir):
+    build_cache(split_dir, SIZE)
+    folder = cache_path(split_dir, SIZE)
+    index_file = os.path.join(folder, "index.json")
+    index = _index(split_dir)
+
+    with open(index_file, "w", encoding="utf-8") as f:
+        json.dump(dict(index, rows=index["rows"] + 1), f)
+    assert open_cache(split_dir, SIZE) is None
+
+    with open(index_file, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.remove(os.path.join(folder, index["images"]))
+    assert open_cache(split_dir, SIZE) is None
+    # The next build starts over instead of reusing rows it can't read
+    assert len(build_cache(split_dir, SIZE).filepaths) == 4
+
+
+def test_same_named_splits_get_separate_caches(split_dir, workdir):
+    other = str(workdir / "other" / "val")
+    write_image(os.path.join(other, "Sea Bass", "0.png"), seed=50)
+
+    assert cache_path(split_dir, SIZE) != cache_path(other, SIZE)
+    assert len(build_cache(split_dir, SIZE).filepaths) == 4
+    assert len(build_cache(other, SIZE).filepaths) == 1
+    assert len(open_cache(split_dir, SIZE).filepaths) == 4